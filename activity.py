@@ -0,0 +1,279 @@
+import atexit
+import heapq
+import logging
+import os
+import threading
+import time
+from collections import Counter
+import numpy as np
+
+from models import db, ActivityCount
+
+logger = logging.getLogger(__name__)
+
+# Event kinds and how much each counts towards a movie's popularity
+KINDS = ('view', 'watchlist', 'favorites', 'review')
+WEIGHTS = {'view': 1.0, 'watchlist': 3.0, 'favorites': 5.0, 'review': 4.0}
+
+# Sliding window: counts expire one bucket at a time once they are WINDOW seconds old
+BUCKET_SECONDS = int(os.environ.get('ACTIVITY_BUCKET_SECONDS', 6 * 3600))
+WINDOW = int(os.environ.get('ACTIVITY_WINDOW_SECONDS', 7 * 86400))
+
+# Count-min sketch size per kind and bucket (a power of two); estimates overcount
+# by at most e/width of the window's events with probability 1 - e^-depth
+SKETCH_WIDTH = 1 << (int(os.environ.get('ACTIVITY_SKETCH_WIDTH', 2048)) - 1).bit_length()
+SKETCH_DEPTH = 4
+
+# Movies kept as heavy-hitter candidates for the popular list
+TOP_CANDIDATES = int(os.environ.get('ACTIVITY_TOP_CANDIDATES', 500))
+
+# Seconds between checkpoints, which write this process's new events to the
+# database and read back every process's counts
+CHECKPOINT_SECONDS = int(os.environ.get('ACTIVITY_CHECKPOINT_SECONDS', 60))
+
+# Multiply-shift hash seeds, shared by every process so sketches from checkpoints line up
+_HASH_SEEDS = np.random.default_rng(20240).integers(1, 1 << 63, size=SKETCH_DEPTH, dtype=np.uint64) | np.uint64(1)
+
+
+def sketch_columns(movie_id, width=SKETCH_WIDTH):
+    """Returns the counter each sketch row uses for a movie; `width` must be a power of two."""
+    with np.errstate(over='ignore'):
+        hashed = np.uint64(movie_id) * _HASH_SEEDS
+    return (hashed >> np.uint64(65 - width.bit_length())).astype(np.int64)
+
+
+class ActivityWindow:
+    """Sliding-window activity counts: a ring of per-bucket count-min sketches plus heavy hitters.
+
+    The window's totals are kept as a running sum of the buckets' sketches,
+    so a movie's counts are read with `depth` lookups per kind, and a
+    bucket leaving the window is subtracted in one step. The popular list is
+    a bounded set of candidates ranked by their estimated score, so neither
+    query depends on how many movies or events there are.
+    """
+
+    def __init__(self, bucket_seconds=BUCKET_SECONDS, window=WINDOW, width=SKETCH_WIDTH, candidates=TOP_CANDIDATES):
+        self.bucket_seconds = bucket_seconds
+        self.buckets = max(1, window // bucket_seconds)
+        self.width = width
+        self.capacity = candidates
+        self.ring = np.zeros((self.buckets, len(KINDS), SKETCH_DEPTH, width), dtype=np.int32)
+        self.totals = np.zeros((len(KINDS), SKETCH_DEPTH, width), dtype=np.int64)
+        self.weights = np.array([WEIGHTS[kind] for kind in KINDS])
+        self.current = None
+        self.candidates = {}
+        self._heap = []       # (score, movie ID) of candidates, weakest first; may hold outdated scores
+        self._ranked = None
+
+    def bucket_start(self, now):
+        return int(now // self.bucket_seconds) * self.bucket_seconds
+
+    def advance(self, now):
+        """Expires the buckets that have left the window by `now`."""
+        bucket = int(now // self.bucket_seconds)
+        if self.current is None:
+            self.current = bucket
+            return
+        if bucket <= self.current:
+            return
+        for step in range(self.current + 1, min(bucket, self.current + self.buckets) + 1):
+            slot = step % self.buckets
+            self.totals -= self.ring[slot]
+            self.ring[slot] = 0
+        self.current = bucket
+        # Candidates' scores fall as buckets expire
+        self.rank(self.candidates)
+
+    def add(self, kind, movie_id, count=1, bucket_start=None, offer=True):
+        """Counts `count` events of a kind for a movie in the bucket starting at `bucket_start` (default: current).
+
+        Bulk loads pass `offer=False` and call `rank` once at the end.
+        """
+        bucket = self.current if bucket_start is None else bucket_start // self.bucket_seconds
+        if self.current is None or bucket <= self.current - self.buckets or bucket > self.current:
+            return
+        columns = sketch_columns(movie_id, self.width)
+        rows = np.arange(SKETCH_DEPTH)
+        k = KINDS.index(kind)
+        self.ring[bucket % self.buckets, k, rows, columns] += count
+        self.totals[k, rows, columns] += count
+        if offer:
+            self._offer(movie_id, self._score(columns))
+
+    def _score(self, columns):
+        estimates = self.totals[:, np.arange(SKETCH_DEPTH), columns].min(axis=1)
+        return float(estimates @ self.weights)
+
+    def score(self, movie_id):
+        """Returns a movie's weighted activity score over the window."""
+        return self._score(sketch_columns(movie_id, self.width))
+
+    def counts(self, movie_id):
+        """Returns a movie's estimated event count per kind over the window."""
+        columns = sketch_columns(movie_id, self.width)
+        estimates = self.totals[:, np.arange(SKETCH_DEPTH), columns].min(axis=1)
+        return dict(zip(KINDS, estimates.tolist()))
+
+    def rank(self, movie_ids):
+        """Makes the highest-scoring of `movie_ids` the candidates, scoring each once."""
+        scores = ((self.score(movie_id), movie_id) for movie_id in movie_ids)
+        self._heap = heapq.nlargest(self.capacity, (item for item in scores if item[0] > 0))
+        heapq.heapify(self._heap)
+        self.candidates = {movie_id: score for score, movie_id in self._heap}
+        self._ranked = None
+
+    def _offer(self, movie_id, score):
+        # Heavy hitters: a movie joins the candidates once it outscores the weakest one
+        if movie_id not in self.candidates and len(self.candidates) >= self.capacity:
+            # Heap entries whose score has changed since are skipped
+            while self._heap[0][0] != self.candidates.get(self._heap[0][1]):
+                heapq.heappop(self._heap)
+            weakest, weakest_id = self._heap[0]
+            if score <= weakest:
+                return
+            heapq.heappop(self._heap)
+            del self.candidates[weakest_id]
+        self.candidates[movie_id] = score
+        heapq.heappush(self._heap, (score, movie_id))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(score, movie_id) for movie_id, score in self.candidates.items()]
+            heapq.heapify(self._heap)
+        self._ranked = None
+
+    def top(self, n):
+        """Returns up to `n` (movie ID, score) pairs with the highest scores, best first."""
+        if self._ranked is None:
+            self._ranked = sorted(self.candidates.items(), key=lambda item: -item[1])
+        return self._ranked[:n]
+
+
+class ActivityTracker:
+    """Process-wide activity window fed by request events and merged with other processes through checkpoints.
+
+    Events are counted in memory and queued for the next checkpoint, which
+    adds them to `ActivityCount` and rebuilds the window from the stored
+    counts of every process. Nothing here reads the review or list tables.
+    """
+
+    def __init__(self, checkpoint_seconds=CHECKPOINT_SECONDS):
+        self.checkpoint_seconds = checkpoint_seconds
+        self.window = ActivityWindow()
+        self.app = None
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._checkpoint_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+
+    def record(self, kind, movie_id, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self.window.advance(now)
+            self.window.add(kind, movie_id)
+            self._pending[(self.window.bucket_start(now), kind, movie_id)] += 1
+
+    def popular(self, n=20, now=None):
+        """Returns the IDs of the `n` movies with the most weighted activity in the window."""
+        with self._lock:
+            self.window.advance(time.time() if now is None else now)
+            return [movie_id for movie_id, _ in self.window.top(n)]
+
+    def counts(self, movie_id, now=None):
+        """Returns a movie's estimated views, list additions and reviews over the window."""
+        with self._lock:
+            self.window.advance(time.time() if now is None else now)
+            return self.window.counts(movie_id)
+
+    def checkpoint(self, now=None):
+        """Writes queued events to the database and rebuilds the window from every process's counts."""
+        now = time.time() if now is None else now
+        with self._checkpoint_lock:
+            with self._lock:
+                pending, self._pending = self._pending, Counter()
+            window = self.window
+            oldest = window.bucket_start(now) - (window.buckets - 1) * window.bucket_seconds
+            if pending:
+                try:
+                    ActivityCount.add([key + (count,) for key, count in pending.items()])
+                except Exception:
+                    db.session.rollback()
+                    # Nothing was stored, so keep the events for the next attempt
+                    with self._lock:
+                        self._pending.update(pending)
+                    raise
+            try:
+                ActivityCount.prune(oldest)
+                rebuilt = ActivityWindow(window.bucket_seconds, window.buckets * window.bucket_seconds, window.width, window.capacity)
+                rebuilt.advance(now)
+                seen = set()
+                for bucket_start, kind, movie_id, count in ActivityCount.since(oldest):
+                    if kind in WEIGHTS:
+                        rebuilt.add(kind, movie_id, count, bucket_start, offer=False)
+                        seen.add(movie_id)
+            except Exception:
+                # The events are stored; the window is rebuilt at the next checkpoint
+                db.session.rollback()
+                raise
+            with self._lock:
+                # Events recorded while the window was rebuilt are not stored yet
+                for (bucket_start, kind, movie_id), count in self._pending.items():
+                    rebuilt.add(kind, movie_id, count, bucket_start, offer=False)
+                    seen.add(movie_id)
+                rebuilt.advance(time.time())
+                rebuilt.rank(seen)
+                self.window = rebuilt
+            return len(pending)
+
+    def run_forever(self):
+        # The first checkpoint loads what other processes and earlier runs stored
+        while True:
+            try:
+                with self.app.app_context():
+                    self.checkpoint()
+            except Exception:
+                logger.exception("Activity checkpoint failed")
+            if self._stop.wait(self.checkpoint_seconds):
+                return
+
+    def ensure_started(self):
+        """Starts the checkpoint thread once per process, including in forked workers."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                if self._pid is not None:
+                    # A forked worker must not store its parent's queued events again
+                    self._pending = Counter()
+                self._thread = threading.Thread(target=self.run_forever, name='activity', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def flush(self):
+        """Writes queued events on shutdown."""
+        if self.app is None or not self._pending:
+            return
+        try:
+            with self.app.app_context():
+                self.checkpoint()
+        except Exception:
+            logger.exception("Final activity checkpoint failed")
+
+    def stop(self):
+        self._stop.set()
+
+
+tracker = ActivityTracker()
+
+
+def record(kind, movie_id):
+    """Counts a view, list addition or review of a movie; never touches the database."""
+    tracker.record(kind, movie_id)
+
+
+def init_app(app):
+    """Starts checkpointing on each worker's first request; set ACTIVITY_CHECKPOINT=off to keep counts in memory only."""
+    tracker.app = app
+    if os.environ.get('ACTIVITY_CHECKPOINT', 'thread') == 'thread':
+        app.before_request(tracker.ensure_started)
+        atexit.register(tracker.flush)
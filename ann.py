@@ -0,0 +1,333 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+import numpy as np
+
+import instrumentation
+
+# Directory holding the approximate nearest-neighbour index built by `build_index`
+INDEX_DIR = os.environ.get('ANN_INDEX_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'ann_index'))
+
+# Dense dimensions the TF-IDF vectors are reduced to, and rows the reduction is fitted on
+DIMENSIONS = int(os.environ.get('ANN_DIMENSIONS', 128))
+FIT_SAMPLE = 100000
+
+# Random-hyperplane hash tables, and the average bucket size the bits per hash are chosen for
+TABLES = int(os.environ.get('ANN_TABLES', 16))
+BUCKET_SIZE = 32
+
+# Extra buckets probed per table, flipping the bits the query is least sure of
+PROBES = int(os.environ.get('ANN_PROBES', 8))
+
+# Candidates shortlisted per result for re-ranking by exact TF-IDF cosine
+RERANK = int(os.environ.get('ANN_RERANK', 20))
+
+# Catalogs smaller than this are searched exactly; the content index's sparse
+# product is faster there and loses nothing
+MIN_MOVIES = int(os.environ.get('ANN_MIN_MOVIES', 20000))
+
+# Inserted movies are scanned exactly until they reach this share of the index,
+# then merged into the hash tables
+MERGE_FRACTION = 0.05
+
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.where(norms > 0, norms, 1.0)).astype(np.float32)
+
+
+def fit_projection(matrix, dimensions=DIMENSIONS, sample=FIT_SAMPLE, seed=0):
+    """Fits a truncated SVD of a TF-IDF matrix; returns the (vocabulary x dimensions) projection.
+
+    Only `sample` random rows are used, so fitting stays cheap however large
+    the catalog grows.
+    """
+    from sklearn.decomposition import TruncatedSVD
+    rng = np.random.default_rng(seed)
+    if matrix.shape[0] > sample:
+        matrix = matrix[np.sort(rng.choice(matrix.shape[0], sample, replace=False))]
+    dimensions = max(1, min(dimensions, matrix.shape[0] - 1, matrix.shape[1] - 1))
+    svd = TruncatedSVD(dimensions, algorithm='randomized', random_state=seed).fit(matrix)
+    return np.ascontiguousarray(svd.components_.T, dtype=np.float32)
+
+
+def embed(matrix, projection):
+    """Maps sparse TF-IDF rows to unit-length dense vectors, so a dot product approximates their cosine."""
+    return normalize(np.asarray(matrix @ projection))
+
+
+def hash_codes(vectors, planes):
+    """Returns each vector's bucket in every table (rows x tables), and its distance to every hyperplane."""
+    tables, bits, dimensions = planes.shape
+    projections = (vectors @ planes.reshape(tables * bits, dimensions).T).reshape(len(vectors), tables, bits)
+    codes = ((projections > 0) * (1 << np.arange(bits))).sum(axis=2)
+    return codes.astype(np.int64), np.abs(projections)
+
+
+def choose_bits(count, bucket_size=BUCKET_SIZE):
+    return int(np.clip(np.round(np.log2(max(count, 1) / bucket_size)), 1, 20))
+
+
+def write_index(index_dir, ids, vectors, projection, planes, extra_meta=None):
+    """Hashes dense vectors into the tables and writes a complete index to `index_dir`.
+
+    Each table is stored as the rows sorted by bucket plus bucket offsets, so
+    a bucket is one slice of a memory-mapped array. The index is written next
+    to the old one and swapped in with renames, as in collaborative.py.
+    """
+    codes, _ = hash_codes(vectors, planes)
+    buckets = 1 << planes.shape[1]
+    order = np.argsort(codes, axis=0, kind='stable').T.astype(np.int32)
+    offsets = np.stack([
+        np.searchsorted(codes[order[table], table], np.arange(buckets + 1))
+        for table in range(planes.shape[0])
+    ]).astype(np.int64)
+
+    building = index_dir + '.building'
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+    np.save(os.path.join(building, 'ids.npy'), ids.astype(np.int64))
+    np.save(os.path.join(building, 'id_order.npy'), np.argsort(ids, kind='stable').astype(np.int64))
+    np.save(os.path.join(building, 'vectors.npy'), vectors)
+    np.save(os.path.join(building, 'projection.npy'), projection)
+    np.save(os.path.join(building, 'planes.npy'), planes)
+    np.save(os.path.join(building, 'order.npy'), order)
+    np.save(os.path.join(building, 'offsets.npy'), offsets)
+    with open(os.path.join(building, 'meta.json'), 'w') as f:
+        json.dump(dict(extra_meta or {}, movies=len(ids), dimensions=vectors.shape[1],
+                       tables=planes.shape[0], bits=planes.shape[1], built_at=time.time()), f)
+
+    old = index_dir + '.old'
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(index_dir):
+        os.rename(index_dir, old)
+    os.rename(building, index_dir)
+    shutil.rmtree(old, ignore_errors=True)
+    return len(ids)
+
+
+def build_index(matrix, ids, index_dir=INDEX_DIR, dimensions=DIMENSIONS, tables=TABLES, bits=None, seed=0, content_version=None):
+    """Builds the index from the content index's TF-IDF matrix and its movie IDs.
+
+    `content_version` records which content index build the projection
+    belongs to; see `recommendation.ContentIndex.ann_index`.
+    """
+    projection = fit_projection(matrix, dimensions, seed=seed)
+    vectors = embed(matrix, projection)
+    bits = bits or choose_bits(len(ids))
+    planes = np.random.default_rng(seed).standard_normal((tables, bits, vectors.shape[1])).astype(np.float32)
+    return write_index(index_dir, np.asarray(ids, dtype=np.int64), vectors, projection, planes, {'content_version': content_version})
+
+
+class ANNIndex:
+    """Memory-mapped dense vectors with random-hyperplane LSH tables for sub-linear cosine search.
+
+    A query reads the buckets it hashes to in each table, plus the nearest
+    buckets by one flipped bit, and ranks only the movies found there by
+    exact dot product. Movies added with `insert` live in a small delta that
+    is scanned in full until `merge` folds it into the tables.
+    """
+
+    def __init__(self, index_dir, arrays, meta, delta_ids, delta_vectors):
+        self.index_dir = index_dir
+        self.ids = arrays['ids']
+        self.id_order = arrays['id_order']
+        self.vectors = arrays['vectors']
+        self.projection = arrays['projection']
+        self.planes = np.ascontiguousarray(arrays['planes'])
+        self.order = arrays['order']
+        self.offsets = arrays['offsets']
+        self.meta = meta
+        self._set_delta(delta_ids, delta_vectors)
+
+    @classmethod
+    def load(cls, index_dir=INDEX_DIR):
+        """Loads an index written by `build_index`, memory-mapping the arrays, with any inserted movies."""
+        with open(os.path.join(index_dir, 'meta.json')) as f:
+            meta = json.load(f)
+        names = ('ids', 'id_order', 'vectors', 'projection', 'planes', 'order', 'offsets')
+        arrays = {name: np.load(os.path.join(index_dir, f'{name}.npy'), mmap_mode='r') for name in names}
+        delta_ids, delta_vectors = cls._load_delta(index_dir, meta['dimensions'])
+        return cls(index_dir, arrays, meta, delta_ids, delta_vectors)
+
+    @staticmethod
+    def _load_delta(index_dir, dimensions):
+        try:
+            with np.load(os.path.join(index_dir, 'delta.npz')) as delta:
+                return delta['ids'], delta['vectors']
+        except OSError:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, dimensions), dtype=np.float32)
+
+    def _set_delta(self, delta_ids, delta_vectors):
+        # Re-inserted movies keep their latest vector and hide their row in the tables
+        _, last = np.unique(delta_ids[::-1], return_index=True)
+        keep = np.sort(len(delta_ids) - 1 - last)
+        self.delta_ids, self.delta_vectors = delta_ids[keep], delta_vectors[keep]
+        self.superseded = np.isin(self.ids, self.delta_ids)
+
+    def __len__(self):
+        return int((~self.superseded).sum()) + len(self.delta_ids)
+
+    def _rows(self, movie_ids):
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        positions = np.searchsorted(self.ids, movie_ids, sorter=self.id_order).clip(max=max(len(self.ids) - 1, 0))
+        rows = self.id_order[positions] if len(self.ids) else positions
+        found = (self.ids[rows] == movie_ids) if len(self.ids) else np.zeros(len(movie_ids), dtype=bool)
+        return rows, found
+
+    def __contains__(self, movie_id):
+        return self.vector(movie_id) is not None
+
+    def vector(self, movie_id):
+        """Returns a movie's dense vector, or None if it is not indexed."""
+        match = np.flatnonzero(self.delta_ids == movie_id)
+        if len(match):
+            return self.delta_vectors[match[0]]
+        rows, found = self._rows([movie_id])
+        return np.asarray(self.vectors[rows[0]]) if found[0] else None
+
+    def embed(self, matrix):
+        """Maps TF-IDF rows from the content index's vectorizer into this index's space."""
+        return embed(matrix, self.projection)
+
+    def candidates(self, query, probes=PROBES):
+        """Returns the rows sharing a bucket with `query` in any table, probing `probes` extra buckets per table."""
+        codes, margins = hash_codes(query[None, :], self.planes)
+        codes, margins = codes[0], margins[0]
+        probes = min(probes, self.planes.shape[1])
+        slices = []
+        for table in range(len(codes)):
+            buckets = [codes[table]]
+            buckets += [codes[table] ^ (1 << int(bit)) for bit in np.argsort(margins[table])[:probes]]
+            for bucket in buckets:
+                start, end = self.offsets[table, bucket], self.offsets[table, bucket + 1]
+                if end > start:
+                    slices.append(self.order[table, start:end])
+        if not slices:
+            return np.zeros(0, dtype=np.int64)
+        rows = np.unique(np.concatenate(slices))
+        return rows[~self.superseded[rows]]
+
+    @instrumentation.timed('recommend.ann_search')
+    def search(self, query, k=10, exclude=None, probes=PROBES):
+        """Returns up to `k` (movie ID, cosine) pairs nearest to a dense query vector, best first."""
+        rows = self.candidates(query, probes)
+        ids = np.concatenate([self.ids[rows], self.delta_ids])
+        scores = np.concatenate([self.vectors[rows] @ query, self.delta_vectors @ query])
+        if exclude is not None:
+            scores[ids == exclude] = -1.0
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(ids[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+    def exact(self, query, k=10, exclude=None):
+        """Ranks every indexed movie against a query; the ground truth `search` approximates."""
+        ids = np.concatenate([self.ids[~self.superseded], self.delta_ids])
+        scores = np.concatenate([np.asarray(self.vectors)[~self.superseded] @ query, self.delta_vectors @ query])
+        if exclude is not None:
+            scores[ids == exclude] = -1.0
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(ids[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+    def insert(self, movie_ids, vectors):
+        """Adds or replaces movies, making them searchable at once; merges the delta once it grows large.
+
+        Meant for one writer, such as the catalog sync job; serving
+        processes pick the change up on their next `get_index` call.
+        """
+        delta_ids = np.concatenate([self.delta_ids, np.asarray(movie_ids, dtype=np.int64)])
+        delta_vectors = np.concatenate([self.delta_vectors, normalize(np.asarray(vectors, dtype=np.float32))])
+        self._set_delta(delta_ids, delta_vectors)
+        if len(self.delta_ids) > MERGE_FRACTION * max(len(self.ids), 1) and len(self.delta_ids) > 1000:
+            return self.merge()
+        # One file replaced atomically, so readers never pair IDs with other vectors
+        path = os.path.join(self.index_dir, 'delta.npz')
+        np.savez(path + '.tmp.npz', ids=self.delta_ids, vectors=self.delta_vectors)
+        os.replace(path + '.tmp.npz', path)
+        return self
+
+    def merge(self):
+        """Rewrites the index with the inserted movies hashed into the tables; returns the new index."""
+        keep = ~self.superseded
+        ids = np.concatenate([self.ids[keep], self.delta_ids])
+        vectors = np.concatenate([np.asarray(self.vectors)[keep], self.delta_vectors])
+        bits = max(self.planes.shape[1], choose_bits(len(ids)))
+        planes = self.planes
+        if bits != planes.shape[1]:
+            # The catalog outgrew the buckets; extra hyperplanes keep them small
+            extra = np.random.default_rng(len(ids)).standard_normal((planes.shape[0], bits - planes.shape[1], planes.shape[2]))
+            planes = np.concatenate([planes, extra.astype(np.float32)], axis=1)
+        write_index(self.index_dir, ids, vectors, np.asarray(self.projection), planes, {'content_version': self.meta.get('content_version')})
+        return ANNIndex.load(self.index_dir)
+
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+
+
+def _version(index_dir):
+    versions = []
+    for name in ('meta.json', 'delta.npz'):
+        try:
+            versions.append(os.stat(os.path.join(index_dir, name)).st_mtime_ns)
+        except OSError:
+            versions.append(None)
+    return tuple(versions)
+
+
+def get_index():
+    """Returns the process-wide ANN index, or None if none was built.
+
+    Rebuilds, merges and inserts by another process are picked up on the
+    next call, as with the collaborative index.
+    """
+    global _index, _index_version
+    version = _version(INDEX_DIR)
+    if version[0] is None:
+        return _index
+    if version != _index_version:
+        with _index_lock:
+            if version != _index_version:
+                _index = ANNIndex.load(INDEX_DIR)
+                _index_version = version
+    return _index
+
+
+# Build the index offline after the content index, and insert new catalog movies
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Approximate nearest-neighbour index over content vectors.")
+    parser.add_argument('--build', action='store_true', help="Build the index from the content index.")
+    parser.add_argument('--dimensions', type=int, default=DIMENSIONS)
+    parser.add_argument('--tables', type=int, default=TABLES)
+    parser.add_argument('--bits', type=int, help="Bits per hash (default: chosen from the catalog size).")
+    parser.add_argument('--insert-catalog', action='store_true', help="Insert catalog movies missing from the index.")
+    parser.add_argument('--merge', action='store_true', help="Fold inserted movies into the hash tables.")
+    args = parser.parse_args()
+
+    import recommendation
+    if args.build:
+        content = recommendation.get_content_index()
+        if content is None:
+            parser.error("Build the content index first: python recommendation.py --build-index")
+        started = time.perf_counter()
+        count = build_index(content.matrix, content.ids, dimensions=args.dimensions, tables=args.tables, bits=args.bits,
+                            content_version=content.version)
+        print(f"Indexed {count} movies into {INDEX_DIR} in {time.perf_counter() - started:.1f}s.")
+    if args.insert_catalog:
+        from app import app
+        with app.app_context():
+            count = recommendation.insert_catalog_movies()
+        print(f"Inserted {count} movies into {INDEX_DIR}.")
+    if args.merge:
+        index = get_index()
+        if index is not None:
+            print(f"Merged; {len(index.merge())} movies indexed.")
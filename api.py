@@ -0,0 +1,130 @@
+import gzip
+import hashlib
+import json
+import os
+from functools import wraps
+
+from flask import Blueprint, Response, jsonify, request
+from flask_login import current_user
+
+from cache import MemoryBackend
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Routes are defined in app.py next to the pages they mirror
+api_blueprint = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Fields returned for movies in lists, and the extra ones a single movie adds
+LIST_FIELDS = ('id', 'title', 'release_date', 'rating', 'poster', 'poster_path')
+DETAIL_FIELDS = LIST_FIELDS + (
+    'overview', 'genres', 'runtime', 'vote_count', 'original_language', 'backdrop', 'backdrop_path', 'tagline'
+)
+
+# Seconds clients and proxies may reuse public responses before revalidating
+MAX_AGE = int(os.environ.get('API_MAX_AGE', 60))
+
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_BYTES = 512
+
+# Compressed bodies keyed by ETag and encoding, so popular responses are compressed once
+_compressed = MemoryBackend(int(os.environ.get('API_COMPRESSED_ENTRIES', 512)))
+
+
+def dumps(data):
+    """Serializes to compact JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def requested_fields(allowed):
+    """Returns the fields named in `?fields=`, limited to `allowed`, or all of `allowed`."""
+    names = [name for name in request.args.get('fields', '').split(',') if name in allowed]
+    return tuple(names) or allowed
+
+
+def project(movie, fields):
+    """Trims a movie dict to `fields`; genres become a list of names."""
+    record = {name: movie.get(name) for name in fields}
+    if 'genres' in record:
+        record['genres'] = [genre['name'] if isinstance(genre, dict) else genre for genre in record['genres'] or []]
+    return record
+
+
+def project_list(movies, fields=None):
+    fields = fields or requested_fields(LIST_FIELDS)
+    return [project(movie, fields) for movie in movies]
+
+
+def _encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def _compress(body, etag, encoding):
+    key = f'{encoding}:{etag}'
+    entry = _compressed.get(key)
+    if entry is not None:
+        return entry[0]
+    data = brotli.compress(body, quality=5) if encoding == 'br' else gzip.compress(body, compresslevel=6)
+    _compressed.set(key, data, float('inf'))
+    return data
+
+
+def json_response(data, private=False):
+    """Returns `data` as compact JSON with a weak ETag, answering conditional requests with 304.
+
+    Bodies are compressed with brotli or gzip as the client accepts. Public
+    responses may be reused for `MAX_AGE` seconds; private ones, such as a
+    user's lists, must always be revalidated.
+    """
+    body = dumps(data)
+    etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+    response = Response(body, mimetype='application/json')
+    # Weak because the same ETag covers every content encoding of the body
+    response.set_etag(etag, weak=True)
+    response.vary.add('Accept-Encoding')
+    if private:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.add('Cookie')
+    else:
+        response.cache_control.public = True
+        response.cache_control.max_age = MAX_AGE
+    response.make_conditional(request)
+    if response.status_code == 304:
+        return response
+
+    encoding = _encoding()
+    if encoding and len(body) >= MIN_COMPRESS_BYTES:
+        response.set_data(_compress(body, etag, encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def error(message, status):
+    response = jsonify({'error': message})
+    response.status_code = status
+    return response
+
+
+def login_required(view):
+    """Like flask_login's decorator, but answers 401 instead of redirecting to the login page."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return error("Authentication required.", 401)
+        return view(*args, **kwargs)
+    return wrapper
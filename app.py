@@ -1,17 +1,39 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from auth import auth_blueprint
-from models import db, User, UserMovies, Review
-from recommendation import get_movie_recommendations
-import requests
+from models import db, User, UserMovies, Review, MovieRatingSummary, PrecomputedRecommendations
+import activity
+import recommendation
+import saved_lists
+from recommendation import get_precomputed_recommendations
+from cache import MemoryBackend, ResponseCache, make_backend
+import catalog
+import database
+import collaborative
+import filtering
+import identity
+import images
+import api
+from api import api_blueprint
+import tmdb_client
+from title_index import Autocompleter
+import fanout
+import instrumentation
+import page_cache
+from refresher import HotKeys, RefreshScheduler
+from fanout import fetch_concurrently, map_concurrently, prefetch, stale_or
+import csv
+import io
 import os
+import time
+from datetime import datetime
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'your_secret_key')  # Use environment variable for security
 
-# Configure SQLAlchemy database URI
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'
+# Configure the database URI and connection pool from the environment; see database.py
+database.init_app(app)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Initialize SQLAlchemy and Flask-Login
@@ -19,142 +41,309 @@ db.init_app(app)
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
 login_manager.init_app(app)
-
-# TMDB API Key (Use environment variable for security)
-API_KEY = os.environ.get('TMDB_API_KEY', '9ba93d1cf5e3054788a377f636ea1033')
-TMDB_BASE_URL = 'https://api.themoviedb.org/3'
-
-# Load user callback for Flask-Login
-@login_manager.user_loader
-def load_user(user_id):
-    return db.session.get(User, int(user_id))
+fanout.init_app(app)
+instrumentation.init_app(app)
+page_cache.init_app(app)
+images.init_app(app)
+activity.init_app(app)
+
+# Shared TMDB client (pooled connections, retries and rate limiting)
+tmdb = tmdb_client.client
+
+# Seconds a list or movie synced into the local catalog is served before going back to TMDB
+CATALOG_MAX_AGE = int(os.environ.get('CATALOG_MAX_AGE', 21600))
+
+# Title search pages filtered locally when a title search has filters
+FILTER_CANDIDATE_PAGES = int(os.environ.get('FILTER_CANDIDATE_PAGES', 5))
+
+# Columnar copy of the catalog answering filter-only queries while TMDB is down,
+# built off the request thread
+catalog_columns = filtering.RefreshingStore(lambda: list(catalog.iter_movies()), max_age=600, background=fanout.submit_refresh)
+
+# Movies per page for TMDB lists, search and saved lists; TMDB serves at most 500 pages
+PAGE_SIZE = 20
+MAX_PAGE = 500
+
+# Response cache in front of the TMDB fetchers, TTLs in seconds per endpoint
+CACHE_TTLS = {
+    'trending': 3600,
+    'top_rated': 3600,
+    'now_playing': 3600,
+    'genres': 86400,
+    'movie_details': 21600,
+    'recommendations': 21600,
+    'search': 900,
+    'search_pages': 900,
+}
+# Seconds past expiry an entry is still served while it is refreshed in the
+# background; endpoints not listed always wait for a fresh value
+CACHE_STALE_TTLS = {
+    'trending': 86400,
+    'top_rated': 86400,
+    'now_playing': 86400,
+    'genres': 7 * 86400,
+    'movie_details': 86400,
+    'recommendations': 86400,
+}
+response_cache = ResponseCache(
+    make_backend(
+        os.environ.get('CACHE_BACKEND', 'memory'),
+        os.environ.get('CACHE_PATH', os.path.join(app.instance_path, 'tmdb_cache.db')),
+        max_entries=int(os.environ.get('CACHE_MAX_ENTRIES', 0)) or None
+    ),
+    ttls=CACHE_TTLS,
+    stale_ttls=CACHE_STALE_TTLS,
+    stale_if_error=int(os.environ.get('CACHE_STALE_IF_ERROR', 7 * 86400)),
+    background=fanout.submit_refresh
+)
+
+# Load user callback for Flask-Login; identities are cached per process, see identity.py
+login_manager.user_loader(identity.load_user)
 
 # Register the auth blueprint
 app.register_blueprint(auth_blueprint, url_prefix='/auth')
 
 # TMDB API Functions
-def get_top_rated_movies():
-    url = f'{TMDB_BASE_URL}/movie/top_rated'
+def get_catalog_list(name, path, params, include_backdrop=False, page=1):
+    """Reads a page of a movie list from the local catalog, falling back to TMDB and storing the result."""
+    movies = catalog.get_list(name, CATALOG_MAX_AGE, offset=(page - 1) * PAGE_SIZE, limit=PAGE_SIZE)
+    if movies is None and page > 1:
+        # Pages beyond those sync_catalog mirrored are stored as lists of their own
+        name = f'{name}:page{page}'
+        movies = catalog.get_list(name, CATALOG_MAX_AGE)
+    if movies is None:
+        data = tmdb.get_json(path, **params)
+        movies = data.get('results', []) if data is not None else []
+        if movies:
+            store_in_catalog(catalog.replace_list, name, movies)
+    return [decorate_movie(movie, include_backdrop) for movie in movies]
+
+def store_in_catalog(write, *args):
+    """Writes upstream data through to the local catalog without failing the request."""
+    try:
+        write(*args)
+    except Exception:
+        db.session.rollback()
+        app.logger.exception("Failed to store TMDB data in the catalog")
+
+@response_cache.cached('top_rated')
+def get_top_rated_movies(page=1):
+    path = '/movie/top_rated'
     params = {
-        'api_key': API_KEY,
         'language': 'en-US',
-        'page': 1
+        'page': page
     }
-    response = requests.get(url, params=params)
-    return process_movie_results(response, include_backdrop=False)
+    return get_catalog_list('top_rated', path, params, include_backdrop=False, page=page)
 
-def get_new_released_movies():
-    url = f'{TMDB_BASE_URL}/movie/now_playing'
+@response_cache.cached('now_playing')
+def get_new_released_movies(page=1):
+    path = '/movie/now_playing'
     params = {
-        'api_key': API_KEY,
         'language': 'en-US',
-        'page': 1
+        'page': page
     }
-    response = requests.get(url, params=params)
-    return process_movie_results(response, include_backdrop=False)
+    return get_catalog_list('now_playing', path, params, include_backdrop=False, page=page)
 
-def get_trending_movies():
-    url = f'{TMDB_BASE_URL}/trending/movie/week'
+@response_cache.cached('trending')
+def get_trending_movies(page=1):
+    path = '/trending/movie/week'
     params = {
-        'api_key': API_KEY,
+        'page': page
     }
-    response = requests.get(url, params=params)
-    return process_movie_results(response, include_backdrop=True)
+    return get_catalog_list('trending', path, params, include_backdrop=True, page=page)
 
+@response_cache.cached('genres')
 def get_genres():
-    """Fetches a list of genres from the TMDB API."""
-    url = f'{TMDB_BASE_URL}/genre/movie/list'
+    """Fetches a list of genres from the local catalog or the TMDB API."""
+    genres = catalog.get_genres()
+    if genres:
+        return genres
+    path = '/genre/movie/list'
     params = {
-        'api_key': API_KEY,
         'language': 'en-US'
     }
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        return response.json().get('genres', [])
+    data = tmdb.get_json(path, **params)
+    if data is not None:
+        genres = data.get('genres', [])
+        store_in_catalog(catalog.upsert_genres, genres)
+        return genres
     return []
 
-def search_movie(movie_title, filters=None):
-    """Searches for movies based on title and optional filters."""
-    url = f'{TMDB_BASE_URL}/search/movie'
+@response_cache.cached('search')
+def search_movie(movie_title, filters=None, page=1):
+    """Searches for movies by title, by filters, or both.
+
+    `filters` are normalized with filtering.normalize_filters. /search/movie
+    ignores discover's filter parameters, so filter-only queries go to TMDB
+    discover and filtered title searches are filtered locally over the first
+    pages of title results.
+    """
+    filters = filters or {}
+    if not movie_title:
+        return discover_movies(filters, page) if filters else []
+    if not filters:
+        data = search_title_page(movie_title, page)
+        return data['results'] if data else []
+    return filter_title_search(movie_title, filters, page)
+
+@response_cache.cached('search_pages')
+def search_title_page(movie_title, page=1):
+    """Fetches one page of TMDB title search results with the total page count, or None on failure."""
+    path = '/search/movie'
     params = {
-        'api_key': API_KEY,
         'language': 'en-US',
         'query': movie_title,
-        'page': 1,
+        'page': page,
         'include_adult': False
     }
+    data = tmdb.get_json(path, **params)
+    if data is not None:
+        results = data.get('results', [])
+        store_in_catalog(catalog.upsert_movies, results)
+        return {'results': [decorate_movie(movie) for movie in results], 'total_pages': data.get('total_pages', 1)}
+    return None
 
-    if filters:
-        if 'release_year_min' in filters and filters['release_year_min']:
-            params['primary_release_date.gte'] = f"{filters['release_year_min']}-01-01"
-        if 'release_year_max' in filters and filters['release_year_max']:
-            params['primary_release_date.lte'] = f"{filters['release_year_max']}-12-31"
-        if 'rating_min' in filters and filters['rating_min']:
-            params['vote_average.gte'] = filters['rating_min']
-        if 'rating_max' in filters and filters['rating_max']:
-            params['vote_average.lte'] = filters['rating_max']
-        if 'genres' in filters and filters['genres']:
-            # TMDB allows filtering by genres using with_genres
-            # The genres should be a comma-separated string of genre IDs
-            params['with_genres'] = ','.join(filters['genres'])
-        if 'language' in filters and filters['language']:
-            params['with_original_language'] = filters['language']
-        if 'sort_by' in filters and filters['sort_by']:
-            params['sort_by'] = filters['sort_by']
-
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        return process_movie_results(response, include_backdrop=False)
-    return []
-
+def filter_title_search(movie_title, filters, page=1):
+    """Filters and sorts up to FILTER_CANDIDATE_PAGES pages of title results locally."""
+    first = search_title_page(movie_title)
+    if not first:
+        return []
+    more = range(2, min(first['total_pages'], FILTER_CANDIDATE_PAGES) + 1)
+    candidates = list(first['results'])
+    for data in map_concurrently(lambda number: search_title_page(movie_title, number), more):
+        if data:
+            candidates.extend(data['results'])
+    matches = filtering.ColumnStore(candidates).select(filters)
+    start = (page - 1) * PAGE_SIZE
+    return matches[start:start + PAGE_SIZE]
+
+def discover_movies(filters, page=1):
+    """Runs a filter-only query through TMDB discover, or over the local catalog if TMDB is unavailable.
+
+    The local fallback returns nothing until the catalog's columnar copy has
+    been built in the background.
+    """
+    data = tmdb.get_json('/discover/movie', **filtering.discover_params(filters, page))
+    if data is None:
+        columns = catalog_columns.get()
+        if columns is None:
+            return []
+        matches = columns.select(dict(filters, sort_by=filters.get('sort_by', 'popularity.desc')))
+        start = (page - 1) * PAGE_SIZE
+        return [decorate_movie(dict(movie)) for movie in matches[start:start + PAGE_SIZE]]
+    results = data.get('results', [])
+    store_in_catalog(catalog.upsert_movies, results)
+    # Re-check locally so results stay correct even if a filter was not applied upstream
+    return [decorate_movie(movie) for movie in filtering.ColumnStore(results).select(filters)]
+
+@response_cache.cached('movie_details')
 def get_movie_details(movie_id):
-    """Fetches detailed information for a specific movie."""
-    url = f'{TMDB_BASE_URL}/movie/{movie_id}'
+    """Fetches detailed information for a specific movie from the local catalog or the TMDB API.
+
+    Catalog rows older than CATALOG_MAX_AGE are fetched again, so refreshing
+    a hot movie reaches TMDB; the old row is served if TMDB fails.
+    """
+    movie = catalog.get_movie(movie_id, CATALOG_MAX_AGE)
+    if movie:
+        return decorate_movie(movie, include_backdrop=True)
+    fetched = fetch_movie_details(movie_id)
+    if fetched is None:
+        movie = catalog.get_movie(movie_id)
+        return decorate_movie(movie, include_backdrop=True) if movie else None
+    return fetched
+
+def fetch_movie_details(movie_id):
+    """Fetches a movie's details from the TMDB API and stores them in the catalog."""
+    path = f'/movie/{movie_id}'
     params = {
-        'api_key': API_KEY,
         'language': 'en-US'
     }
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        movie = response.json()
-        movie['rating'] = movie.get('vote_average', 'N/A')
-        poster_path = movie.get('poster_path')
-        movie['poster'] = f"https://image.tmdb.org/t/p/original{poster_path}" if poster_path else "https://via.placeholder.com/500x750?text=No+Image"
-        backdrop_path = movie.get('backdrop_path')
-        movie['backdrop'] = f"https://image.tmdb.org/t/p/original{backdrop_path}" if backdrop_path else "https://via.placeholder.com/1280x720?text=No+Image"
-        return movie
+    movie = tmdb.get_json(path, **params)
+    if movie is not None:
+        store_in_catalog(catalog.upsert_movies, [movie])
+        return decorate_movie(movie, include_backdrop=True)
     return None
 
-def get_recommendations(movie_id):
+@response_cache.cached('recommendations')
+def get_recommendations(movie_id, page=1):
     """Fetches recommendations for a given movie ID."""
-    url = f'{TMDB_BASE_URL}/movie/{movie_id}/recommendations'
+    path = f'/movie/{movie_id}/recommendations'
     params = {
-        'api_key': API_KEY,
         'language': 'en-US',
-        'page': 1
+        'page': page
     }
-    response = requests.get(url, params=params)
-    return process_movie_results(response, include_backdrop=False)
-
-def process_movie_results(response, include_backdrop=False):
-    """Processes movie results from TMDB API responses."""
-    if response.status_code == 200:
-        results = response.json().get('results', [])
-        for movie in results:
-            movie['rating'] = movie.get('vote_average', 'N/A')
-            poster_path = movie.get('poster_path')
-            movie['poster'] = f"https://image.tmdb.org/t/p/original{poster_path}" if poster_path else "https://via.placeholder.com/500x750?text=No+Image"
-            if include_backdrop:
-                backdrop_path = movie.get('backdrop_path')
-                movie['backdrop'] = f"https://image.tmdb.org/t/p/original{backdrop_path}" if backdrop_path else "https://via.placeholder.com/1280x720?text=No+Image"
-        return results
-    return []
+    return get_catalog_list(f'recommendations:{movie_id}', path, params, include_backdrop=False, page=page)
+
+# Movie IDs TMDB returned no details for (unknown or failing), which batch
+# hydration skips until they expire rather than asking upstream on every view
+unavailable_movies = MemoryBackend(int(os.environ.get('UNAVAILABLE_MOVIE_ENTRIES', 10000)))
+UNAVAILABLE_MOVIE_TTL = int(os.environ.get('UNAVAILABLE_MOVIE_TTL', 3600))
+
+def get_movies_details(movie_ids):
+    """Fetches details for many movies, keeping the input order and dropping missing ones.
+
+    IDs are deduplicated, cached details and catalog rows are served directly
+    and the rest are fetched concurrently on the bounded hydration pool,
+    except IDs that recently came back empty.
+    """
+    unique_ids = list(dict.fromkeys(movie_ids))
+    details = {movie_id: get_movie_details.cached_only(movie_id) for movie_id in unique_ids}
+    stored = catalog.get_movies([movie_id for movie_id, movie in details.items() if movie is None])
+    for movie_id, movie in stored.items():
+        details[movie_id] = decorate_movie(movie, include_backdrop=True)
+    now = time.time()
+    missing = [
+        movie_id for movie_id, movie in details.items()
+        if movie is None and (unavailable_movies.expires_at(movie_id) or 0) <= now
+    ]
+    for movie_id, movie in zip(missing, map_concurrently(get_movie_details, missing)):
+        details[movie_id] = movie
+        if movie is None:
+            unavailable_movies.set(movie_id, True, now + UNAVAILABLE_MOVIE_TTL)
+    return [details[movie_id] for movie_id in movie_ids if details[movie_id]]
+
+def decorate_movie(movie, include_backdrop=False):
+    """Adds the rating and image URL fields the templates use to a TMDB-shaped movie."""
+    movie['rating'] = movie.get('vote_average', 'N/A')
+    movie['poster'] = images.url_for_use(movie.get('poster_path'), 'card')
+    if include_backdrop:
+        movie['backdrop'] = images.url_for_use(movie.get('backdrop_path'), 'hero')
+    return movie
+
+def get_saved_list_page(user_id, category, sortby=None, page=1):
+    """Returns one page of a user's saved list, sorted and sliced in SQL, and whether more follow.
+
+    Movies on the page saved before they reached the catalog are fetched
+    once and stored there, so a page costs at most its own size upstream.
+    """
+    entries, has_next = UserMovies.page(user_id, category, sortby, page, PAGE_SIZE)
+    fetched = {movie['id']: movie for movie in get_movies_details([movie_id for movie_id, movie in entries if movie is None])}
+    movies = [decorate_movie(movie, include_backdrop=True) if movie else fetched.get(movie_id) for movie_id, movie in entries]
+    return [movie for movie in movies if movie], has_next
+
+def get_page_number():
+    """Reads the `page` request parameter, clamped to the pages TMDB can serve."""
+    try:
+        page = int(request.values.get('page', 1))
+    except ValueError:
+        page = 1
+    return min(max(page, 1), MAX_PAGE)
+
+def has_next_page(movies, page):
+    return len(movies) >= PAGE_SIZE and page < MAX_PAGE
+
+@app.template_global()
+def page_url(page):
+    """Builds the current page's URL, including submitted form fields, for another page number."""
+    args = request.args.to_dict(flat=False)
+    args.update(request.form.to_dict(flat=False))
+    args['page'] = page
+    return url_for(request.endpoint, **request.view_args, **args)
 
 def calculate_avg_rating(movie_id):
-    """Calculates the average rating for a movie based on user reviews."""
-    reviews = Review.query.filter_by(movie_id=movie_id).all()
-    if reviews:
-        avg_rating = sum([review.rating for review in reviews]) / len(reviews)
+    """Returns the average user rating for a movie from its precomputed rating summary."""
+    avg_rating = MovieRatingSummary.average(movie_id)
+    if avg_rating is not None:
         return round(avg_rating, 1)
     return "No ratings yet"
 
@@ -166,18 +355,15 @@ def add_movie(category, movie_id):
         flash("Invalid category.", "danger")
         return redirect(url_for('index'))
 
-    existing_entry = UserMovies.query.filter_by(user_id=current_user.id, movie_id=movie_id, category=category).first()
-    if not existing_entry:
-        new_entry = UserMovies(user_id=current_user.id, movie_id=movie_id, category=category)
-        try:
-            db.session.add(new_entry)
-            db.session.commit()
+    try:
+        if UserMovies.add(current_user.id, category, movie_id):
+            activity.record(category, movie_id)
             flash(f"Movie added to {category}.", "success")
-        except Exception as e:
-            db.session.rollback()
-            flash(f"Error adding movie to {category}: {str(e)}", "danger")
-    else:
-        flash("Movie is already in your list.", "info")
+        else:
+            flash("Movie is already in your list.", "info")
+    except Exception as e:
+        db.session.rollback()
+        flash(f"Error adding movie to {category}: {str(e)}", "danger")
 
     return redirect(url_for(f'view_{category}'))
 
@@ -189,17 +375,14 @@ def remove_movie(category, movie_id):
         flash("Invalid category.", "danger")
         return redirect(url_for('index'))
     
-    entry = UserMovies.query.filter_by(user_id=current_user.id, movie_id=movie_id, category=category).first()
-    if entry:
-        try:
-            db.session.delete(entry)
-            db.session.commit()
+    try:
+        if UserMovies.remove(current_user.id, category, movie_id):
             flash(f"Movie removed from {category}.", "success")
-        except Exception as e:
-            db.session.rollback()
-            flash(f"Error removing movie from {category}: {str(e)}", "danger")
-    else:
-        flash("Movie not found in your list.", "warning")
+        else:
+            flash("Movie not found in your list.", "warning")
+    except Exception as e:
+        db.session.rollback()
+        flash(f"Error removing movie from {category}: {str(e)}", "danger")
     
     return redirect(url_for(f'view_{category}'))
 
@@ -207,63 +390,77 @@ def remove_movie(category, movie_id):
 @app.route('/watchlist')
 @login_required
 def view_watchlist():
-    watchlist_movies = UserMovies.query.filter_by(user_id=current_user.id, category='watchlist').all()
-    movies = [get_movie_details(movie.movie_id) for movie in watchlist_movies if get_movie_details(movie.movie_id)]
-    if not movies:
+    page = get_page_number()
+    movies, has_next = get_saved_list_page(current_user.id, 'watchlist', page=page)
+    if not movies and page == 1:
         flash("Your watchlist is empty.", "info")
-    return render_template('watchlist.html', movies=movies, category="Watchlist")
+    return render_template('watchlist.html', movies=movies, category="Watchlist", page=page, has_next=has_next)
 
 # Route to view Favorites
 @app.route('/favorites')
 @login_required
 def view_favorites():
-    favorite_movies = UserMovies.query.filter_by(user_id=current_user.id, category='favorites').all()
-    movies = [get_movie_details(movie.movie_id) for movie in favorite_movies if get_movie_details(movie.movie_id)]
-    if not movies:
+    page = get_page_number()
+    movies, has_next = get_saved_list_page(current_user.id, 'favorites', page=page)
+    if not movies and page == 1:
         flash("Your favorites list is empty.", "info")
-    return render_template('favorites.html', movies=movies, category="Favorites")
-
-# Route to recommend movies with search and filters
-@app.route('/recommend', methods=['POST'])
-def recommend():
-    # Extract search and filter parameters from the form
-    movie_title = request.form.get('movie_title', '')
-    release_year_min = request.form.get('release_year_min', '')
-    release_year_max = request.form.get('release_year_max', '')
-    rating_min = request.form.get('rating_min', '')
-    rating_max = request.form.get('rating_max', '')
-    genres = request.form.getlist('genres')  # For multiple genres
-    language = request.form.get('language', '')
-    sort_by = request.form.get('sort_by', '')
-
-    genres_list = get_genres()
-
-    # Prepare filters dictionary
-    filters = {
-        'release_year_min': release_year_min,
-        'release_year_max': release_year_max,
-        'rating_min': rating_min,
-        'rating_max': rating_max,
-        'genres': genres,
-        'language': language,
-        'sort_by': sort_by
-    }
-
-    # Perform movie search with filters
-    search_results = search_movie(movie_title, filters=filters)
-
-    # Fetch recommendations based on the first search result
+    return render_template('favorites.html', movies=movies, category="Favorites", page=page, has_next=has_next)
+
+def read_search_params():
+    """Reads the search form from the request: the title as typed, the normalized query, filters and page."""
+    movie_title = request.values.get('movie_title', '')
+    # Normalized so equivalent queries share cache entries
+    filters = filtering.normalize_filters({
+        'release_year_min': request.values.get('release_year_min', ''),
+        'release_year_max': request.values.get('release_year_max', ''),
+        'rating_min': request.values.get('rating_min', ''),
+        'rating_max': request.values.get('rating_max', ''),
+        'genres': request.values.getlist('genres'),  # For multiple genres
+        'language': request.values.get('language', ''),
+        'sort_by': request.values.get('sort_by', '')
+    })
+    # TMDB title search ignores case and spacing, so the cache key does too
+    query = ' '.join(movie_title.lower().split())
+    return movie_title, query, filters, get_page_number()
+
+def search_and_recommend(query, filters, page):
+    """Searches, then fetches recommendations for the first result of a title search's first page.
+
+    Recommendations depend on the first search result, so they are chained
+    after the search rather than fetched concurrently with it.
+    """
+    search_results = search_movie(query, filters=filters, page=page)
     recommendations = []
-    if movie_title and search_results:
+    if query and search_results and page == 1:
         recommendations = get_recommendations(search_results[0]['id'])
+    return search_results, recommendations
 
-    # Fetch other movie categories
-    trending_movies = get_trending_movies()
-    most_watched_movies = get_top_rated_movies()
-    new_released_movies = get_new_released_movies()
+# Route to recommend movies with search and filters
+# GET is accepted too so result pages can link to each other
+@app.route('/recommend', methods=['GET', 'POST'])
+def recommend():
+    movie_title, query, filters, page = read_search_params()
+
+    results = fetch_concurrently({
+        'search': (search_and_recommend, (query, filters, page), lambda: (stale_or(search_movie, [], query, filters=filters, page=page)(), [])),
+        'genres': (get_genres, (), stale_or(get_genres, [])),
+        'trending': (get_trending_movies, (), stale_or(get_trending_movies, [])),
+        'top_rated': (get_top_rated_movies, (), stale_or(get_top_rated_movies, [])),
+        'now_playing': (get_new_released_movies, (), stale_or(get_new_released_movies, [])),
+    })
+    search_results, recommendations = results['search']
+    genres_list = results['genres']
+    trending_movies = results['trending']
+    most_watched_movies = results['top_rated']
+    new_released_movies = results['now_playing']
+    has_next = has_next_page(search_results, page)
+    if has_next:
+        prefetch(search_movie, query, filters=filters, page=page + 1)
 
     return render_template(
         'index.html',
+        page=page,
+        has_next=has_next,
         search_results=search_results,
         recommendations=recommendations,
         search_query=movie_title,
@@ -273,74 +470,183 @@ def recommend():
         new_released_movies=new_released_movies
     )
 
-# Autocomplete Route
-@app.route('/autocomplete', methods=['GET'])
-def autocomplete():
-    query = request.args.get('q', '')
-    if not query:
-        return jsonify([])
-
-    url = f'{TMDB_BASE_URL}/search/movie'
+def search_titles_upstream(query):
+    """Searches TMDB titles for autocomplete, returning the results and whether they are complete."""
+    path = '/search/movie'
     params = {
-        'api_key': API_KEY,
         'language': 'en-US',
         'query': query,
         'page': 1,
         'include_adult': False
     }
-    response = requests.get(url, params=params)
-    
-    if response.status_code == 200:
-        results = response.json().get('results', [])
-        suggestions = [{'label': movie['title'], 'value': movie['title'], 'id': movie['id']} for movie in results[:10]]
-        return jsonify(suggestions)
-    else:
+    data = tmdb.get_json(path, **params)
+    if data is not None:
+        results = data.get('results', [])
+        return results, data.get('total_results', 0) <= len(results)
+    return [], False
+
+# Local title index answering autocomplete, kept in step with the catalog
+autocompleter = Autocompleter(
+    catalog.title_changes,
+    search_titles_upstream,
+    refresh_interval=int(os.environ.get('AUTOCOMPLETE_REFRESH', 300))
+)
+
+# Autocomplete Route
+@app.route('/autocomplete', methods=['GET'])
+def autocomplete():
+    query = request.args.get('q', '')
+    if not query:
         return jsonify([])
 
+    suggestions = [{'label': title, 'value': title, 'id': movie_id} for movie_id, title in autocompleter.suggest(query)]
+    return jsonify(suggestions)
+
+# Cache statistics: upstream traffic saved by the response cache, and page and
+# fragment renders saved by the page cache
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(dict(response_cache.stats(), rendered=page_cache.stats()))
+
+# Per-endpoint TMDB call counts, retries and latency for this worker
+@app.route('/tmdb/stats', methods=['GET'])
+def tmdb_stats():
+    return jsonify(tmdb.metrics())
+
+# Span latency histograms (TMDB, database, recommendation stages, templates
+# and whole requests) in Prometheus text format, or JSON with ?format=json
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    if request.args.get('format') == 'json':
+        return jsonify(instrumentation.registry.snapshot())
+    return Response(instrumentation.registry.prometheus(), mimetype='text/plain; version=0.0.4')
+
+# Background refresh of the hot lists and the most viewed movies' details,
+# so pages are served from a warm cache instead of waiting on TMDB
+movie_views = HotKeys()
+refresher = RefreshScheduler(
+    app,
+    interval=int(os.environ.get('REFRESH_INTERVAL', 60)),
+    lead=int(os.environ.get('REFRESH_LEAD', 300))
+)
+refresher.add(get_trending_movies)
+refresher.add(get_top_rated_movies)
+refresher.add(get_new_released_movies)
+refresher.add(get_genres)
+
+def hot_movie_jobs():
+    """Returns refresh jobs for the movies viewed most since the last few runs."""
+    jobs = [(get_movie_details, (movie_id,)) for movie_id in movie_views.top(int(os.environ.get('REFRESH_HOT_MOVIES', 50)))]
+    movie_views.decay()
+    return jobs
+
+refresher.add_source(hot_movie_jobs)
+
+# 'thread' runs the scheduler inside each worker process; use 'off' when a
+# companion `python refresher.py` keeps a shared sqlite cache warm instead
+if os.environ.get('BACKGROUND_REFRESH', 'thread') == 'thread':
+    refresher.add_task(catalog_columns.refresh)
+
+    @app.before_request
+    def start_refresher():
+        refresher.ensure_started()
+
 # Home route displaying trending movies, most watched, and new released movies
 @app.route('/')
 def index():
-    trending_movies = get_trending_movies()
-    most_watched_movies = get_top_rated_movies()
-    new_released_movies = get_new_released_movies()
-    genres = get_genres()
-    return render_template('index.html',
-                           trending_movies=trending_movies,
-                           most_watched_movies=most_watched_movies,
-                           new_released_movies=new_released_movies,
-                           genres=genres)
+    def fetch():
+        results = fetch_concurrently({
+            'trending': (get_trending_movies, (), stale_or(get_trending_movies, [])),
+            'top_rated': (get_top_rated_movies, (), stale_or(get_top_rated_movies, [])),
+            'now_playing': (get_new_released_movies, (), stale_or(get_new_released_movies, [])),
+            'genres': (get_genres, (), stale_or(get_genres, [])),
+        })
+        return {
+            'trending_movies': results['trending'],
+            'most_watched_movies': results['top_rated'],
+            'new_released_movies': results['now_playing'],
+            'genres': results['genres'],
+        }
+    return page_cache.render_page('index.html', [(get_trending_movies,), (get_top_rated_movies,), (get_new_released_movies,), (get_genres,)], fetch)
+
+def render_movie_list_page(template, name, fetcher):
+    """Renders one page of a paged TMDB movie list, exposed to the template as `name`."""
+    page = get_page_number()
+
+    def fetch():
+        movies = fetcher(page)
+        has_next = has_next_page(movies, page)
+        if has_next:
+            prefetch(fetcher, page + 1)
+        return {name: movies, 'genres': get_genres(), 'has_next': has_next}
+    return page_cache.render_page(template, [(fetcher, page), (get_genres,)], fetch, page=page)
 
 # Route to display top-rated movies
 @app.route('/top-rated')
 def top_rated():
-    top_rated_movies = get_top_rated_movies()
-    genres = get_genres()
-    return render_template('top_rated.html', top_rated_movies=top_rated_movies, genres=genres)
+    return render_movie_list_page('top_rated.html', 'top_rated_movies', get_top_rated_movies)
 
 # Route to display newly released movies
 @app.route('/new-released')
 def new_released():
-    new_released_movies = get_new_released_movies()
-    genres = get_genres()
-    return render_template('new_released.html', new_released_movies=new_released_movies, genres=genres)
+    return render_movie_list_page('new_released.html', 'new_released_movies', get_new_released_movies)
 
 # Route to display trending movies
 @app.route('/trending')
 def trending():
-    trending_movies = get_trending_movies()
-    genres = get_genres()
-    return render_template('trending.html', trending_movies=trending_movies, genres=genres)
+    return render_movie_list_page('trending.html', 'trending_movies', get_trending_movies)
 
-# Route to display movie details with reviews and content-based recommendations
+# Route to display personal recommendations from what users with similar lists liked
+@app.route('/for-you')
+@login_required
+def for_you():
+    movies = get_for_you_movies(current_user.id)
+    if request.args.get('format') == 'json':
+        return jsonify(movies)
+    return render_template('for_you.html', movies=movies)
+
+def get_for_you_movies(user_id, count=PAGE_SIZE):
+    """Returns a user's collaborative recommendations, or trending movies until they have saved or rated any.
+
+    Lists written by precompute.py are read as they are; users it has not
+    covered yet are scored on the spot.
+    """
+    movie_ids = PrecomputedRecommendations.get('user', user_id)
+    if movie_ids is None:
+        index = collaborative.get_index()
+        movie_ids = [movie_id for movie_id, _ in index.for_user(collaborative.user_profile(user_id), count)] if index is not None else []
+    stored = catalog.get_movies(movie_ids[:count])
+    movies = [decorate_movie(stored[movie_id]) for movie_id in movie_ids[:count] if movie_id in stored]
+    return movies or get_trending_movies()[:count]
+
+# Route to display the movies with the most views, list additions and reviews on this site lately
+@app.route('/popular')
+def popular():
+    return render_template('popular.html', movies=get_popular_movies())
+
+def get_popular_movies(count=PAGE_SIZE):
+    """Returns the movies with the most recent activity on this site, or trending movies until there is any.
+
+    Served from the in-process activity counters; see activity.py.
+    """
+    movie_ids = activity.tracker.popular(count)
+    stored = catalog.get_movies(movie_ids)
+    movies = [decorate_movie(stored[movie_id]) for movie_id in movie_ids if movie_id in stored]
+    return movies or get_trending_movies()[:count]
+
+# Route to display movie details with reviews and blended recommendations
 @app.route('/movie/<int:movie_id>', methods=['GET', 'POST'])
 def movie_details(movie_id):
     movie = get_movie_details(movie_id)
     if not movie:
         return render_template('404.html'), 404
+    movie_views.record(movie_id)
+    if request.method == 'GET':
+        activity.record('view', movie_id)
 
-    reviews = Review.query.filter_by(movie_id=movie_id).order_by(Review.created_at.desc()).all()
+    reviews, next_cursor = Review.page_for_movie(movie_id, before=parse_review_cursor(request.args.get('reviews_before')))
     avg_rating = calculate_avg_rating(movie_id)
-    recommendations = get_movie_recommendations(movie['title'])
+    recommendations = get_precomputed_recommendations(movie_id, movie)
 
     if request.method == 'POST' and current_user.is_authenticated:
         rating = request.form.get('rating')
@@ -350,9 +656,8 @@ def movie_details(movie_id):
             try:
                 rating_value = float(rating)
                 if 0 <= rating_value <= 10:
-                    new_review = Review(user_id=current_user.id, movie_id=movie_id, rating=rating_value, review_text=review_text)
-                    db.session.add(new_review)
-                    db.session.commit()
+                    Review.add_review(current_user.id, movie_id, rating_value, review_text)
+                    activity.record('review', movie_id)
                     flash("Review submitted successfully!", "success")
                 else:
                     flash("Rating must be between 0 and 10.", "warning")
@@ -362,54 +667,201 @@ def movie_details(movie_id):
         else:
             flash("Please provide a rating.", "warning")
 
-    return render_template('movie_details.html', movie=movie, reviews=reviews, avg_rating=avg_rating, recommendations=recommendations)
+    return render_template('movie_details.html', movie=movie, reviews=reviews, avg_rating=avg_rating, recommendations=recommendations,
+                           next_reviews_cursor=format_review_cursor(next_cursor), activity_counts=activity.tracker.counts(movie_id))
+
+def format_review_cursor(cursor):
+    """Encodes a (created_at, id) review cursor for use in a URL."""
+    if cursor is None:
+        return None
+    created_at, review_id = cursor
+    return f"{created_at.isoformat()}_{review_id}"
+
+def parse_review_cursor(value):
+    """Decodes a review cursor from a URL, ignoring malformed values."""
+    if not value:
+        return None
+    try:
+        created_at, review_id = value.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(review_id)
+    except ValueError:
+        return None
 
 # Route to display filters page
 @app.route('/filters')
 def filters():
-    genres = get_genres()
-    return render_template('filters.html', genres=genres)
+    return page_cache.render_page('filters.html', [(get_genres,)], lambda: {'genres': get_genres()})
 
 # Route to display filtered Watchlist (Optional Enhancement)
 @app.route('/filter_watchlist', methods=['GET'])
 @login_required
 def filter_watchlist():
     sortby = request.args.get('sortby')
-    movies = get_filtered_watchlist(current_user.id, sortby)
-    return render_template('watchlist.html', movies=movies, category="Watchlist")
+    page = get_page_number()
+    movies, has_next = get_filtered_watchlist(current_user.id, sortby, page=page)
+    return render_template('watchlist.html', movies=movies, category="Watchlist", page=page, has_next=has_next)
 
 # Route to display filtered Favorites (Optional Enhancement)
 @app.route('/filter_favorites', methods=['GET'])
 @login_required
 def filter_favorites():
     sortby = request.args.get('sortby')
-    movies = get_filtered_watchlist(current_user.id, sortby, category='favorites')
-    return render_template('favorites.html', movies=movies, category="Favorites")
+    page = get_page_number()
+    movies, has_next = get_filtered_watchlist(current_user.id, sortby, category='favorites', page=page)
+    return render_template('favorites.html', movies=movies, category="Favorites", page=page, has_next=has_next)
 
 # Helper function to get filtered watchlist or favorites
-def get_filtered_watchlist(user_id, sortby, category='watchlist'):
-    watchlist_movies = UserMovies.query.filter_by(user_id=user_id, category=category).all()
-    movies = [get_movie_details(movie.movie_id) for movie in watchlist_movies if get_movie_details(movie.movie_id)]
-    
-    if sortby:
-        if sortby == 'rating_desc':
-            movies.sort(key=lambda x: x.get('rating', 0), reverse=True)
-        elif sortby == 'rating_asc':
-            movies.sort(key=lambda x: x.get('rating', 0))
-        elif sortby == 'release_date_desc':
-            movies.sort(key=lambda x: x.get('release_date', ''), reverse=True)
-        elif sortby == 'release_date_asc':
-            movies.sort(key=lambda x: x.get('release_date', ''))
-        elif sortby == 'title_asc':
-            movies.sort(key=lambda x: x.get('title', '').lower())
-        elif sortby == 'title_desc':
-            movies.sort(key=lambda x: x.get('title', '').lower(), reverse=True)
-    return movies
-
-# Initialize database tables if they do not exist
-with app.app_context():
-    db.create_all()
+def get_filtered_watchlist(user_id, sortby, category='watchlist', page=1):
+    """Returns one page of a saved list in the requested order, and whether more follow."""
+    return get_saved_list_page(user_id, category, sortby, page)
+
+# JSON API serving the same data as the pages as trimmed records; see api.py
+def api_movie_list(fetcher):
+    page = get_page_number()
+    movies = fetcher(page)
+    has_next = has_next_page(movies, page)
+    if has_next:
+        prefetch(fetcher, page + 1)
+    return api.json_response({'page': page, 'has_next': has_next, 'results': api.project_list(movies)})
+
+@api_blueprint.route('/trending')
+def api_trending():
+    return api_movie_list(get_trending_movies)
+
+@api_blueprint.route('/popular')
+def api_popular():
+    return api.json_response({'results': api.project_list(get_popular_movies())})
+
+@api_blueprint.route('/top-rated')
+def api_top_rated():
+    return api_movie_list(get_top_rated_movies)
+
+@api_blueprint.route('/new-released')
+def api_new_released():
+    return api_movie_list(get_new_released_movies)
+
+@api_blueprint.route('/genres')
+def api_genres():
+    return api.json_response(get_genres())
+
+@api_blueprint.route('/movie/<int:movie_id>')
+def api_movie(movie_id):
+    movie = get_movie_details(movie_id)
+    if not movie:
+        return api.error("Movie not found.", 404)
+    movie_views.record(movie_id)
+    activity.record('view', movie_id)
+    record = api.project(movie, api.requested_fields(api.DETAIL_FIELDS))
+    record['avg_user_rating'] = MovieRatingSummary.average(movie_id)
+    record['activity'] = activity.tracker.counts(movie_id)
+    record['recommendations'] = api.project_list(get_precomputed_recommendations(movie_id, movie), ('id', 'title', 'rating', 'poster', 'poster_path'))
+    return api.json_response(record)
+
+@api_blueprint.route('/movie/<int:movie_id>/reviews')
+def api_movie_reviews(movie_id):
+    reviews, next_cursor = Review.page_for_movie(movie_id, before=parse_review_cursor(request.args.get('before')))
+    return api.json_response({
+        'results': [
+            {
+                'id': review.id,
+                'username': review.user.username,
+                'rating': review.rating,
+                'text': review.review_text,
+                'created_at': review.created_at.isoformat()
+            }
+            for review in reviews
+        ],
+        'next': format_review_cursor(next_cursor)
+    })
+
+@api_blueprint.route('/recommend')
+def api_recommend():
+    _, query, filters, page = read_search_params()
+    search_results, recommendations = search_and_recommend(query, filters, page)
+    has_next = has_next_page(search_results, page)
+    if has_next:
+        prefetch(search_movie, query, filters=filters, page=page + 1)
+    return api.json_response({
+        'page': page,
+        'has_next': has_next,
+        'results': api.project_list(search_results),
+        'recommendations': api.project_list(recommendations)
+    })
+
+@api_blueprint.route('/users/me/<category>')
+@api.login_required
+def api_saved_list(category):
+    if category not in ['watchlist', 'favorites']:
+        return api.error("Invalid category.", 404)
+    page = get_page_number()
+    movies, has_next = get_saved_list_page(current_user.id, category, request.args.get('sortby'), page)
+    return api.json_response({'page': page, 'has_next': has_next, 'results': api.project_list(movies)}, private=True)
+
+@api_blueprint.route('/users/me/lists/bulk', methods=['POST'])
+@api.login_required
+def api_bulk_lists():
+    body = request.get_json(silent=True) or {}
+    try:
+        counts = saved_lists.apply_operations(current_user.id, body.get('operations'))
+    except ValueError as e:
+        return api.error(str(e), 400)
+    return jsonify({'changed': counts})
+
+@api_blueprint.route('/users/me/lists/import', methods=['POST'])
+@api.login_required
+def api_import_lists():
+    """Imports a CSV or JSON list, uploaded as the `file` form field or sent as the request body."""
+    default_category = request.args.get('category')
+    if default_category is not None and default_category not in saved_lists.CATEGORIES:
+        return api.error("Invalid category.", 400)
+    upload = request.files.get('file')
+    # Uploads are spooled to disk by Werkzeug and both are read incrementally
+    stream = io.TextIOWrapper(upload.stream if upload else request.stream, encoding='utf-8-sig', newline='')
+    name = upload.filename if upload else ''
+    mimetype = upload.mimetype if upload else request.mimetype
+    is_json = request.args.get('format', 'json' if 'json' in mimetype or name.endswith('.json') else 'csv') == 'json'
+    try:
+        rows = saved_lists.iter_json_rows(stream) if is_json else saved_lists.iter_csv_rows(stream)
+        counts = saved_lists.import_rows(current_user.id, rows, default_category)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return api.error(f"Could not import list: {e}", 400)
+    return jsonify(counts)
+
+@api_blueprint.route('/users/me/lists/export')
+@api.login_required
+def api_export_lists():
+    category = request.args.get('category')
+    if category is not None and category not in saved_lists.CATEGORIES:
+        return api.error("Invalid category.", 400)
+    export_format = request.args.get('format', 'json')
+    if export_format not in ('csv', 'json'):
+        return api.error("Invalid format.", 400)
+    chunks = (saved_lists.export_csv if export_format == 'csv' else saved_lists.export_json)(current_user.id, category)
+    response = Response(
+        stream_with_context(chunks),
+        mimetype='text/csv' if export_format == 'csv' else 'application/json'
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename="{category or "lists"}.{export_format}"'
+    response.cache_control.private = True
+    response.cache_control.no_store = True
+    return response
+
+@api_blueprint.route('/users/me/for-you')
+@api.login_required
+def api_for_you():
+    return api.json_response({'results': api.project_list(get_for_you_movies(current_user.id))}, private=True)
+
+app.register_blueprint(api_blueprint)
+
+# Workers import the ML stack and recommendation indexes on their first movie
+# page; set RECOMMENDER_WARMUP=1 to load them at start-up instead
+if os.environ.get('RECOMMENDER_WARMUP') == '1':
+    recommendation.warm_up()
 
 # Start the Flask app
 if __name__ == '__main__':
+    # Deployments create and upgrade tables with `python initialize_db.py`;
+    # the development server creates missing ones itself
+    with app.app_context():
+        db.create_all()
     app.run(debug=True, port=5004)
@@ -0,0 +1,175 @@
+# bench/ann_recall.py
+"""Recall and latency of the approximate nearest-neighbour index against exact cosine.
+
+Builds the TF-IDF content index and the ANN index over a synthetic catalog
+(or a JSON catalog file) in a temporary directory, then queries both with
+the same movies:
+
+    python bench/ann_recall.py --movies 200000
+    python bench/ann_recall.py --movies 50000 --probes 0 4 8 16 --tables 8 16
+    python bench/ann_recall.py --catalog movies.json --json ann.json
+
+Reports recall@k of the served path (hash shortlist re-ranked by exact
+TF-IDF cosine) against the exact TF-IDF ranking, recall of the hash
+search alone against exact search in the reduced space, the share of the
+catalog each query scored, and p50/p95 latency of exact and approximate
+queries. Finally checks that rebuilding the content index alone, which
+leaves the ANN index projecting the old vocabulary, still serves
+recommendations by exact scoring.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def make_catalog(count, vocabulary=30000, topics=300, seed=42):
+    """Builds `count` movies whose overviews mix a few of `topics` word distributions.
+
+    Real overviews cluster by subject, which is the structure nearest-neighbour
+    search exploits; uniformly random words would make every movie equally
+    (dis)similar.
+    """
+    rng = np.random.default_rng(seed)
+    words = [f'w{n}' for n in range(vocabulary)]
+    # Each topic favours its own slice of the vocabulary, with Zipf-like weights
+    topic_words = [rng.choice(vocabulary, 400, replace=False) for _ in range(topics)]
+    weights = 1.0 / np.arange(1, 401)
+    weights /= weights.sum()
+    genres = [f'Genre{n}' for n in range(20)]
+    movies = []
+    for movie_id in range(1, count + 1):
+        chosen = rng.choice(topics, rng.integers(1, 4), replace=False)
+        length = int(rng.integers(20, 60))
+        overview = ' '.join(words[w] for topic in chosen for w in rng.choice(topic_words[topic], length // len(chosen), p=weights))
+        movies.append({
+            'id': movie_id,
+            'title': f'Movie {movie_id}',
+            'overview': overview,
+            'genres': [genres[topic % len(genres)] for topic in chosen],
+            'vote_average': 5.0,
+            'poster_path': None,
+        })
+    return movies
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))] if ordered else 0.0
+
+
+def check_content_rebuild(movies, workdir, k=10):
+    """Builds the serving content and ANN indexes, rebuilds only the content index, and queries it."""
+    import ann
+    import recommendation
+    content_dir = os.path.join(workdir, 'rebuild-content')
+    recommendation.build_content_index(movies, content_dir)
+    content = recommendation.ContentIndex.load(content_dir)
+    ann.build_index(content.matrix, content.ids, ann.INDEX_DIR, content_version=content.version)
+    assert content.ann_index() is not None, "ANN index built from the content index was not used"
+
+    # A different vocabulary, as after catalog edits
+    recommendation.build_content_index([dict(movie, overview=movie['overview'] + ' rebuilt') for movie in movies], content_dir)
+    rebuilt = recommendation.ContentIndex.load(content_dir)
+    assert rebuilt.ann_index() is None, "ANN index from the previous content build was used"
+    found = rebuilt.similar(int(rebuilt.ids[0]), k)
+    assert found, "No recommendations after rebuilding the content index"
+    print(f"Content rebuild without ANN rebuild: {len(found)} recommendations by exact scoring")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ANN index against exact cosine.")
+    parser.add_argument('--movies', type=int, default=100000)
+    parser.add_argument('--catalog', help="JSON file with a list of movies instead of a synthetic catalog.")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--dimensions', type=int, default=128)
+    parser.add_argument('--tables', type=int, nargs='*', default=[16])
+    parser.add_argument('--bits', type=int, help="Bits per hash (default: chosen from the catalog size).")
+    parser.add_argument('--probes', type=int, nargs='*', default=[0, 4, 8, 16])
+    parser.add_argument('--rerank', type=int, nargs='*', default=[1, 10, 20], help="Candidates re-ranked per result.")
+    parser.add_argument('--json', help="Write results to this file.")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='ann-bench-')
+    # No serving index, so the content index's own ranking stays exact
+    os.environ['ANN_INDEX_DIR'] = os.path.join(workdir, 'serving')
+    import ann
+    import recommendation
+    if args.catalog:
+        with open(args.catalog) as f:
+            movies = json.load(f)
+    else:
+        movies = make_catalog(args.movies)
+    started = time.perf_counter()
+    recommendation.build_content_index(movies, os.path.join(workdir, 'content'))
+    content = recommendation.ContentIndex.load(os.path.join(workdir, 'content'))
+    print(f"TF-IDF index: {content.matrix.shape[0]} movies, {content.matrix.shape[1]} terms, {time.perf_counter() - started:.1f}s")
+
+    rng = random.Random(args.seed)
+    queries = rng.sample(content.ids.tolist(), min(args.queries, len(content.ids)))
+    exact, exact_times = {}, []
+    for movie_id in queries:
+        started = time.perf_counter()
+        exact[movie_id] = [rec['id'] for rec in content._top_k(content.matrix[content.rows[movie_id]], args.k, exclude=movie_id)]
+        exact_times.append(time.perf_counter() - started)
+    print(f"Exact TF-IDF: p50 {percentile(exact_times, 0.5) * 1000:.2f} ms, p95 {percentile(exact_times, 0.95) * 1000:.2f} ms")
+
+    results = {'exact': {'p50_ms': round(percentile(exact_times, 0.5) * 1000, 3), 'p95_ms': round(percentile(exact_times, 0.95) * 1000, 3)}}
+    print(f"{'tables':>6}{'bits':>6}{'probes':>8}{'rerank':>8}{'recall':>8}{'reduced':>9}{'scored %':>10}{'p50 ms':>9}{'p95 ms':>9}")
+    for tables in args.tables:
+        index_dir = os.path.join(workdir, f'ann{tables}')
+        started = time.perf_counter()
+        ann.build_index(content.matrix, content.ids, index_dir, dimensions=args.dimensions, tables=tables, bits=args.bits)
+        build_s = time.perf_counter() - started
+        index = ann.ANNIndex.load(index_dir)
+        reduced = {movie_id: [found for found, _ in index.exact(index.vector(movie_id), args.k, exclude=movie_id)] for movie_id in queries}
+        for probes in args.probes:
+            scored, recall_reduced = [], []
+            for movie_id in queries:
+                query = index.vector(movie_id)
+                scored.append(len(index.candidates(query, probes)) / len(index))
+                found = [found for found, _ in index.search(query, args.k, exclude=movie_id, probes=probes)]
+                recall_reduced.append(len(set(found) & set(reduced[movie_id])) / max(1, len(reduced[movie_id])))
+            for rerank in args.rerank:
+                # The path ContentIndex serves: shortlist, then exact TF-IDF re-ranking
+                ann.RERANK = rerank
+                times, recall = [], []
+                for movie_id in queries:
+                    started = time.perf_counter()
+                    found = [rec['id'] for rec in content._ann_top_k(index, content.matrix[content.rows[movie_id]], args.k, exclude=movie_id, probes=probes)]
+                    times.append(time.perf_counter() - started)
+                    recall.append(len(set(found) & set(exact[movie_id])) / max(1, len(exact[movie_id])))
+                result = {
+                    'tables': tables,
+                    'bits': index.meta['bits'],
+                    'probes': probes,
+                    'rerank': rerank,
+                    'build_s': round(build_s, 1),
+                    'recall': round(float(np.mean(recall)), 3),
+                    'recall_reduced': round(float(np.mean(recall_reduced)), 3),
+                    'scored_pct': round(float(np.mean(scored)) * 100, 2),
+                    'p50_ms': round(percentile(times, 0.5) * 1000, 3),
+                    'p95_ms': round(percentile(times, 0.95) * 1000, 3),
+                }
+                results[f'tables={tables},probes={probes},rerank={rerank}'] = result
+                print(f"{tables:>6}{result['bits']:>6}{probes:>8}{rerank:>8}{result['recall']:>8}{result['recall_reduced']:>9}{result['scored_pct']:>10}{result['p50_ms']:>9}{result['p95_ms']:>9}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
+
+    ann.MIN_MOVIES = 0
+    check_content_rebuild(movies[:2000], workdir, args.k)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+# bench/fake_tmdb.py
+"""Local stand-in for the TMDB API used by the benchmarks.
+
+Serves deterministic synthetic fixtures for every endpoint the app uses,
+with configurable latency and error injection, and counts calls per
+endpoint so benchmarks can report upstream traffic.
+
+    python bench/fake_tmdb.py --port 8765 --latency-ms 80 --error-rate 0.01
+
+then point the app at it with TMDB_BASE_URL=http://127.0.0.1:8765/3.
+GET /__stats returns the call counts and POST /__reset clears them.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+GENRES = [
+    (28, 'Action'), (12, 'Adventure'), (16, 'Animation'), (35, 'Comedy'), (80, 'Crime'),
+    (99, 'Documentary'), (18, 'Drama'), (10751, 'Family'), (14, 'Fantasy'), (36, 'History'),
+    (27, 'Horror'), (10402, 'Music'), (9648, 'Mystery'), (10749, 'Romance'), (878, 'Science Fiction'),
+    (53, 'Thriller'), (10752, 'War'), (37, 'Western'),
+]
+
+TITLE_WORDS = (
+    'dark night star war love lost city dream ocean king ghost family river iron shadow '
+    'last first secret empire storm silent golden broken wild midnight frozen hidden'
+).split()
+
+OVERVIEW_WORDS = (
+    'a young detective uncovers conspiracy across the galaxy while an unlikely hero must '
+    'save family from ancient evil journey through time revenge betrayal friendship war '
+    'heist mystery island kingdom robot love story survival escape prison music band'
+).split()
+
+LANGUAGES = ['en', 'en', 'en', 'fr', 'es', 'ja', 'ko', 'de']
+
+PAGE_SIZE = 20
+
+
+def make_movies(count, seed=42):
+    """Builds `count` deterministic synthetic movies in TMDB's detail payload shape."""
+    rng = random.Random(seed)
+    movies = {}
+    for movie_id in range(1, count + 1):
+        genres = rng.sample(GENRES, rng.randint(1, 3))
+        year = rng.randint(1970, 2024)
+        movies[movie_id] = {
+            'id': movie_id,
+            'title': ' '.join(rng.choice(TITLE_WORDS).title() for _ in range(rng.randint(1, 4))) + f' {movie_id}',
+            'overview': ' '.join(rng.choice(OVERVIEW_WORDS) for _ in range(rng.randint(15, 40))),
+            'release_date': f'{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+            'vote_average': round(rng.uniform(3, 9.5), 1),
+            'vote_count': rng.randint(0, 20000),
+            'popularity': round(rng.paretovariate(1.5), 3),
+            'original_language': rng.choice(LANGUAGES),
+            'poster_path': f'/poster{movie_id}.jpg',
+            'backdrop_path': f'/backdrop{movie_id}.jpg',
+            'genres': [{'id': genre_id, 'name': name} for genre_id, name in genres],
+            'runtime': rng.randint(80, 180),
+        }
+    return movies
+
+
+def list_entry(movie):
+    """Projects a detail payload to the shape TMDB uses in list results."""
+    entry = {key: value for key, value in movie.items() if key not in ('genres', 'runtime')}
+    entry['genre_ids'] = [genre['id'] for genre in movie['genres']]
+    return entry
+
+
+class FakeTMDB:
+    """Routes TMDB-style requests to fixture data."""
+
+    def __init__(self, movie_count=5000, latency_ms=0, jitter_ms=0, error_rate=0.0, rate_limit_rate=0.0, seed=42):
+        self.movies = make_movies(movie_count, seed)
+        self.by_popularity = sorted(self.movies.values(), key=lambda movie: -movie['popularity'])
+        self.by_rating = sorted(self.movies.values(), key=lambda movie: -movie['vote_average'])
+        self.by_date = sorted(self.movies.values(), key=lambda movie: movie['release_date'], reverse=True)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+
+    def handle(self, path, query):
+        """Returns `(status, payload)` for a request path and parsed query string."""
+        endpoint = re.sub(r'/\d+', '/{id}', path)
+        with self._lock:
+            self.calls[endpoint] += 1
+            roll = self._rng.random()
+            delay = max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+        time.sleep(delay)
+        if roll < self.rate_limit_rate:
+            return 429, {'status_message': 'Rate limit exceeded'}
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 503, {'status_message': 'Injected error'}
+
+        page = int(query.get('page', ['1'])[0])
+        path = path[2:] if path.startswith('/3') else path
+        if path == '/genre/movie/list':
+            return 200, {'genres': [{'id': genre_id, 'name': name} for genre_id, name in GENRES]}
+        if path in ('/trending/movie/week', '/movie/popular'):
+            return 200, self._page(self.by_popularity, page)
+        if path == '/movie/top_rated':
+            return 200, self._page(self.by_rating, page)
+        if path == '/movie/now_playing':
+            return 200, self._page(self.by_date, page)
+        if path == '/discover/movie':
+            return 200, self._page(self._discover(query), page)
+        if path == '/search/movie':
+            term = query.get('query', [''])[0].lower()
+            matches = [movie for movie in self.by_popularity if term and term in movie['title'].lower()]
+            return 200, self._page(matches, page)
+        if path == '/movie/changes':
+            changed = [{'id': movie_id} for movie_id in sorted(self.movies)[:: max(1, len(self.movies) // 100)]]
+            return 200, {'results': changed, 'page': 1, 'total_pages': 1, 'total_results': len(changed)}
+        match = re.fullmatch(r'/movie/(\d+)(/recommendations)?', path)
+        if match:
+            movie = self.movies.get(int(match.group(1)))
+            if movie is None:
+                return 404, {'status_message': 'The resource you requested could not be found.'}
+            if match.group(2):
+                start = movie['id'] % max(1, len(self.movies) - PAGE_SIZE)
+                return 200, self._page(self.by_popularity[start:start + PAGE_SIZE * 3], page)
+            return 200, movie
+        return 404, {'status_message': 'Unknown endpoint'}
+
+    def _discover(self, query):
+        def arg(name, default=None):
+            return query.get(name, [default])[0]
+
+        movies = self.by_popularity
+        if arg('primary_release_date.gte'):
+            movies = [movie for movie in movies if movie['release_date'] >= arg('primary_release_date.gte')]
+        if arg('primary_release_date.lte'):
+            movies = [movie for movie in movies if movie['release_date'] <= arg('primary_release_date.lte')]
+        if arg('vote_average.gte'):
+            movies = [movie for movie in movies if movie['vote_average'] >= float(arg('vote_average.gte'))]
+        if arg('vote_average.lte'):
+            movies = [movie for movie in movies if movie['vote_average'] <= float(arg('vote_average.lte'))]
+        if arg('with_genres'):
+            wanted = {int(genre) for genre in arg('with_genres').split(',')}
+            movies = [movie for movie in movies if wanted <= {genre['id'] for genre in movie['genres']}]
+        if arg('with_original_language'):
+            movies = [movie for movie in movies if movie['original_language'] == arg('with_original_language')]
+        field, _, direction = arg('sort_by', 'popularity.desc').partition('.')
+        if field in ('popularity', 'vote_average', 'release_date', 'title'):
+            movies = sorted(movies, key=lambda movie: movie[field], reverse=direction == 'desc')
+        return movies
+
+    def _page(self, movies, page):
+        start = (page - 1) * PAGE_SIZE
+        return {
+            'page': page,
+            'results': [list_entry(movie) for movie in movies[start:start + PAGE_SIZE]],
+            'total_pages': max(1, -(-len(movies) // PAGE_SIZE)),
+            'total_results': len(movies),
+        }
+
+    def stats(self):
+        with self._lock:
+            return dict(self.calls)
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/__stats':
+                self._send(200, fake.stats())
+            else:
+                self._send(*fake.handle(url.path, parse_qs(url.query)))
+
+        def do_POST(self):
+            if urlparse(self.path).path == '/__reset':
+                fake.reset()
+                self._send(200, {})
+            else:
+                self._send(404, {})
+
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            if status == 429:
+                self.send_header('Retry-After', '0')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def start_server(fake, host='127.0.0.1', port=0):
+    """Starts the fake TMDB server on a background thread and returns it with its base URL."""
+    server = _Server((host, port), make_handler(fake))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}/3'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the fake TMDB server.")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--movies', type=int, default=5000, help="Number of fixture movies.")
+    parser.add_argument('--latency-ms', type=float, default=80, help="Mean added latency per call.")
+    parser.add_argument('--jitter-ms', type=float, default=20, help="Uniform jitter around the latency.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of calls answered with 503.")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="Fraction of calls answered with 429.")
+    args = parser.parse_args()
+
+    fake = FakeTMDB(args.movies, args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit_rate)
+    server, base_url = start_server(fake, port=args.port)
+    print(f"Fake TMDB serving {args.movies} movies at {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,227 @@
+# bench/run.py
+"""Load and latency benchmark for the main routes, fully offline.
+
+Starts the fake TMDB server, seeds a throwaway SQLite database, serves the
+app in-process and drives each route at the given concurrency:
+
+    python bench/run.py --scale small --concurrency 16 --requests 200
+    python bench/run.py --json results.json
+    python bench/run.py --baseline results.json --max-regression 0.2
+
+Reports throughput, p50/p95/p99 latency, TMDB calls per request and, for
+the in-process app, database statements per request for each route. With --baseline it exits non-zero when a route's p95 latency grew by
+more than --max-regression, so it can gate changes in CI. Pass --url and
+--tmdb-url to benchmark an app already running (e.g. under gunicorn)
+against a fake TMDB started with bench/fake_tmdb.py.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_tmdb import FakeTMDB, start_server  # noqa: E402
+import seed as seeding  # noqa: E402
+
+PREFIXES = ['da', 'sta', 'lov', 'gho', 'iron', 'the', 'mid', 'sec', 'gol', 'riv']
+
+
+def route_specs(movie_count, users):
+    """Returns the benchmarked routes as name -> (needs_login, request builder)."""
+    def movie_id(rng):
+        # Skew towards popular IDs the way real traffic does
+        return min(movie_count, int(rng.paretovariate(1.2) * 10))
+
+    return {
+        '/': (False, lambda rng: ('GET', '/', None)),
+        '/recommend': (False, lambda rng: ('POST', '/recommend', {'movie_title': rng.choice(PREFIXES)})),
+        '/movie/<id>': (False, lambda rng: ('GET', f'/movie/{movie_id(rng)}', None)),
+        '/watchlist': (True, lambda rng: ('GET', '/watchlist', None)),
+        '/autocomplete': (False, lambda rng: ('GET', f'/autocomplete?q={rng.choice(PREFIXES)}{rng.choice("aeiou ")}', None)),
+        '/autocomplete+login': (True, lambda rng: ('GET', f'/autocomplete?q={rng.choice(PREFIXES)}{rng.choice("aeiou ")}', None)),
+    }
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def login(session, base_url, users, rng):
+    username = f'bench{rng.randrange(users)}'
+    session.post(f'{base_url}/auth/login', data={'username': username, 'password': seeding.PASSWORD}, allow_redirects=False)
+
+
+def drive(base_url, build, needs_login, total, concurrency, users, seed):
+    """Issues `total` requests from `concurrency` workers; returns latencies and error count."""
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    remaining = iter(range(total))
+
+    def worker(worker_id):
+        nonlocal errors
+        rng = random.Random(seed * 1000 + worker_id)
+        session = requests.Session()
+        if needs_login:
+            login(session, base_url, users, rng)
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    return
+            method, path, data = build(rng)
+            start = time.perf_counter()
+            try:
+                response = session.request(method, f'{base_url}{path}', data=data, allow_redirects=False, timeout=60)
+                ok = response.status_code < 400
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                errors += not ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def upstream_calls(fake, tmdb_url):
+    if fake is not None:
+        return sum(fake.stats().values())
+    return sum(requests.get(f'{tmdb_url.rsplit("/3", 1)[0]}/__stats').json().values())
+
+
+class StatementCounter:
+    """Counts SQL statements the in-process app sends to the database."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, *args):
+        with self._lock:
+            self.count += 1
+
+
+def start_app(args, tmdb_url):
+    """Seeds a temporary database and serves the app on a background thread."""
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'TMDB_BASE_URL': tmdb_url,
+        'TMDB_RATE_LIMIT': '100000',
+        'CONTENT_INDEX_DIR': os.path.join(workdir, 'content_index'),
+        'CACHE_BACKEND': 'memory',
+    })
+    import logging
+    from sqlalchemy import event
+    from werkzeug.serving import make_server
+    from app import app, db
+    from fake_tmdb import make_movies
+    import recommendation
+
+    with app.app_context():
+        db.create_all()
+        users = seeding.seed(args.scale, args.movies)
+    if not args.no_index:
+        recommendation.build_content_index(make_movies(args.movies).values(), os.environ['CONTENT_INDEX_DIR'])
+
+    statements = StatementCounter()
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', statements)
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', users, statements
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the app's main routes offline.")
+    parser.add_argument('--scale', choices=sorted(seeding.SCALES), default='small')
+    parser.add_argument('--movies', type=int, default=5000)
+    parser.add_argument('--routes', nargs='*', help="Subset of routes to run (default: all).")
+    parser.add_argument('--requests', type=int, default=200, help="Measured requests per route.")
+    parser.add_argument('--warmup', type=int, default=20, help="Unmeasured requests per route first.")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency-ms', type=float, default=80)
+    parser.add_argument('--jitter-ms', type=float, default=20)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--no-index', action='store_true', help="Do not build the content index.")
+    parser.add_argument('--url', help="Benchmark an already running app instead of an in-process one.")
+    parser.add_argument('--tmdb-url', help="Fake TMDB base URL used by the app given with --url.")
+    parser.add_argument('--users', type=int, default=seeding.SCALES['small'][0], help="Seeded users, with --url.")
+    parser.add_argument('--json', help="Write results to this file.")
+    parser.add_argument('--baseline', help="Results file to compare p95 latency against.")
+    parser.add_argument('--max-regression', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.url:
+        fake, tmdb_url, base_url, users, statements = None, args.tmdb_url, args.url, args.users, None
+    else:
+        fake = FakeTMDB(args.movies, args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit_rate)
+        _, tmdb_url = start_server(fake)
+        base_url, users, statements = start_app(args, tmdb_url)
+
+    specs = route_specs(args.movies, users)
+    results = {}
+    print(f"{'route':<16}{'reqs':>6}{'errors':>8}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'tmdb/req':>10}{'db/req':>8}")
+    for name, (needs_login, build) in specs.items():
+        if args.routes and name not in args.routes:
+            continue
+        drive(base_url, build, needs_login, args.warmup, args.concurrency, users, args.seed + 1)
+        before = upstream_calls(fake, tmdb_url)
+        statements_before = statements.count if statements else 0
+        latencies, errors, elapsed = drive(base_url, build, needs_login, args.requests, args.concurrency, users, args.seed)
+        calls = upstream_calls(fake, tmdb_url) - before
+        # Includes the logins of the measuring sessions, one per worker on login routes
+        queries = statements.count - statements_before if statements else None
+        results[name] = {
+            'requests': len(latencies),
+            'errors': errors,
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+            'upstream_per_request': round(calls / max(1, len(latencies)), 2),
+            'db_per_request': round(queries / max(1, len(latencies)), 2) if queries is not None else None,
+        }
+        r = results[name]
+        print(f"{name:<16}{r['requests']:>6}{r['errors']:>8}{r['rps']:>9}{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}{r['upstream_per_request']:>10}{r['db_per_request'] if r['db_per_request'] is not None else '-':>8}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'config': vars(args), 'routes': results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['routes']
+        regressions = [
+            f"{name}: p95 {baseline[name]['p95_ms']} -> {result['p95_ms']} ms"
+            for name, result in results.items()
+            if name in baseline and result['p95_ms'] > baseline[name]['p95_ms'] * (1 + args.max_regression)
+        ]
+        if regressions:
+            print("Regressions over {:.0%}:".format(args.max_regression))
+            print('\n'.join(f"  {line}" for line in regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
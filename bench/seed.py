@@ -0,0 +1,74 @@
+# bench/seed.py
+"""Seeds a database with synthetic users, list entries and reviews for benchmarks.
+
+    DATABASE_URL=sqlite:////tmp/bench.db python bench/seed.py --scale medium
+
+Every seeded user is named `benchN` with the password `password`.
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# (users, list entries per user, reviews per user) for each scale
+SCALES = {
+    'small': (100, 20, 5),
+    'medium': (1000, 100, 20),
+    'large': (10000, 200, 50),
+}
+
+PASSWORD = 'password'
+
+
+def seed(scale='small', movie_count=5000, seed_value=7):
+    """Fills the configured database; must run inside the app context."""
+    from werkzeug.security import generate_password_hash
+    from models import db, User, UserMovies, Review, MovieRatingSummary
+
+    users, entries_per_user, reviews_per_user = SCALES[scale]
+    rng = random.Random(seed_value)
+    # Hashing is deliberately slow, so every user shares one precomputed hash
+    password_hash = generate_password_hash(PASSWORD)
+
+    db.session.execute(User.__table__.insert(), [
+        {'username': f'bench{n}', 'password_hash': password_hash} for n in range(users)
+    ])
+    user_ids = dict(db.session.execute(db.select(User.username, User.id)).all())
+
+    now = datetime.utcnow()
+    for n in range(users):
+        user_id = user_ids[f'bench{n}']
+        picks = rng.sample(range(1, movie_count + 1), entries_per_user)
+        db.session.execute(UserMovies.__table__.insert(), [
+            {'user_id': user_id, 'movie_id': movie_id, 'category': 'watchlist' if i % 3 else 'favorites'}
+            for i, movie_id in enumerate(picks)
+        ])
+        db.session.execute(Review.__table__.insert(), [
+            {
+                'user_id': user_id,
+                'movie_id': rng.randint(1, min(movie_count, 500)),
+                'rating': round(rng.uniform(1, 10), 1),
+                'review_text': 'Synthetic benchmark review.',
+                'created_at': now - timedelta(minutes=rng.randint(0, 60 * 24 * 365))
+            }
+            for _ in range(reviews_per_user)
+        ])
+    db.session.commit()
+    MovieRatingSummary.rebuild()
+    return users
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Seed a benchmark database.")
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--movies', type=int, default=5000, help="Movie IDs to draw from; match the fake TMDB.")
+    args = parser.parse_args()
+
+    from app import app, db
+    with app.app_context():
+        db.create_all()
+        count = seed(args.scale, args.movies)
+    print(f"Seeded {count} users at scale '{args.scale}' into {app.config['SQLALCHEMY_DATABASE_URI']}.")
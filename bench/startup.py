@@ -0,0 +1,139 @@
+# bench/startup.py
+"""Worker cold-start benchmark: import time, memory and first-request latency.
+
+Each run imports the app in a fresh interpreter, the way a pre-fork server
+starts a worker, against a fake TMDB and a throwaway SQLite database:
+
+    python bench/startup.py --runs 5
+    python bench/startup.py --warmup          # with RECOMMENDER_WARMUP=1
+    python bench/startup.py --json startup.json
+    python bench/startup.py --baseline startup.json --max-regression 0.2
+
+Reports the median time to import the app, resident memory after the
+import and after the first home and movie pages, the latency of those
+first pages, and whether the ML stack (scikit-learn, pandas) was loaded.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+METRICS = ('import_ms', 'rss_import_mb', 'first_page_ms', 'first_movie_ms', 'rss_serving_mb')
+
+
+def rss_mb():
+    """Returns this process's resident memory in MB."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    import resource
+    # Peak rather than current RSS where /proc is not available
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20, 1)
+
+
+def child(movies):
+    """Runs in the fresh interpreter: imports the app, serves two pages and prints the measurements."""
+    from fake_tmdb import FakeTMDB, start_server
+    _, os.environ['TMDB_BASE_URL'] = start_server(FakeTMDB(movies, latency_ms=0, jitter_ms=0))
+
+    started = time.perf_counter()
+    from app import app, db
+    result = {'import_ms': (time.perf_counter() - started) * 1000, 'rss_import_mb': rss_mb()}
+    result['ml_loaded_at_import'] = 'sklearn' in sys.modules or 'pandas' in sys.modules
+
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+    started = time.perf_counter()
+    client.get('/')
+    result['first_page_ms'] = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    client.get('/movie/1')
+    result['first_movie_ms'] = (time.perf_counter() - started) * 1000
+    result['rss_serving_mb'] = rss_mb()
+    result['ml_loaded_serving'] = 'sklearn' in sys.modules or 'pandas' in sys.modules
+    print(json.dumps(result))
+
+
+def run_once(args, workdir, index_dir):
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+        CONTENT_INDEX_DIR=index_dir,
+        CF_INDEX_DIR=os.path.join(workdir, 'cf_index'),
+        BACKGROUND_REFRESH='off',
+        TMDB_RATE_LIMIT='100000',
+    )
+    if args.warmup:
+        env['RECOMMENDER_WARMUP'] = '1'
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', '--movies', str(args.movies)],
+        env=env, cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure worker cold start.")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--movies', type=int, default=2000)
+    parser.add_argument('--warmup', action='store_true', help="Start workers with RECOMMENDER_WARMUP=1.")
+    parser.add_argument('--no-index', action='store_true', help="Do not build the content index.")
+    parser.add_argument('--json', help="Write results to this file.")
+    parser.add_argument('--baseline', help="Results file to compare against.")
+    parser.add_argument('--max-regression', type=float, default=0.2)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.movies)
+        return
+
+    workdir = tempfile.mkdtemp(prefix='startup-bench-')
+    index_dir = os.path.join(workdir, 'content_index')
+    if not args.no_index:
+        from fake_tmdb import make_movies
+        import recommendation
+        recommendation.build_content_index(make_movies(args.movies).values(), index_dir)
+
+    runs = [run_once(args, workdir, index_dir) for _ in range(args.runs)]
+    results = {name: round(statistics.median(run[name] for run in runs), 1) for name in METRICS}
+    results['ml_loaded_at_import'] = any(run['ml_loaded_at_import'] for run in runs)
+    results['ml_loaded_serving'] = any(run['ml_loaded_serving'] for run in runs)
+    for name in METRICS:
+        print(f"{name:<18}{results[name]:>10}")
+    print(f"{'ML stack loaded':<18}{'at import' if results['ml_loaded_at_import'] else 'serving' if results['ml_loaded_serving'] else 'never':>10}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = [
+            f"{name}: {baseline[name]} -> {results[name]}"
+            for name in METRICS
+            if name in baseline and results[name] > baseline[name] * (1 + args.max_regression)
+        ]
+        if regressions:
+            print("Regressions over {:.0%}:".format(args.max_regression))
+            print('\n'.join(f"  {line}" for line in regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
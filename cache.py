@@ -0,0 +1,328 @@
+import inspect
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from functools import wraps
+import instrumentation
+
+# Per-endpoint counters kept by ResponseCache
+COUNTERS = ('hits', 'misses', 'stale_hits', 'stale_errors', 'refreshes', 'evictions')
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBackend:
+    """In-process LRU backend holding at most `max_entries` entries."""
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the (value, expires_at) pair for a key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def expires_at(self, key):
+        """Returns when a key's entry expires, or None, without counting as a use."""
+        entry = self._entries.get(key)
+        return entry[1] if entry is not None else None
+
+    def set(self, key, value, expires_at):
+        """Stores an entry and returns how many entries were evicted to make room."""
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """Local-disk LRU backend that survives restarts. Values are stored as JSON."""
+
+    # Seconds between access-time bumps for an entry; eviction order only
+    # needs this resolution, and hits stay read-only in the common case
+    TOUCH_INTERVAL = 3600
+
+    def __init__(self, path, max_entries=20000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+            'expires_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_accessed_at ON cache (accessed_at)')
+        conn.commit()
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads, so keep one per thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connection()
+        row = conn.execute('SELECT value, expires_at, accessed_at FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if row[2] < now - self.TOUCH_INTERVAL:
+            with self._write_lock:
+                conn.execute('UPDATE cache SET accessed_at = ? WHERE key = ?', (now, key))
+                conn.commit()
+        return json.loads(row[0]), row[1]
+
+    def expires_at(self, key):
+        row = self._connection().execute('SELECT expires_at FROM cache WHERE key = ?', (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def set(self, key, value, expires_at):
+        conn = self._connection()
+        with self._write_lock:
+            conn.execute(
+                'INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value), expires_at, time.time())
+            )
+            overflow = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0] - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    'DELETE FROM cache WHERE key IN '
+                    '(SELECT key FROM cache ORDER BY accessed_at LIMIT ?)',
+                    (overflow,)
+                )
+            conn.commit()
+        return max(overflow, 0)
+
+    def delete(self, key):
+        conn = self._connection()
+        with self._write_lock:
+            conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+            conn.commit()
+
+    def clear(self):
+        conn = self._connection()
+        with self._write_lock:
+            conn.execute('DELETE FROM cache')
+            conn.commit()
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+
+def make_backend(kind, path, max_entries=None):
+    """Creates a cache backend by name ('memory' or 'sqlite')."""
+    if kind == 'sqlite':
+        return SQLiteBackend(path, max_entries=max_entries or 20000)
+    if kind == 'memory':
+        return MemoryBackend(max_entries=max_entries or 2048)
+    raise ValueError(f"Unknown cache backend: {kind}")
+
+
+class _InFlight:
+    """A fetch in progress that concurrent callers for the same key wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResponseCache:
+    """TTL cache in front of upstream fetchers with single-flight miss handling.
+
+    Concurrent misses for the same key share a single upstream call. Empty
+    results (None or []) are returned but not stored, so a failed upstream
+    call is retried on the next request instead of being cached.
+
+    Expired entries are kept until evicted. Within an endpoint's
+    `stale_ttls` window an expired value is served immediately while
+    `background` refreshes it (stale-while-revalidate), and within
+    `stale_if_error` seconds of expiry it is served when the upstream call
+    fails or comes back empty (stale-if-error).
+    """
+
+    def __init__(self, backend, ttls=None, default_ttl=300, stale_ttls=None, stale_if_error=0, background=None):
+        self.backend = backend
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self.stale_ttls = stale_ttls or {}
+        self.stale_if_error = stale_if_error
+        self.background = background
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+
+    def ttl_for(self, endpoint):
+        return self.ttls.get(endpoint, self.default_ttl)
+
+    def get_or_fetch(self, endpoint, key, fetch):
+        """Returns the cached value for a key, calling `fetch` on a miss."""
+        entry = self.backend.get(key)
+        now = time.time()
+        if entry is not None and entry[1] > now:
+            self._count(endpoint, 'hits')
+            return entry[0]
+        if entry is not None and self.background is not None and now < entry[1] + self.stale_ttls.get(endpoint, 0):
+            self._count(endpoint, 'stale_hits')
+            self.refresh(endpoint, key, fetch, entry=entry)
+            return entry[0]
+
+        call, leader = self._join(key)
+        self._count(endpoint, 'misses' if leader else 'hits')
+        if leader:
+            self._lead(endpoint, key, fetch, call, entry)
+        else:
+            call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.value
+
+    def refresh(self, endpoint, key, fetch, wait=False, entry=None):
+        """Fetches a fresh value for a key unless a fetch is already in flight.
+
+        Runs on the background scheduler unless `wait` is set or none was
+        given. Failures are logged and leave the stored value in place.
+        """
+        call, leader = self._join(key)
+        if not leader:
+            return
+        self._count(endpoint, 'refreshes')
+        entry = entry or self.backend.get(key)
+
+        def run():
+            self._lead(endpoint, key, fetch, call, entry)
+            if call.error is not None:
+                logger.warning("Refreshing %s failed: %s", endpoint, call.error)
+
+        if wait or self.background is None:
+            run()
+        else:
+            self.background(run)
+
+    def expires_at(self, key):
+        """Returns when a key's stored value expires, or None if nothing is stored."""
+        return self.backend.expires_at(key)
+
+    def _join(self, key):
+        # Returns the in-flight fetch for a key and whether the caller must perform it
+        with self._lock:
+            call = self._inflight.get(key)
+            if call is not None:
+                return call, False
+            call = self._inflight[key] = _InFlight()
+            return call, True
+
+    def _lead(self, endpoint, key, fetch, call, entry):
+        try:
+            with instrumentation.span(f'fetch.{endpoint}'):
+                call.value = fetch()
+        except Exception as e:
+            call.error = e
+        try:
+            if call.value:
+                evicted = self.backend.set(key, call.value, time.time() + self.ttl_for(endpoint))
+                if evicted:
+                    self._count(endpoint, 'evictions', evicted)
+            elif entry is not None and time.time() < entry[1] + self.stale_if_error:
+                if call.error is not None:
+                    logger.warning("Serving stale %s after upstream error: %s", endpoint, call.error)
+                self._count(endpoint, 'stale_errors')
+                call.value, call.error = entry[0], None
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            call.done.set()
+
+    def cached(self, endpoint):
+        """Decorator caching a fetcher's results under `endpoint` keyed on its arguments."""
+        def decorator(func):
+            signature = inspect.signature(func)
+
+            def key_for(*args, **kwargs):
+                # Apply defaults so f(), f(1) and f(page=1) share one entry
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                return make_key(endpoint, *bound.args, **bound.kwargs)
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                return self.get_or_fetch(endpoint, key_for(*args, **kwargs), lambda: func(*args, **kwargs))
+
+            def refresh(*args, wait=False, **kwargs):
+                self.refresh(endpoint, key_for(*args, **kwargs), lambda: func(*args, **kwargs), wait=wait)
+
+            wrapper.cached_only = lambda *args, **kwargs: self.lookup(endpoint, key_for(*args, **kwargs))
+            wrapper.stale = lambda *args, **kwargs: self.peek(key_for(*args, **kwargs))
+            wrapper.refresh = refresh
+            wrapper.expires_at = lambda *args, **kwargs: self.expires_at(key_for(*args, **kwargs))
+            return wrapper
+        return decorator
+
+    def lookup(self, endpoint, key):
+        """Returns the unexpired value for a key without fetching, or None."""
+        entry = self.backend.get(key)
+        if entry is not None and entry[1] > time.time():
+            self._count(endpoint, 'hits')
+            return entry[0]
+        return None
+
+    def peek(self, key):
+        """Returns the stored value for a key even if it has expired, or None."""
+        entry = self.backend.get(key)
+        return entry[0] if entry is not None else None
+
+    def _count(self, endpoint, name, amount=1):
+        with self._lock:
+            self._stats[endpoint][name] += amount
+
+    def stats(self):
+        """Returns hit, miss, stale and refresh counters per endpoint plus totals."""
+        with self._lock:
+            endpoints = {name: dict(counters) for name, counters in self._stats.items()}
+        totals = dict.fromkeys(COUNTERS, 0)
+        for counters in endpoints.values():
+            for name in totals:
+                totals[name] += counters[name]
+        served = totals['hits'] + totals['stale_hits']
+        lookups = served + totals['misses']
+        totals['hit_ratio'] = round(served / lookups, 3) if lookups else 0.0
+        totals['entries'] = len(self.backend)
+        return {'endpoints': endpoints, 'totals': totals}
+
+
+def make_key(endpoint, *args, **kwargs):
+    """Builds a stable cache key from an endpoint name and call arguments."""
+    return endpoint + ':' + json.dumps([args, kwargs], sort_keys=True, default=str)
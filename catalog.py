@@ -0,0 +1,198 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+from models import db, dialect_insert, CatalogGenre, CatalogMovie, CatalogList, CatalogSyncState, catalog_movie_genres
+
+# Columns copied from a TMDB movie payload into the catalog
+MOVIE_COLUMNS = (
+    'title', 'overview', 'release_date', 'vote_average', 'vote_count',
+    'popularity', 'original_language', 'poster_path', 'backdrop_path'
+)
+
+BATCH_SIZE = 500
+
+
+@contextmanager
+def _session(session=None, write=False):
+    """Yields `session` if given, else a short-lived one of our own.
+
+    Catalog reads and writes sit right next to TMDB calls, so they use their
+    own session and hand the connection back to the pool as soon as they are
+    done instead of holding it while the request waits on upstream.
+    """
+    if session is not None:
+        yield session
+        return
+    with Session(db.engine) as own_session:
+        yield own_session
+        if write:
+            own_session.commit()
+
+
+def _chunks(items, size=BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def upsert_genres(genres, session=None):
+    """Inserts or renames genres given as TMDB `{'id', 'name'}` dicts."""
+    rows = list({genre['id']: {'id': genre['id'], 'name': genre['name']} for genre in genres}.values())
+    if not rows:
+        return
+    with _session(session, write=True) as session:
+        stmt = dialect_insert(CatalogGenre.__table__).values(rows)
+        session.execute(stmt.on_conflict_do_update(index_elements=['id'], set_={'name': stmt.excluded.name}))
+
+
+def upsert_movies(movies, session=None):
+    """Inserts or refreshes TMDB movie payloads in batches, including their genres.
+
+    List payloads carry only genre IDs. IDs the catalog has not seen yet are
+    stored as unnamed genres, so the movie is linked to them now and the
+    next genre sync fills in their names.
+    """
+    movies = list({movie['id']: movie for movie in movies if movie and movie.get('id')}.values())
+    if not movies:
+        return 0
+
+    with _session(session, write=True) as session:
+        upsert_genres([genre for movie in movies for genre in movie.get('genres') or [] if isinstance(genre, dict)], session)
+        genre_ids = {movie['id']: _genre_ids(movie) for movie in movies}
+        placeholders = [{'id': genre_id, 'name': ''} for genre_id in set().union(*genre_ids.values())]
+        if placeholders:
+            stmt = dialect_insert(CatalogGenre.__table__).values(placeholders)
+            session.execute(stmt.on_conflict_do_nothing(index_elements=['id']))
+        now = datetime.utcnow()
+
+        for batch in _chunks(movies):
+            rows = []
+            for movie in batch:
+                row = {column: movie.get(column) for column in MOVIE_COLUMNS}
+                row['id'] = movie['id']
+                row['title'] = row['title'] or movie.get('original_title') or ''
+                row['release_date'] = row['release_date'] or None
+                row['updated_at'] = now
+                rows.append(row)
+            stmt = dialect_insert(CatalogMovie.__table__).values(rows)
+            session.execute(stmt.on_conflict_do_update(
+                index_elements=['id'],
+                set_={column: stmt.excluded[column] for column in MOVIE_COLUMNS + ('updated_at',)}
+            ))
+
+            links = [
+                {'movie_id': movie['id'], 'genre_id': genre_id}
+                for movie in batch for genre_id in genre_ids[movie['id']]
+            ]
+            session.execute(delete(catalog_movie_genres).where(catalog_movie_genres.c.movie_id.in_([movie['id'] for movie in batch])))
+            if links:
+                session.execute(catalog_movie_genres.insert(), links)
+    return len(movies)
+
+
+def _genre_ids(movie):
+    genre_ids = [genre['id'] for genre in movie.get('genres') or [] if isinstance(genre, dict)] or movie.get('genre_ids') or []
+    return {genre_id for genre_id in genre_ids if isinstance(genre_id, int)}
+
+
+def replace_list(name, movies, session=None):
+    """Stores `movies` as the current ordered contents of a named list."""
+    with _session(session, write=True) as session:
+        upsert_movies(movies, session)
+        session.execute(delete(CatalogList).where(CatalogList.name == name))
+        now = datetime.utcnow()
+        rows = [{'name': name, 'position': position, 'movie_id': movie['id'], 'synced_at': now}
+                for position, movie in enumerate(movies)]
+        if rows:
+            session.execute(CatalogList.__table__.insert(), rows)
+
+
+def get_movie(movie_id, max_age=None):
+    """Returns a catalog movie as a TMDB-shaped dict, or None if it is not stored.
+
+    With `max_age`, a movie last updated more than `max_age` seconds ago is
+    None too, as with `get_list`.
+    """
+    with _session() as session:
+        movie = session.get(CatalogMovie, movie_id)
+        if movie is None or (max_age is not None and movie.updated_at < datetime.utcnow() - timedelta(seconds=max_age)):
+            return None
+        return movie.to_dict()
+
+
+def get_movies(movie_ids, session=None):
+    """Returns the stored movies among `movie_ids` as a dict keyed by ID."""
+    movies = {}
+    with _session(session) as session:
+        for batch in _chunks(list(movie_ids)):
+            for movie in session.execute(select(CatalogMovie).where(CatalogMovie.id.in_(batch))).scalars():
+                movies[movie.id] = movie.to_dict()
+    return movies
+
+
+def get_list(name, max_age, offset=0, limit=None):
+    """Returns a list's movies in order if it was synced within `max_age` seconds, else None.
+
+    `offset` and `limit` select a slice of the list; an empty slice is None too.
+    """
+    query = (
+        select(CatalogList.movie_id, CatalogList.synced_at)
+        .where(CatalogList.name == name)
+        .order_by(CatalogList.position)
+        .offset(offset)
+        .limit(limit)
+    )
+    with _session() as session:
+        entries = session.execute(query).all()
+        if not entries or entries[0].synced_at < datetime.utcnow() - timedelta(seconds=max_age):
+            return None
+        movies = get_movies([entry.movie_id for entry in entries], session)
+    return [movies[entry.movie_id] for entry in entries if entry.movie_id in movies]
+
+
+def get_genres():
+    """Returns all named genres as TMDB `{'id', 'name'}` dicts ordered by name."""
+    with _session() as session:
+        genres = session.execute(select(CatalogGenre).where(CatalogGenre.name != '').order_by(CatalogGenre.name)).scalars()
+        return [{'id': genre.id, 'name': genre.name} for genre in genres]
+
+
+def iter_movies(batch_size=BATCH_SIZE):
+    """Yields every catalog movie as a TMDB-shaped dict without loading the table at once."""
+    query = select(CatalogMovie).order_by(CatalogMovie.id).execution_options(yield_per=batch_size)
+    with _session() as session:
+        for movie in session.execute(query).scalars():
+            yield movie.to_dict()
+
+
+def title_changes(since=None):
+    """Returns `{'id', 'title', 'popularity'}` dicts for movies updated after a Unix timestamp.
+
+    With `since` None every movie is returned. Used to keep the autocomplete
+    index in step with the catalog.
+    """
+    query = select(CatalogMovie.id, CatalogMovie.title, CatalogMovie.popularity, CatalogMovie.vote_count)
+    if since is not None:
+        query = query.where(CatalogMovie.updated_at > datetime.utcfromtimestamp(since))
+    with _session() as session:
+        return [
+            {'id': row.id, 'title': row.title, 'popularity': row.popularity, 'vote_count': row.vote_count}
+            for row in session.execute(query)
+        ]
+
+
+def movie_ids():
+    """Returns the IDs of every movie in the catalog."""
+    with _session() as session:
+        return set(session.execute(select(CatalogMovie.id)).scalars())
+
+
+def get_state(key, default=None):
+    with _session() as session:
+        state = session.get(CatalogSyncState, key)
+        return state.value if state else default
+
+
+def set_state(key, value):
+    with _session(write=True) as session:
+        session.merge(CatalogSyncState(key=key, value=value))
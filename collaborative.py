@@ -0,0 +1,252 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+import numpy as np
+from sqlalchemy import select
+
+import instrumentation
+from models import db, UserMovies, Review
+
+# Directory holding the item-item neighbour index built by `build_index`
+INDEX_DIR = os.environ.get('CF_INDEX_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'cf_index'))
+
+# Implicit-feedback weight of each saved list; reviews weigh by rating instead
+LIST_WEIGHTS = {'watchlist': 1.0, 'favorites': 2.0}
+
+# Neighbours kept per movie, and movies scored per product when building
+NEIGHBOURS = int(os.environ.get('CF_NEIGHBOURS', 50))
+BLOCK_SIZE = 2048
+
+# Rows fetched per round trip while streaming interactions
+BATCH_SIZE = 50000
+
+
+def review_weight(ratings):
+    """Maps 0-10 ratings to weights: 0 up to a 5, rising to 2 for a 10. Poor ratings carry no taste signal."""
+    return np.clip((np.asarray(ratings, dtype=np.float32) - 5.0) / 2.5, 0.0, 2.0)
+
+
+def iter_interactions(user_id=None, batch_size=BATCH_SIZE):
+    """Yields (user_ids, movie_ids, weights) array chunks from saved lists and reviews.
+
+    Rows are streamed `batch_size` at a time so a rebuild never holds more
+    than the compact arrays in memory. With `user_id` only that user's rows
+    are read.
+    """
+    lists = select(UserMovies.user_id, UserMovies.movie_id, UserMovies.category)
+    reviews = select(Review.user_id, Review.movie_id, Review.rating).where(Review.rating > 5)
+    if user_id is not None:
+        lists = lists.where(UserMovies.user_id == user_id)
+        reviews = reviews.where(Review.user_id == user_id)
+
+    for rows in db.session.execute(lists.execution_options(yield_per=batch_size)).partitions():
+        users, movies, categories = zip(*rows)
+        weights = np.array([LIST_WEIGHTS.get(category, 1.0) for category in categories], dtype=np.float32)
+        yield np.array(users, dtype=np.int64), np.array(movies, dtype=np.int64), weights
+    for rows in db.session.execute(reviews.execution_options(yield_per=batch_size)).partitions():
+        users, movies, ratings = zip(*rows)
+        yield np.array(users, dtype=np.int64), np.array(movies, dtype=np.int64), review_weight(ratings)
+
+
+def user_profile(user_id):
+    """Returns a user's interaction weights as a dict of movie ID to summed weight."""
+    profile = {}
+    for _, movies, weights in iter_interactions(user_id):
+        for movie_id, weight in zip(movies.tolist(), weights.tolist()):
+            profile[movie_id] = profile.get(movie_id, 0.0) + weight
+    return profile
+
+
+def item_neighbours(users, movies, weights, k=NEIGHBOURS, block_size=BLOCK_SIZE):
+    """Computes each movie's top-k cosine neighbours over the user x movie matrix.
+
+    Returns the sorted movie IDs and the neighbour lists as CSR arrays
+    (indptr, neighbour rows, scores), each row ordered best first. Rows of
+    the item-item product are computed `block_size` movies at a time, so
+    memory stays bounded by the block rather than the full similarity matrix.
+    """
+    from scipy.sparse import coo_matrix, diags
+    ids, columns = np.unique(movies, return_inverse=True)
+    _, rows = np.unique(users, return_inverse=True)
+    # Duplicate (user, movie) pairs, e.g. a favourite that was also reviewed, are summed
+    matrix = coo_matrix((weights.astype(np.float32), (rows, columns)), shape=(rows.max() + 1 if len(rows) else 0, len(ids))).tocsc()
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    norms[norms == 0] = 1.0
+    matrix = (matrix @ diags(1.0 / norms).astype(np.float32)).tocsc()
+    items = matrix.T.tocsr()
+
+    indptr = np.zeros(len(ids) + 1, dtype=np.int64)
+    neighbours, scores = [], []
+    for start in range(0, len(ids), block_size):
+        block = (items[start:start + block_size] @ matrix).tocsr()
+        for offset in range(block.shape[0]):
+            row = start + offset
+            cols = block.indices[block.indptr[offset]:block.indptr[offset + 1]]
+            sims = block.data[block.indptr[offset]:block.indptr[offset + 1]]
+            keep = (cols != row) & (sims > 0)
+            cols, sims = cols[keep], sims[keep]
+            if len(cols) > k:
+                top = np.argpartition(-sims, k - 1)[:k]
+                cols, sims = cols[top], sims[top]
+            order = np.argsort(-sims, kind='stable')
+            neighbours.append(cols[order].astype(np.int32))
+            scores.append(sims[order].astype(np.float32))
+            indptr[row + 1] = indptr[row] + len(cols)
+    neighbours = np.concatenate(neighbours) if neighbours else np.zeros(0, dtype=np.int32)
+    scores = np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32)
+    return ids, indptr, neighbours, scores
+
+
+def build_index(index_dir=INDEX_DIR, k=NEIGHBOURS):
+    """Builds the item-item index from every saved list and review and writes it to `index_dir`.
+
+    The index is written next to the old one and swapped in with renames,
+    so serving processes never see a half-written index; they pick up the
+    new one on their next lookup.
+    """
+    chunks = list(iter_interactions())
+    if chunks:
+        users, movies, weights = (np.concatenate(parts) for parts in zip(*chunks))
+    else:
+        users, movies, weights = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    ids, indptr, neighbours, scores = item_neighbours(users, movies, weights, k)
+
+    building = index_dir + '.building'
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+    np.save(os.path.join(building, 'ids.npy'), ids)
+    np.save(os.path.join(building, 'indptr.npy'), indptr)
+    np.save(os.path.join(building, 'neighbours.npy'), neighbours)
+    np.save(os.path.join(building, 'scores.npy'), scores)
+    with open(os.path.join(building, 'meta.json'), 'w') as f:
+        json.dump({
+            'movies': len(ids),
+            'users': len(np.unique(users)),
+            'interactions': len(users),
+            'neighbours': k,
+            'built_at': time.time()
+        }, f)
+
+    # Open memory maps keep reading the replaced files until they are released
+    old = index_dir + '.old'
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(index_dir):
+        os.rename(index_dir, old)
+    os.rename(building, index_dir)
+    shutil.rmtree(old, ignore_errors=True)
+    return len(ids), len(users)
+
+
+class CollaborativeIndex:
+    """Memory-mapped item-item neighbour lists answering top-k lookups without touching the database."""
+
+    def __init__(self, ids, indptr, neighbours, scores, meta):
+        self.ids = ids
+        self.indptr = indptr
+        self.neighbours = neighbours
+        self.scores = scores
+        self.meta = meta
+
+    @classmethod
+    def load(cls, index_dir=INDEX_DIR):
+        """Loads an index built by `build_index`, memory-mapping the arrays."""
+        with open(os.path.join(index_dir, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = [np.load(os.path.join(index_dir, f'{name}.npy'), mmap_mode='r') for name in ('ids', 'indptr', 'neighbours', 'scores')]
+        return cls(*arrays, meta)
+
+    def _rows(self, movie_ids):
+        # IDs are sorted, so a binary search replaces a per-process dict of every movie
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        rows = np.searchsorted(self.ids, movie_ids)
+        found = rows < len(self.ids)
+        found[found] = self.ids[rows[found]] == movie_ids[found]
+        return rows, found
+
+    def __contains__(self, movie_id):
+        return bool(self._rows([movie_id])[1][0])
+
+    @instrumentation.timed('recommend.cf_similar')
+    def similar(self, movie_id, num_recommendations=10):
+        """Returns up to `num_recommendations` (movie ID, score) pairs for movies liked by the same users."""
+        rows, found = self._rows([movie_id])
+        if not found[0]:
+            return []
+        start, end = self.indptr[rows[0]], self.indptr[rows[0] + 1]
+        end = min(end, start + num_recommendations)
+        return list(zip(self.ids[self.neighbours[start:end]].tolist(), self.scores[start:end].tolist()))
+
+    @instrumentation.timed('recommend.cf_for_user')
+    def for_user(self, profile, num_recommendations=20, max_history=200):
+        """Returns (movie ID, score) pairs scored by summing the neighbour lists of a user's movies.
+
+        `profile` maps movie IDs to interaction weights (see `user_profile`);
+        only the `max_history` strongest are used and movies in it are never
+        recommended back.
+        """
+        history = sorted(profile.items(), key=lambda item: -item[1])[:max_history]
+        if not history:
+            return []
+        rows, found = self._rows([movie_id for movie_id, _ in history])
+        candidates, totals = [], []
+        for row, weight in zip(rows[found].tolist(), np.array([weight for _, weight in history])[found].tolist()):
+            start, end = self.indptr[row], self.indptr[row + 1]
+            candidates.append(self.neighbours[start:end])
+            totals.append(self.scores[start:end] * weight)
+        if not candidates:
+            return []
+        candidates, inverse = np.unique(np.concatenate(candidates), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(totals))
+        movie_ids = self.ids[candidates]
+        totals[np.isin(movie_ids, list(profile))] = 0.0
+        k = min(num_recommendations, len(totals))
+        top = np.argpartition(-totals, k - 1)[:k]
+        top = top[np.argsort(-totals[top], kind='stable')]
+        return [(int(movie_ids[i]), float(totals[i])) for i in top if totals[i] > 0]
+
+
+_index = None
+_index_mtime = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Returns the process-wide collaborative index, or None if none was built.
+
+    The index is reloaded when a rebuild replaces it, so nightly builds are
+    served without restarting the app.
+    """
+    global _index, _index_mtime
+    try:
+        mtime = os.stat(os.path.join(INDEX_DIR, 'meta.json')).st_mtime
+    except OSError:
+        return _index
+    if mtime != _index_mtime:
+        with _index_lock:
+            if mtime != _index_mtime:
+                _index = CollaborativeIndex.load(INDEX_DIR)
+                _index_mtime = mtime
+    return _index
+
+
+# Rebuild the index offline, e.g. nightly from cron
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Item-item collaborative filtering tools.")
+    parser.add_argument('--build', action='store_true', help="Rebuild the neighbour index from saved lists and reviews.")
+    parser.add_argument('--neighbours', type=int, default=NEIGHBOURS, help="Neighbours kept per movie.")
+    parser.add_argument('--user', type=int, help="Print recommendations for a user ID.")
+    args = parser.parse_args()
+
+    from app import app
+    with app.app_context():
+        if args.build:
+            started = time.perf_counter()
+            movies, interactions = build_index(k=args.neighbours)
+            print(f"Indexed {movies} movies from {interactions} interactions into {INDEX_DIR} in {time.perf_counter() - started:.1f}s.")
+        if args.user is not None:
+            index = get_index()
+            for movie_id, score in (index.for_user(user_profile(args.user)) if index else []):
+                print(f"Movie {movie_id}: {score:.3f}")
@@ -0,0 +1,109 @@
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# Shared pool for concurrent upstream fetches; sized for I/O-bound work
+executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('FANOUT_WORKERS', 16)),
+    thread_name_prefix='fanout'
+)
+
+# Separate bounded pool for batch detail hydration so a long saved list
+# cannot starve the page fan-out pool
+hydration_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('HYDRATION_WORKERS', 8)),
+    thread_name_prefix='hydrate'
+)
+
+# Small pool for background cache refreshes, kept apart so refreshing
+# stale entries never competes with requests for fan-out workers
+refresh_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('REFRESH_WORKERS', 4)),
+    thread_name_prefix='refresh'
+)
+
+# Seconds a page waits on upstream fetches before falling back
+PAGE_DEADLINE = float(os.environ.get('PAGE_DEADLINE', 2.5))
+
+# Flask app whose context is pushed around pooled work, set by init_app()
+_app = None
+
+
+def init_app(app):
+    """Makes pooled tasks run inside `app`'s application context so they can use the database."""
+    global _app
+    _app = app
+
+
+def in_app_context(func):
+    """Wraps `func` so it runs inside the registered app's context.
+
+    The caller's context variables are carried over too, so work done on a
+    pool thread is attributed to the request that started it.
+    """
+    context = contextvars.copy_context()
+
+    def call(*args, **kwargs):
+        if _app is None:
+            return func(*args, **kwargs)
+        with _app.app_context():
+            return func(*args, **kwargs)
+
+    def run(*args, **kwargs):
+        return context.copy().run(call, *args, **kwargs)
+    return run
+
+
+def submit(func, *args, pool=None):
+    """Submits `func` to a pool (the fan-out pool by default) inside the app context."""
+    return (pool or executor).submit(in_app_context(func), *args)
+
+
+def submit_refresh(func, *args):
+    """Submits background cache refresh work to the refresh pool."""
+    return submit(func, *args, pool=refresh_executor)
+
+
+def prefetch(fetcher, *args, **kwargs):
+    """Warms a cached fetcher in the background, e.g. for the next page, unless it is already fresh."""
+    expires_at = fetcher.expires_at(*args, **kwargs)
+    if expires_at is None or expires_at < time.time():
+        submit_refresh(lambda: fetcher(*args, **kwargs))
+
+
+def map_concurrently(func, items, pool=None):
+    """Maps `func` over `items` on a pool inside the app context, preserving order."""
+    return list((pool or hydration_executor).map(in_app_context(func), items))
+
+
+def fetch_concurrently(tasks, deadline=None):
+    """Runs independent fetches concurrently and returns their results by name.
+
+    `tasks` maps a name to a `(func, args, fallback)` tuple. Every task is
+    started at once; a task that raises or is still running when the
+    deadline passes yields `fallback()` instead, so one slow endpoint cannot
+    stall the page. Late tasks keep running in the background and warm the
+    response cache for the next request.
+    """
+    deadline = PAGE_DEADLINE if deadline is None else deadline
+    futures = {name: submit(func, *args) for name, (func, args, _) in tasks.items()}
+    wait(futures.values(), timeout=deadline)
+
+    results = {}
+    for name, future in futures.items():
+        fallback = tasks[name][2]
+        if future.done() and future.exception() is None:
+            results[name] = future.result()
+        else:
+            results[name] = fallback()
+    return results
+
+
+def stale_or(fetcher, default, *args, **kwargs):
+    """Returns a fallback for `fetcher` serving its last cached value, else `default`."""
+    def fallback():
+        value = fetcher.stale(*args, **kwargs)
+        return value if value is not None else default
+    return fallback
+
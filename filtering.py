@@ -0,0 +1,226 @@
+import threading
+import time
+import numpy as np
+
+# Sort orders accepted from the filter form, all supported by TMDB discover
+SORT_ORDERS = {
+    'popularity.desc', 'popularity.asc',
+    'release_date.desc', 'release_date.asc',
+    'vote_average.desc', 'vote_average.asc',
+    'title.asc', 'title.desc',
+}
+
+
+def _int(value, low, high):
+    try:
+        number = int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+    return number if low <= number <= high else None
+
+
+def _float(value, low, high):
+    try:
+        number = float(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+    return number if low <= number <= high else None
+
+
+def normalize_filters(filters):
+    """Turns raw form filters into a canonical dict holding only the filters that are set.
+
+    Blank and malformed values are dropped and genres are sorted, so every
+    spelling of the same query yields the same dict, which is used as the
+    cache key. An empty dict means no filtering.
+    """
+    filters = filters or {}
+    normalized = {
+        'year_min': _int(filters.get('release_year_min'), 1800, 2200),
+        'year_max': _int(filters.get('release_year_max'), 1800, 2200),
+        'rating_min': _float(filters.get('rating_min'), 0, 10),
+        'rating_max': _float(filters.get('rating_max'), 0, 10),
+        'genres': sorted({genre for genre in (_int(value, 1, 10 ** 9) for value in filters.get('genres') or []) if genre}),
+        'language': (filters.get('language') or '').strip().lower()[:8],
+        'sort_by': filters.get('sort_by') if filters.get('sort_by') in SORT_ORDERS else '',
+    }
+    return {name: value for name, value in normalized.items() if value not in (None, '', [])}
+
+
+def discover_params(filters, page=1):
+    """Builds TMDB /discover/movie parameters from normalized filters."""
+    params = {
+        'language': 'en-US',
+        'include_adult': False,
+        'sort_by': filters.get('sort_by', 'popularity.desc'),
+        'page': page,
+    }
+    if 'year_min' in filters:
+        params['primary_release_date.gte'] = f"{filters['year_min']}-01-01"
+    if 'year_max' in filters:
+        params['primary_release_date.lte'] = f"{filters['year_max']}-12-31"
+    if 'rating_min' in filters:
+        params['vote_average.gte'] = filters['rating_min']
+    if 'rating_max' in filters:
+        params['vote_average.lte'] = filters['rating_max']
+    if 'genres' in filters:
+        # Comma-separated genres must all match, like the local filter
+        params['with_genres'] = ','.join(str(genre) for genre in filters['genres'])
+    if 'language' in filters:
+        params['with_original_language'] = filters['language']
+    return params
+
+
+class _Codes:
+    """Assigns small integer codes to genre IDs and language tags, shared by every store."""
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self._codes = {}
+        self._lock = threading.Lock()
+
+    def get(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            with self._lock:
+                code = self._codes.get(value)
+                if code is None and (self.limit is None or len(self._codes) < self.limit):
+                    code = self._codes[value] = len(self._codes)
+        return code
+
+
+# Genres are stored as a 64-bit mask; TMDB has fewer than twenty
+_genre_bits = _Codes(limit=64)
+_languages = _Codes()
+
+
+class ColumnStore:
+    """Compact columnar copy of a set of movies for vectorized filtering and sorting.
+
+    Year, rating, popularity, a genre bitmask and a language code are held
+    in numpy arrays, so filtering is a handful of array comparisons however
+    many movies there are.
+    """
+
+    def __init__(self, movies):
+        self.movies = list(movies)
+        count = len(self.movies)
+        self.year = np.zeros(count, dtype=np.int16)
+        self.date = np.zeros(count, dtype=np.int32)
+        self.rating = np.zeros(count, dtype=np.float32)
+        self.popularity = np.zeros(count, dtype=np.float32)
+        self.genres = np.zeros(count, dtype=np.uint64)
+        self.language = np.full(count, -1, dtype=np.int32)
+        self.title = np.array([(movie.get('title') or '').lower() for movie in self.movies], dtype=str)
+
+        for row, movie in enumerate(self.movies):
+            digits = (movie.get('release_date') or '')[:10].replace('-', '')
+            if len(digits) == 8 and digits.isdigit():
+                self.year[row] = int(digits[:4])
+                self.date[row] = int(digits)
+            self.rating[row] = movie.get('vote_average') or 0
+            self.popularity[row] = movie.get('popularity') or 0
+            genre_ids = movie.get('genre_ids') or [genre['id'] for genre in movie.get('genres') or [] if isinstance(genre, dict)]
+            mask = 0
+            for genre_id in genre_ids:
+                bit = _genre_bits.get(genre_id)
+                if bit is not None:
+                    mask |= 1 << bit
+            self.genres[row] = mask
+            self.language[row] = _languages.get(movie.get('original_language') or '')
+
+    def __len__(self):
+        return len(self.movies)
+
+    def mask(self, filters):
+        """Returns a boolean array selecting the movies that match normalized filters."""
+        selected = np.ones(len(self), dtype=bool)
+        if 'year_min' in filters:
+            selected &= self.year >= filters['year_min']
+        if 'year_max' in filters:
+            selected &= (self.year <= filters['year_max']) & (self.year > 0)
+        if 'rating_min' in filters:
+            selected &= self.rating >= filters['rating_min']
+        if 'rating_max' in filters:
+            selected &= self.rating <= filters['rating_max']
+        if 'genres' in filters:
+            wanted = 0
+            for genre_id in filters['genres']:
+                bit = _genre_bits.get(genre_id)
+                if bit is None:
+                    return np.zeros(len(self), dtype=bool)
+                wanted |= 1 << bit
+            wanted = np.uint64(wanted)
+            selected &= (self.genres & wanted) == wanted
+        if 'language' in filters:
+            selected &= self.language == _languages.get(filters['language'])
+        return selected
+
+    def select(self, filters):
+        """Returns the matching movies, in `sort_by` order if one is set, else in stored order."""
+        rows = np.flatnonzero(self.mask(filters))
+        sort_by = filters.get('sort_by')
+        if sort_by and len(rows):
+            field, direction = sort_by.split('.')
+            column = {
+                'popularity': self.popularity,
+                'release_date': self.date,
+                'vote_average': self.rating,
+                'title': self.title,
+            }[field][rows]
+            if direction == 'desc':
+                # Negating keeps ties in stored order; strings can only be reversed
+                order = np.argsort(column, kind='stable')[::-1] if field == 'title' else np.argsort(-column, kind='stable')
+            else:
+                order = np.argsort(column, kind='stable')
+            rows = rows[order]
+        return [self.movies[row] for row in rows]
+
+
+class RefreshingStore:
+    """A ColumnStore over the movies `load()` returns, rebuilt at most every `max_age` seconds.
+
+    With `background`, a function scheduling a call (see
+    `fanout.submit_refresh`), `get` never builds on the caller's thread: it
+    returns the current store, or None before the first build, and
+    schedules the rebuild.
+    """
+
+    def __init__(self, load, max_age=600, background=None):
+        self.load = load
+        self.max_age = max_age
+        self.background = background
+        self._store = None
+        self._built_at = 0.0
+        self._building = False
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def _stale(self):
+        return self._store is None or time.monotonic() - self._built_at > self.max_age
+
+    def get(self):
+        if self._stale():
+            if self.background is None:
+                self.refresh()
+            else:
+                with self._lock:
+                    schedule = not self._building
+                    self._building = True
+                if schedule:
+                    self.background(self._build)
+        return self._store
+
+    def refresh(self):
+        """Rebuilds the store on this thread if it is due; the background refresher calls this."""
+        with self._build_lock:
+            if self._stale():
+                self._store = ColumnStore(self.load())
+                self._built_at = time.monotonic()
+
+    def _build(self):
+        try:
+            self.refresh()
+        finally:
+            with self._lock:
+                self._building = False
@@ -0,0 +1,47 @@
+# gunicorn.conf.py
+"""Production server configuration.
+
+    pip install gunicorn gevent
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Views spend most of their time waiting on TMDB, so the default worker
+class is gevent: every worker process serves up to WORKER_CONNECTIONS
+requests at once, and each blocking socket read, sleep or pool wait yields
+to other requests instead of pinning a thread. Set SERVER_WORKER_CLASS=gthread
+to use a plain thread pool of WORKER_THREADS per process instead.
+
+Environment variables:
+    BIND                  address to listen on (default 0.0.0.0:5004)
+    WEB_CONCURRENCY       worker processes (default 2 * CPUs + 1)
+    SERVER_WORKER_CLASS   gevent (default) or gthread
+    WORKER_CONNECTIONS    concurrent requests per gevent worker (default 1000)
+    WORKER_THREADS        threads per gthread worker (default 32)
+    DATABASE_URL          SQLAlchemy database URL (default sqlite:///site.db);
+                          pool and SQLite settings are described in database.py
+    RECOMMENDER_WARMUP    1 to load the recommendation stack when a worker
+                          starts instead of on its first movie page
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5004')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get('SERVER_WORKER_CLASS', 'gevent')
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 1000))
+threads = int(os.environ.get('WORKER_THREADS', 32))
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+# Size the per-process upstream pools for the requests one worker serves
+# concurrently, and split TMDB's rate limit across the worker processes.
+# Workers import the app after these are set.
+concurrency = worker_connections if worker_class == 'gevent' else threads
+os.environ.setdefault('FANOUT_WORKERS', str(min(concurrency, 256)))
+os.environ.setdefault('HYDRATION_WORKERS', str(min(concurrency, 64)))
+os.environ.setdefault('TMDB_POOL_SIZE', str(min(concurrency, 128)))
+os.environ.setdefault('TMDB_WORKER_PROCESSES', str(workers))
+# Requests mostly wait on TMDB rather than the database, so a small pool per
+# worker suffices; keep workers * (pool + overflow) under the server's limit
+os.environ.setdefault('DB_POOL_SIZE', str(min(concurrency, 10)))
+os.environ.setdefault('DB_MAX_OVERFLOW', str(min(concurrency, 20)))
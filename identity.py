@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask_login import UserMixin
+from sqlalchemy import event
+
+import instrumentation
+from models import User
+
+# Identities kept per process, and seconds one is trusted before it is read again;
+# edits made in this process invalidate at once, other processes see them within the TTL
+MAX_ENTRIES = int(os.environ.get('IDENTITY_CACHE_ENTRIES', 10000))
+TTL = float(os.environ.get('IDENTITY_CACHE_TTL', 300))
+
+
+class Identity(UserMixin):
+    """The logged-in user as routes and templates see it: ID and username, without an ORM row.
+
+    Routes that need the full row load it with `User.get_by_id(current_user.id)`.
+    """
+
+    def __init__(self, id, username):
+        self.id = id
+        self.username = username
+
+    def __repr__(self):
+        return f'<Identity {self.id} {self.username!r}>'
+
+
+class IdentityCache:
+    """Bounded LRU of user identities, each expiring `ttl` seconds after it was loaded."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        """Returns the identity of a user ID, reading the users table only on a miss; None if there is no such user."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        with instrumentation.span('identity.load'):
+            row = User.identity(user_id)
+        if row is None:
+            # Unknown IDs are not cached, so a user created later is found at once
+            return None
+        identity = Identity(*row)
+        with self._lock:
+            self._entries[user_id] = (identity, now + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return identity
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+cache = IdentityCache()
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_user(mapper, connection, target):
+    # Renames and deletions are visible to this process's next request
+    cache.invalidate(target.id)
+
+
+def load_user(user_id):
+    """Flask-Login user loader backed by the identity cache."""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    return cache.get(user_id)
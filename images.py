@@ -0,0 +1,176 @@
+import logging
+import os
+import re
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from flask import Blueprint, abort, current_app, redirect, send_file
+from markupsafe import Markup
+
+logger = logging.getLogger(__name__)
+
+TMDB_IMAGE_BASE = os.environ.get('TMDB_IMAGE_BASE', 'https://image.tmdb.org/t/p')
+
+# Set to 1 to serve images through /img with an on-disk cache instead of linking TMDB
+PROXY = os.environ.get('IMAGE_PROXY', '0') == '1'
+
+# Widths TMDB renders, per image kind
+SIZES = {
+    'poster': ('w92', 'w154', 'w185', 'w342', 'w500', 'w780'),
+    'backdrop': ('w300', 'w780', 'w1280'),
+}
+
+# Each place an image is shown: its kind, the size used for `src`, the sizes
+# offered in `srcset`, and the `sizes` hint matching the page layout
+USES = {
+    'card': ('poster', 'w342', ('w185', 'w342', 'w500'), '(min-width: 992px) 25vw, (min-width: 768px) 33vw, 50vw'),
+    'thumb': ('poster', 'w185', ('w154', 'w185', 'w342'), '(min-width: 768px) 25vw, 50vw'),
+    'detail': ('poster', 'w500', ('w342', 'w500', 'w780'), '(min-width: 768px) 33vw, 100vw'),
+    'hero': ('backdrop', 'w1280', ('w780', 'w1280'), '100vw'),
+}
+
+PLACEHOLDERS = {
+    'poster': "https://via.placeholder.com/342x513?text=No+Image",
+    'backdrop': "https://via.placeholder.com/1280x720?text=No+Image",
+}
+
+# TMDB file paths are content addressed, so a cached image never changes
+MAX_AGE = 365 * 86400
+
+_FILENAME = re.compile(r'^[A-Za-z0-9_-]+\.(jpg|jpeg|png|webp|svg)$')
+_ALL_SIZES = {size for sizes in SIZES.values() for size in sizes}
+
+images_blueprint = Blueprint('images', __name__)
+
+
+def image_url(path, size):
+    """Returns the URL of a TMDB image path at a given size, via the proxy if it is enabled."""
+    if PROXY:
+        return f'/img/{size}{path}'
+    return f'{TMDB_IMAGE_BASE}/{size}{path}'
+
+
+def url_for_use(path, use):
+    """Returns the `src` URL for an image shown at a use site such as 'card' or 'hero'."""
+    kind, size = USES[use][:2]
+    return image_url(path, size) if path else PLACEHOLDERS[kind]
+
+
+def image_attrs(path, use):
+    """Returns `srcset` and `sizes` attributes for an <img> tag, or nothing without an image path.
+
+    Available in templates as a global, next to a `src` from `url_for_use`.
+    """
+    if not path:
+        return Markup('')
+    _, _, sizes, hint = USES[use]
+    srcset = ', '.join(f'{image_url(path, size)} {size[1:]}w' for size in sizes)
+    return Markup('srcset="{}" sizes="{}"').format(srcset, hint)
+
+
+class DiskCache:
+    """Directory of downloaded images kept under `max_bytes`, evicting the least recently used.
+
+    A file's modification time is bumped on every hit and serves as its
+    last-use time, so the cache survives restarts without an index.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+
+    def path(self, size, filename):
+        return os.path.join(self.directory, size, filename)
+
+    def get(self, size, filename):
+        """Returns the cached file's path, or None."""
+        path = self.path(size, filename)
+        try:
+            # Bumping at most hourly keeps hits read-only in the common case
+            if os.stat(path).st_mtime < time.time() - 3600:
+                os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, size, filename, content):
+        """Stores an image atomically and evicts old images if the cache is over budget."""
+        path = self.path(size, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = f'{path}.{threading.get_ident()}.part'
+        with open(partial, 'wb') as f:
+            f.write(content)
+        os.replace(partial, path)
+        with self._lock:
+            if self._size is None:
+                self._size = sum(nbytes for _, nbytes, _ in self._files())
+            else:
+                self._size += len(content)
+            if self._size > self.max_bytes:
+                self._evict()
+        return path
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                yield stat.st_mtime, stat.st_size, os.path.join(root, name)
+
+    def _evict(self):
+        # Trim to 90% so a full cache is not rescanned on every new image
+        files = sorted(self._files())
+        self._size = sum(nbytes for _, nbytes, _ in files)
+        for _, nbytes, path in files:
+            if self._size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+                self._size -= nbytes
+            except OSError:
+                pass
+
+
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=32))
+
+
+@images_blueprint.route('/img/<size>/<filename>')
+def image(size, filename):
+    """Serves a TMDB image from the disk cache, downloading it on first use."""
+    if size not in _ALL_SIZES or not _FILENAME.match(filename):
+        abort(404)
+    cache = current_app.extensions['image_cache']
+    path = cache.get(size, filename)
+    if path is None:
+        upstream = f'{TMDB_IMAGE_BASE}/{size}/{filename}'
+        try:
+            response = _session.get(upstream, timeout=(3.05, 10))
+        except requests.RequestException as e:
+            logger.warning("Fetching image %s failed: %s", upstream, e)
+            return redirect(upstream)
+        if response.status_code == 404:
+            abort(404)
+        if response.status_code != 200:
+            return redirect(upstream)
+        path = cache.put(size, filename, response.content)
+    # The ETag names the image rather than the file, whose mtime moves with use
+    response = send_file(path, max_age=MAX_AGE, conditional=True, etag=f'{size}-{filename}')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    app.extensions['image_cache'] = DiskCache(
+        os.environ.get('IMAGE_CACHE_DIR', os.path.join(app.instance_path, 'image_cache')),
+        int(os.environ.get('IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+    )
+    app.register_blueprint(images_blueprint)
+    app.add_template_global(url_for_use)
+    app.add_template_global(image_attrs)
@@ -1,6 +1,26 @@
 # initialize_db.py
+from sqlalchemy import text
 from app import db, app
+from models import MovieRatingSummary
+
+def upgrade_existing_tables():
+    """Adds the indexes that db.create_all() does not add to tables created by older versions."""
+    # Keep the oldest row of any duplicated list entry so the unique index can be built
+    db.session.execute(text(
+        'DELETE FROM user_movies WHERE id NOT IN '
+        '(SELECT MIN(id) FROM user_movies GROUP BY user_id, category, movie_id)'
+    ))
+    db.session.execute(text(
+        'CREATE UNIQUE INDEX IF NOT EXISTS uq_user_movies_user_category_movie '
+        'ON user_movies (user_id, category, movie_id)'
+    ))
+    db.session.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_reviews_movie_created ON reviews (movie_id, created_at, id)'
+    ))
+    db.session.commit()
+    MovieRatingSummary.rebuild()
 
 with app.app_context():
     db.create_all()
+    upgrade_existing_tables()
     print("Database tables created successfully.")
@@ -0,0 +1,257 @@
+import contextvars
+import logging
+import os
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from functools import wraps
+
+from flask import before_render_template, g, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Master switch; with it off spans are no-ops and no hooks are installed
+ENABLED = os.environ.get('INSTRUMENTATION', '1') == '1'
+# Adds a Server-Timing header with the per-request span breakdown
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') == '1'
+# Requests slower than this (ms) are candidates for the slow-request log
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 1000))
+# Fraction of slow requests that are actually logged
+SLOW_LOG_SAMPLE = float(os.environ.get('SLOW_LOG_SAMPLE', 0.1))
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram with count, sum and max."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, fraction):
+        """Estimates a quantile as the upper bound of the bucket that contains it."""
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + (self.max,), self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(bound, self.max)
+        return self.max
+
+
+class Registry:
+    """Thread-safe set of named span histograms for this process."""
+
+    def __init__(self):
+        self._histograms = defaultdict(Histogram)
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            self._histograms[name].observe(seconds)
+
+    def snapshot(self):
+        """Returns count, mean, p50/p95/p99 and max in milliseconds per span."""
+        with self._lock:
+            return {
+                name: {
+                    'count': hist.count,
+                    'mean_ms': round(hist.total / hist.count * 1000, 2) if hist.count else 0.0,
+                    'p50_ms': round(hist.quantile(0.50) * 1000, 2),
+                    'p95_ms': round(hist.quantile(0.95) * 1000, 2),
+                    'p99_ms': round(hist.quantile(0.99) * 1000, 2),
+                    'max_ms': round(hist.max * 1000, 2),
+                }
+                for name, hist in sorted(self._histograms.items())
+            }
+
+    def prometheus(self):
+        """Renders every histogram in the Prometheus text exposition format."""
+        lines = ['# TYPE app_span_seconds histogram']
+        with self._lock:
+            for name, hist in sorted(self._histograms.items()):
+                label = name.replace('\\', '\\\\').replace('"', '\\"')
+                cumulative = 0
+                for bound, count in zip(BUCKETS, hist.counts):
+                    cumulative += count
+                    lines.append(f'app_span_seconds_bucket{{span="{label}",le="{bound}"}} {cumulative}')
+                lines.append(f'app_span_seconds_bucket{{span="{label}",le="+Inf"}} {hist.count}')
+                lines.append(f'app_span_seconds_sum{{span="{label}"}} {hist.total:.6f}')
+                lines.append(f'app_span_seconds_count{{span="{label}"}} {hist.count}')
+        return '\n'.join(lines) + '\n'
+
+
+class RequestTrace:
+    """Per-request span totals, shared with the pool threads the request fans out to."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = defaultdict(lambda: [0.0, 0])
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            span = self.spans[name]
+            span[0] += seconds
+            span[1] += 1
+
+    def by_category(self):
+        """Sums spans by the part of their name before the first dot, e.g. 'tmdb'."""
+        categories = defaultdict(lambda: [0.0, 0])
+        with self._lock:
+            for name, (seconds, count) in self.spans.items():
+                category = categories[name.split('.', 1)[0]]
+                category[0] += seconds
+                category[1] += count
+        return categories
+
+
+registry = Registry()
+_trace = contextvars.ContextVar('request_trace', default=None)
+
+
+def record(name, seconds):
+    """Records a finished span in the histograms and the current request's trace."""
+    registry.observe(name, seconds)
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+class _Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name):
+    """Context manager timing a block as `name`; a shared no-op when instrumentation is off."""
+    return _Span(name) if ENABLED else _NULL_SPAN
+
+
+def timed(name):
+    """Decorator timing every call of a function as `name`; returns it unchanged when off."""
+    def decorator(func):
+        if not ENABLED:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def _statement_kind(statement):
+    match = re.match(r'\s*(\w+)', statement)
+    return match.group(1).lower() if match else 'other'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('query_start')
+    if starts:
+        record(f'db.{_statement_kind(statement)}', time.perf_counter() - starts.pop())
+
+
+def _before_render(app, template, context, **extra):
+    g.setdefault('_template_starts', []).append(time.perf_counter())
+
+
+def _after_render(app, template, context, **extra):
+    starts = g.get('_template_starts')
+    if starts:
+        record(f'template.{template.name}', time.perf_counter() - starts.pop())
+
+
+def _server_timing(trace, total):
+    parts = [
+        f'{re.sub(r"[^A-Za-z0-9_-]", "_", category)};dur={seconds * 1000:.1f};desc="{count}x"'
+        for category, (seconds, count) in sorted(trace.by_category().items())
+    ]
+    parts.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(parts)
+
+
+def _start_request():
+    g._trace_token = _trace.set(RequestTrace())
+
+
+def _finish_request(response):
+    trace = _trace.get()
+    if trace is None:
+        return response
+    total = time.perf_counter() - trace.start
+    registry.observe(f'request.{request.endpoint or "unmatched"}', total)
+    if SERVER_TIMING:
+        response.headers['Server-Timing'] = _server_timing(trace, total)
+    if total * 1000 >= SLOW_REQUEST_MS and random.random() < SLOW_LOG_SAMPLE:
+        breakdown = ', '.join(
+            f'{name}={seconds * 1000:.1f}ms/{count}'
+            for name, (seconds, count) in sorted(trace.spans.items(), key=lambda item: -item[1][0])[:10]
+        )
+        logger.warning("Slow request %s %s took %.1fms: %s", request.method, request.full_path, total * 1000, breakdown)
+    return response
+
+
+def _end_request(exc):
+    token = g.pop('_trace_token', None)
+    if token is not None:
+        _trace.reset(token)
+
+
+def init_app(app):
+    """Installs request, template and database timing hooks when instrumentation is on."""
+    if not ENABLED:
+        return
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_end_request)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
@@ -2,10 +2,26 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+from sqlalchemy import and_, delete, func, or_, select
+from sqlalchemy.orm import joinedload
 
 # Initialize the SQLAlchemy database instance
 db = SQLAlchemy()
 
+def dialect_insert(table):
+    """Returns a dialect-specific INSERT for `table` that supports ON CONFLICT clauses."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Upserts are not supported on {dialect}")
+    return insert(table)
+
+# Rows written or deleted per statement by the bulk list operations
+BULK_BATCH_SIZE = 500
+
 class User(UserMixin, db.Model):
     """Model for storing user details."""
     __tablename__ = 'users'
@@ -39,7 +55,14 @@ class User(UserMixin, db.Model):
     @staticmethod
     def get_by_id(user_id):
         """Fetch a user by their user ID."""
-        return User.query.get(int(user_id))
+        return db.session.get(User, int(user_id))
+
+    @staticmethod
+    def identity(user_id):
+        """Returns a user's (id, username), or None; all that the login session needs."""
+        return db.session.execute(
+            select(User.id, User.username).where(User.id == user_id)
+        ).first()
 
 class UserMovies(db.Model):
     """Model for storing user's movies in watchlist or favorites."""
@@ -53,6 +76,119 @@ class UserMovies(db.Model):
     # Relationship to access the user who added the movie
     user = db.relationship('User', backref=db.backref('user_movies', lazy=True))
 
+    # One row per (user, list, movie); also serves the per-user list queries
+    __table_args__ = (
+        db.Index('uq_user_movies_user_category_movie', 'user_id', 'category', 'movie_id', unique=True),
+    )
+
+    @staticmethod
+    def add(user_id, category, movie_id):
+        """Adds a movie to a user's list in one upsert; returns False if it was already there."""
+        stmt = dialect_insert(UserMovies.__table__).values(user_id=user_id, category=category, movie_id=movie_id)
+        result = db.session.execute(stmt.on_conflict_do_nothing(index_elements=['user_id', 'category', 'movie_id']))
+        db.session.commit()
+        return result.rowcount > 0
+
+    @staticmethod
+    def remove(user_id, category, movie_id):
+        """Removes a movie from a user's list in one delete; returns False if it was not there."""
+        result = db.session.execute(delete(UserMovies).where(
+            UserMovies.user_id == user_id, UserMovies.category == category, UserMovies.movie_id == movie_id
+        ))
+        db.session.commit()
+        return result.rowcount > 0
+
+    @staticmethod
+    def add_many(user_id, category, movie_ids, commit=True):
+        """Adds movies to a user's list in batched upserts, skipping ones already there; returns how many were added.
+
+        With `commit=False` the caller commits, so several bulk changes share
+        one transaction.
+        """
+        added = 0
+        movie_ids = list(dict.fromkeys(movie_ids))
+        for start in range(0, len(movie_ids), BULK_BATCH_SIZE):
+            stmt = dialect_insert(UserMovies.__table__).values([
+                {'user_id': user_id, 'category': category, 'movie_id': movie_id}
+                for movie_id in movie_ids[start:start + BULK_BATCH_SIZE]
+            ])
+            result = db.session.execute(stmt.on_conflict_do_nothing(index_elements=['user_id', 'category', 'movie_id']))
+            added += result.rowcount
+        if commit:
+            db.session.commit()
+        return added
+
+    @staticmethod
+    def remove_many(user_id, category, movie_ids=None, commit=True):
+        """Removes movies from a user's list, or every movie when `movie_ids` is None; returns how many were removed."""
+        conditions = [UserMovies.user_id == user_id, UserMovies.category == category]
+        if movie_ids is None:
+            removed = db.session.execute(delete(UserMovies).where(*conditions)).rowcount
+        else:
+            removed = 0
+            movie_ids = list(dict.fromkeys(movie_ids))
+            for start in range(0, len(movie_ids), BULK_BATCH_SIZE):
+                removed += db.session.execute(delete(UserMovies).where(
+                    *conditions, UserMovies.movie_id.in_(movie_ids[start:start + BULK_BATCH_SIZE])
+                )).rowcount
+        if commit:
+            db.session.commit()
+        return removed
+
+    @staticmethod
+    def move_many(user_id, source, target, movie_ids, commit=True):
+        """Moves movies from one of a user's lists to another; returns how many left `source`.
+
+        Movies not on `source` are ignored, and ones already on `target` are
+        just removed from `source`.
+        """
+        moved = 0
+        movie_ids = list(dict.fromkeys(movie_ids))
+        for start in range(0, len(movie_ids), BULK_BATCH_SIZE):
+            present = db.session.execute(select(UserMovies.movie_id).where(
+                UserMovies.user_id == user_id,
+                UserMovies.category == source,
+                UserMovies.movie_id.in_(movie_ids[start:start + BULK_BATCH_SIZE])
+            )).scalars().all()
+            if present:
+                UserMovies.add_many(user_id, target, present, commit=False)
+                moved += UserMovies.remove_many(user_id, source, present, commit=False)
+        if commit:
+            db.session.commit()
+        return moved
+
+    @staticmethod
+    def iter_entries(user_id, category=None, batch_size=1000):
+        """Yields a user's (category, movie_id) pairs in the order they were added, `batch_size` rows per round trip."""
+        stmt = select(UserMovies.category, UserMovies.movie_id).where(UserMovies.user_id == user_id)
+        if category is not None:
+            stmt = stmt.where(UserMovies.category == category)
+        stmt = stmt.order_by(UserMovies.id).execution_options(yield_per=batch_size)
+        for category, movie_id in db.session.execute(stmt):
+            yield category, movie_id
+
+    @staticmethod
+    def page(user_id, category, sortby=None, page=1, per_page=20):
+        """Returns one page of a user's list as (movie ID, catalog movie dict or None) pairs, and whether more follow.
+
+        Sorting and slicing happen in SQL against the catalog's metadata, so a
+        page costs the same however long the list is. Movies without a catalog
+        row come back as None for the caller to fetch, and sort last when the
+        list is sorted by metadata.
+        """
+        sortby = (sortby or '').replace('.', '_')
+        order = SAVED_LIST_SORTS.get(sortby, ())
+        uncatalogued = (CatalogMovie.id.is_(None),) if order and not sortby.startswith('date_added') else ()
+        rows = db.session.execute(
+            select(UserMovies.movie_id, CatalogMovie)
+            .outerjoin(CatalogMovie, CatalogMovie.id == UserMovies.movie_id)
+            .where(UserMovies.user_id == user_id, UserMovies.category == category)
+            .order_by(*uncatalogued, *order, UserMovies.id)
+            .offset((page - 1) * per_page)
+            .limit(per_page + 1)
+        ).all()
+        return [(movie_id, movie.to_dict() if movie else None) for movie_id, movie in rows[:per_page]], len(rows) > per_page
+
 class Review(db.Model):
     """Model for storing user reviews and ratings for movies."""
     __tablename__ = 'reviews'
@@ -66,3 +202,251 @@ class Review(db.Model):
 
     # Relationship to access the user who made the review
     user = db.relationship('User', backref=db.backref('reviews', lazy=True))
+
+    # Serves the newest-first review pages of a movie
+    __table_args__ = (
+        db.Index('ix_reviews_movie_created', 'movie_id', 'created_at', 'id'),
+    )
+
+    @staticmethod
+    def add_review(user_id, movie_id, rating, review_text=None):
+        """Creates a review and updates the movie's rating summary in the same transaction."""
+        review = Review(user_id=user_id, movie_id=movie_id, rating=rating, review_text=review_text)
+        db.session.add(review)
+        stmt = dialect_insert(MovieRatingSummary.__table__).values(movie_id=movie_id, rating_count=1, rating_sum=rating)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['movie_id'],
+            set_={
+                'rating_count': MovieRatingSummary.__table__.c.rating_count + 1,
+                'rating_sum': MovieRatingSummary.__table__.c.rating_sum + stmt.excluded.rating_sum
+            }
+        ))
+        db.session.commit()
+        return review
+
+    @staticmethod
+    def page_for_movie(movie_id, before=None, per_page=20):
+        """Returns a newest-first page of a movie's reviews and the cursor of the next page.
+
+        Pages are keyset-paginated on (created_at, id), so deep pages cost the
+        same as the first one. `before` is the cursor returned for the previous page.
+        """
+        query = select(Review).where(Review.movie_id == movie_id).options(joinedload(Review.user))
+        if before:
+            created_at, review_id = before
+            query = query.where(or_(
+                Review.created_at < created_at,
+                and_(Review.created_at == created_at, Review.id < review_id)
+            ))
+        query = query.order_by(Review.created_at.desc(), Review.id.desc()).limit(per_page + 1)
+        reviews = db.session.execute(query).scalars().all()
+        next_cursor = None
+        if len(reviews) > per_page:
+            reviews = reviews[:per_page]
+            next_cursor = (reviews[-1].created_at, reviews[-1].id)
+        return reviews, next_cursor
+
+class MovieRatingSummary(db.Model):
+    """Model for the running review count and rating sum of each movie."""
+    __tablename__ = 'movie_rating_summaries'
+
+    movie_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Float, nullable=False, default=0.0)
+
+    @staticmethod
+    def average(movie_id):
+        """Returns the movie's average rating, or None if it has no reviews."""
+        summary = db.session.get(MovieRatingSummary, movie_id)
+        if summary and summary.rating_count:
+            return summary.rating_sum / summary.rating_count
+        return None
+
+    @staticmethod
+    def rebuild():
+        """Recomputes every summary from the reviews table with one GROUP BY."""
+        db.session.execute(delete(MovieRatingSummary))
+        rows = db.session.execute(
+            select(Review.movie_id, func.count(Review.id), func.sum(Review.rating)).group_by(Review.movie_id)
+        ).all()
+        if rows:
+            db.session.execute(MovieRatingSummary.__table__.insert(), [
+                {'movie_id': movie_id, 'rating_count': count, 'rating_sum': total} for movie_id, count, total in rows
+            ])
+        db.session.commit()
+
+# Association table linking catalog movies to their genres
+catalog_movie_genres = db.Table(
+    'catalog_movie_genres',
+    db.Column('movie_id', db.Integer, db.ForeignKey('catalog_movies.id'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('catalog_genres.id'), primary_key=True)
+)
+
+class CatalogGenre(db.Model):
+    """Model for TMDB genres mirrored into the local catalog."""
+    __tablename__ = 'catalog_genres'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # TMDB genre ID
+    name = db.Column(db.String(100), nullable=False)  # '' until a genre sync names an ID first seen on a movie
+
+class CatalogMovie(db.Model):
+    """Model for normalized TMDB movie metadata mirrored into the local catalog."""
+    __tablename__ = 'catalog_movies'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # TMDB movie ID
+    title = db.Column(db.String(500), nullable=False)
+    overview = db.Column(db.Text, nullable=True)
+    release_date = db.Column(db.String(10), nullable=True)  # 'YYYY-MM-DD' as returned by TMDB
+    vote_average = db.Column(db.Float, nullable=True)
+    vote_count = db.Column(db.Integer, nullable=True)
+    popularity = db.Column(db.Float, nullable=True)
+    original_language = db.Column(db.String(10), nullable=True)
+    poster_path = db.Column(db.String(200), nullable=True)
+    backdrop_path = db.Column(db.String(200), nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    genres = db.relationship('CatalogGenre', secondary=catalog_movie_genres, lazy='selectin')
+
+    def to_dict(self):
+        """Returns the movie in the same shape as a TMDB movie payload."""
+        return {
+            'id': self.id,
+            'title': self.title,
+            'overview': self.overview or '',
+            'release_date': self.release_date or '',
+            'vote_average': self.vote_average,
+            'vote_count': self.vote_count,
+            'popularity': self.popularity,
+            'original_language': self.original_language or '',
+            'poster_path': self.poster_path,
+            'backdrop_path': self.backdrop_path,
+            'genre_ids': [genre.id for genre in self.genres],
+            'genres': [{'id': genre.id, 'name': genre.name} for genre in self.genres if genre.name]
+        }
+
+# ORDER BY clauses for saved lists keyed by the `sortby` values the list pages
+# send ('rating_desc' or 'rating.desc'); ties and unsorted lists fall back to
+# the order movies were added in
+SAVED_LIST_SORTS = {
+    'date_added_desc': (UserMovies.id.desc(),),
+    'date_added_asc': (UserMovies.id,),
+    'release_date_desc': (CatalogMovie.release_date.desc(),),
+    'release_date_asc': (CatalogMovie.release_date,),
+    'rating_desc': (CatalogMovie.vote_average.desc(),),
+    'rating_asc': (CatalogMovie.vote_average,),
+    'popularity_desc': (CatalogMovie.popularity.desc(),),
+    'popularity_asc': (CatalogMovie.popularity,),
+    'title_asc': (func.lower(CatalogMovie.title),),
+    'title_desc': (func.lower(CatalogMovie.title).desc(),),
+}
+
+class CatalogList(db.Model):
+    """Model for the ordered membership of TMDB lists such as trending or top rated."""
+    __tablename__ = 'catalog_lists'
+
+    name = db.Column(db.String(100), primary_key=True)  # e.g. 'trending' or 'recommendations:550'
+    position = db.Column(db.Integer, primary_key=True)
+    movie_id = db.Column(db.Integer, db.ForeignKey('catalog_movies.id'), nullable=False)
+    synced_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class PrecomputedRecommendations(db.Model):
+    """Model for recommendation lists written by precompute.py, one row per movie or user."""
+    __tablename__ = 'precomputed_recommendations'
+
+    kind = db.Column(db.String(10), primary_key=True)  # 'movie' or 'user'
+    subject_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    movie_ids = db.Column(db.Text, nullable=False)  # comma-separated, best first
+    input_hash = db.Column(db.String(32), nullable=False)  # digest of the inputs the list was computed from
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    @staticmethod
+    def get(kind, subject_id):
+        """Returns the precomputed movie IDs for a movie or user, or None if the job has not covered it."""
+        row = db.session.get(PrecomputedRecommendations, (kind, subject_id))
+        if row is None:
+            return None
+        return [int(movie_id) for movie_id in row.movie_ids.split(',') if movie_id]
+
+    @staticmethod
+    def input_hashes(kind):
+        """Returns the stored input hash of every row of a kind, keyed by subject ID."""
+        return dict(db.session.execute(
+            select(PrecomputedRecommendations.subject_id, PrecomputedRecommendations.input_hash)
+            .where(PrecomputedRecommendations.kind == kind)
+        ).all())
+
+    @staticmethod
+    def store(kind, rows):
+        """Upserts `(subject_id, movie_ids, input_hash)` rows of a kind, 500 per statement."""
+        now = datetime.utcnow()
+        for start in range(0, len(rows), 500):
+            stmt = dialect_insert(PrecomputedRecommendations.__table__).values([
+                {
+                    'kind': kind,
+                    'subject_id': subject_id,
+                    'movie_ids': ','.join(str(movie_id) for movie_id in movie_ids),
+                    'input_hash': input_hash,
+                    'computed_at': now
+                }
+                for subject_id, movie_ids, input_hash in rows[start:start + 500]
+            ])
+            db.session.execute(stmt.on_conflict_do_update(
+                index_elements=['kind', 'subject_id'],
+                set_={name: stmt.excluded[name] for name in ('movie_ids', 'input_hash', 'computed_at')}
+            ))
+        db.session.commit()
+
+    @staticmethod
+    def remove(kind, subject_ids):
+        """Deletes the rows of a kind for subjects that no longer have inputs."""
+        subject_ids = list(subject_ids)
+        for start in range(0, len(subject_ids), 500):
+            db.session.execute(delete(PrecomputedRecommendations).where(
+                PrecomputedRecommendations.kind == kind,
+                PrecomputedRecommendations.subject_id.in_(subject_ids[start:start + 500])
+            ))
+        db.session.commit()
+
+class ActivityCount(db.Model):
+    """Model for site activity counts per time bucket, event kind and movie, checkpointed by activity.py."""
+    __tablename__ = 'activity_counts'
+
+    bucket_start = db.Column(db.Integer, primary_key=True, autoincrement=False)  # Unix time the bucket starts
+    kind = db.Column(db.String(20), primary_key=True)  # 'view', 'watchlist', 'favorites' or 'review'
+    movie_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    count = db.Column(db.Integer, nullable=False)
+
+    @staticmethod
+    def add(rows):
+        """Adds `(bucket_start, kind, movie_id, count)` rows to the stored counts, 500 per statement."""
+        for start in range(0, len(rows), 500):
+            stmt = dialect_insert(ActivityCount.__table__).values([
+                {'bucket_start': bucket_start, 'kind': kind, 'movie_id': movie_id, 'count': count}
+                for bucket_start, kind, movie_id, count in rows[start:start + 500]
+            ])
+            db.session.execute(stmt.on_conflict_do_update(
+                index_elements=['bucket_start', 'kind', 'movie_id'],
+                set_={'count': ActivityCount.count + stmt.excluded['count']}
+            ))
+        db.session.commit()
+
+    @staticmethod
+    def since(bucket_start, batch_size=5000):
+        """Yields `(bucket_start, kind, movie_id, count)` rows from `bucket_start` on, streamed in batches."""
+        stmt = select(ActivityCount.bucket_start, ActivityCount.kind, ActivityCount.movie_id, ActivityCount.count)
+        yield from db.session.execute(
+            stmt.where(ActivityCount.bucket_start >= bucket_start).execution_options(yield_per=batch_size)
+        )
+
+    @staticmethod
+    def prune(before):
+        """Deletes counts of buckets that started before `before`."""
+        db.session.execute(delete(ActivityCount).where(ActivityCount.bucket_start < before))
+        db.session.commit()
+
+class CatalogSyncState(db.Model):
+    """Model for bookkeeping values of the catalog sync job, such as the last changes sync."""
+    __tablename__ = 'catalog_sync_state'
+
+    key = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.String(200), nullable=False)
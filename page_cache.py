@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask import g, make_response, render_template, request, session
+from flask_login import current_user
+from markupsafe import Markup
+
+from cache import MemoryBackend
+
+# Set to 0 to render every page and fragment from scratch
+ENABLED = os.environ.get('PAGE_CACHE', '1') == '1'
+
+# Rendered HTML is keyed on the data it was rendered from, so it never goes
+# stale; these only bound memory, evicting the least recently used versions
+fragments = MemoryBackend(int(os.environ.get('FRAGMENT_CACHE_ENTRIES', 512)))
+pages = MemoryBackend(int(os.environ.get('PAGE_CACHE_ENTRIES', 256)))
+# Content digests of cached fetch results, keyed on the expiry stored with
+# each value; a refresh stores a new expiry, so old digests age out too
+digests = MemoryBackend(int(os.environ.get('DIGEST_CACHE_ENTRIES', 1024)))
+
+_stats = {'fragments': {'hits': 0, 'misses': 0}, 'pages': {'hits': 0, 'misses': 0, 'not_modified': 0}}
+_stats_lock = threading.Lock()
+
+
+def _count(kind, name):
+    with _stats_lock:
+        _stats[kind][name] += 1
+
+
+def data_version(*values):
+    """Returns a short digest of the data a page or fragment is rendered from.
+
+    When a list refreshes with different movies, ratings or images its
+    version changes, so cached HTML for the old data is simply never looked
+    up again and ages out of the LRU.
+    """
+    payload = json.dumps(values, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.blake2b(payload.encode(), digest_size=12).hexdigest()
+
+
+def cached_fragment(template, movies, **params):
+    """Renders a movie list fragment, reusing the HTML rendered for the same data.
+
+    Fragments only depend on the movies passed in, so they are shared between
+    anonymous and logged-in visitors. Inside `render_page` they are keyed on
+    the movie IDs and the page's source versions; elsewhere on the movies
+    themselves. Available in templates as a global.
+    """
+    if not ENABLED:
+        return Markup(render_template(template, movies=movies, **params))
+    versions = g.get('page_versions')
+    if versions is not None and None not in versions:
+        version = data_version([movie['id'] for movie in movies], versions, params)
+    else:
+        version = data_version(movies, params)
+    key = f'{template}:{version}'
+    entry = fragments.get(key)
+    if entry is not None:
+        _count('fragments', 'hits')
+        return Markup(entry[0])
+    _count('fragments', 'misses')
+    html = render_template(template, movies=movies, **params)
+    fragments.set(key, html, float('inf'))
+    return Markup(html)
+
+
+def source_versions(*sources):
+    """Returns the versions of the cached fetches a page is rendered from, and whether they are all fresh.
+
+    Sources are `(fetcher, *args)` tuples. A version is a digest of the
+    stored value, so every worker holding the same data agrees on it, and
+    is None while nothing is stored. Digests are computed once per stored
+    value. Read them before fetching the page's data, so a page is never
+    stored under versions newer than the data it shows.
+    """
+    versions, fresh, now = [], True, time.time()
+    for fetcher, *args in sources:
+        expires_at = fetcher.expires_at(*args)
+        if expires_at is None:
+            versions.append(None)
+            fresh = False
+            continue
+        key = f'{fetcher.__name__}:{args}:{expires_at}'
+        entry = digests.get(key)
+        if entry is None:
+            digest = data_version(fetcher.stale(*args))
+            digests.set(key, digest, float('inf'))
+        else:
+            digest = entry[0]
+        versions.append(digest)
+        fresh = fresh and expires_at > now
+    return versions, fresh
+
+
+def _cacheable():
+    # Flashed messages and anything user specific must not be shared
+    return ENABLED and not current_user.is_authenticated and '_flashes' not in session
+
+
+def _cache_headers(response, etag):
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+
+
+def render_page(template, sources, fetch, **context):
+    """Renders a catalog page, serving anonymous visitors from the page cache.
+
+    `sources` are the `(fetcher, *args)` cached fetches the page shows and
+    `fetch` returns their data as template context; `context` holds the
+    rest, which must follow from the URL. Anonymous responses carry an ETag
+    built from the URL and the sources' versions, so it is the same in every
+    worker. While the sources are fresh, conditional requests are answered
+    with 304 and cached pages served without calling `fetch`. Logged-in
+    visitors get a fresh render that still reuses cached fragments.
+    """
+    versions, fresh = source_versions(*sources)
+    g.page_versions = versions
+    if not _cacheable():
+        return render_template(template, **fetch(), **context)
+
+    etag = data_version(request.full_path, template, versions)
+    if fresh and etag in request.if_none_match:
+        _count('pages', 'not_modified')
+        response = make_response('', 304)
+        _cache_headers(response, etag)
+        return response
+
+    entry = pages.get(etag) if fresh else None
+    if entry is None:
+        # Going through the fetchers lets stale sources refresh
+        data = fetch()
+        if None in versions:
+            # Sources missing before the fetch are stored now
+            versions, _ = source_versions(*sources)
+            g.page_versions = versions
+            etag = data_version(request.full_path, template, versions)
+        entry = pages.get(etag)
+    if entry is not None:
+        _count('pages', 'hits')
+        body, last_modified = entry[0]
+    else:
+        _count('pages', 'misses')
+        body, last_modified = render_template(template, **data, **context), datetime.now(timezone.utc).replace(microsecond=0)
+        pages.set(etag, (body, last_modified), float('inf'))
+
+    response = make_response(body)
+    _cache_headers(response, etag)
+    response.last_modified = last_modified
+    response.make_conditional(request)
+    if response.status_code == 304:
+        _count('pages', 'not_modified')
+    return response
+
+
+def clear():
+    """Drops every cached page and fragment."""
+    fragments.clear()
+    pages.clear()
+    digests.clear()
+
+
+def stats():
+    with _stats_lock:
+        return {
+            'fragments': dict(_stats['fragments'], entries=len(fragments)),
+            'pages': dict(_stats['pages'], entries=len(pages)),
+        }
+
+
+def init_app(app):
+    app.add_template_global(cached_fragment)
@@ -0,0 +1,251 @@
+"""Precomputes recommendation lists so views read them instead of scoring on each request.
+
+Run it after rebuilding the content, ANN and collaborative indexes, e.g. nightly:
+
+    python precompute.py              # movies and users whose inputs changed
+    python precompute.py --full       # recompute every list
+    python precompute.py --movies     # only similar-movie lists
+    python precompute.py --users      # only per-user picks
+"""
+import argparse
+import hashlib
+import multiprocessing
+import os
+import time
+import numpy as np
+
+import collaborative
+import recommendation
+from models import PrecomputedRecommendations
+
+# Movies kept per list; movie pages show 10 and the "for you" page 20
+TOP_N = 20
+
+# Upper bound on similarity scores held in memory per chunk of movies
+CHUNK_CELLS = 2 ** 24
+
+USER_CHUNK = 500
+
+# Indexes loaded once per worker process by `_init_worker`
+_worker = {}
+
+
+def _digest(*parts):
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else np.ascontiguousarray(part).tobytes())
+    return h.hexdigest()
+
+
+def _init_worker(top_n, cf_weight):
+    content = recommendation.get_content_index()
+    cf = collaborative.get_index()
+    if content is not None:
+        ids = np.asarray(content.ids, dtype=np.int64)
+    elif cf is not None:
+        ids = np.asarray(cf.ids, dtype=np.int64)
+    else:
+        ids = np.zeros(0, dtype=np.int64)
+    # Column of every collaborative movie among the scored movies, -1 if absent
+    cf_columns = None
+    if cf is not None:
+        cf_columns = np.full(len(cf.ids), -1, dtype=np.int64)
+        if len(ids):
+            order = np.argsort(ids)
+            positions = np.searchsorted(ids[order], cf.ids).clip(max=len(ids) - 1)
+            cf_columns = np.where(ids[order][positions] == cf.ids, order[positions], -1)
+    # Large catalogs take content neighbours from the ANN index rather than scoring every pair
+    ann_index = content.ann_index() if content is not None else None
+    _worker.pop('cf_version', None)
+    _worker.update(content=content, cf=cf, ann=ann_index, ids=ids, cf_columns=cf_columns, top_n=top_n, cf_weight=cf_weight)
+
+
+def movie_universe():
+    """Returns the IDs of the movies that get similar-movie lists, in index row order."""
+    _init_worker(TOP_N, recommendation.CF_WEIGHT)
+    return _worker['ids']
+
+
+def _index_versions():
+    # Changing the content or ANN index, or inserting movies into the ANN
+    # index, changes which movies every list is chosen from. Versions follow
+    # index content, so a rebuild from unchanged data recomputes nothing
+    content, ann_index = _worker['content'], _worker['ann']
+    return (
+        content.version if content is not None else None,
+        (sorted((key, value) for key, value in ann_index.meta.items() if key != 'built_at'),
+         _digest(ann_index.delta_ids)) if ann_index is not None else None,
+    )
+
+
+def _movie_hashes(start, stop):
+    # A list changes when the movie's content vector, its collaborative
+    # neighbours or the indexes it is scored against do
+    content, cf, ids = _worker['content'], _worker['cf'], _worker['ids']
+    cf_rows, found = cf._rows(ids[start:stop]) if cf is not None else (None, np.zeros(stop - start, dtype=bool))
+    settings = str((_worker['top_n'], _worker['cf_weight'], _index_versions())).encode()
+    hashes = []
+    for offset, row in enumerate(range(start, stop)):
+        parts = [settings]
+        if content is not None:
+            begin, end = content.matrix.indptr[row], content.matrix.indptr[row + 1]
+            parts += [content.matrix.indices[begin:end], content.matrix.data[begin:end]]
+        if found[offset]:
+            begin, end = cf.indptr[cf_rows[offset]], cf.indptr[cf_rows[offset] + 1]
+            parts += [cf.neighbours[begin:end], cf.scores[begin:end]]
+        hashes.append(_digest(*parts))
+    return hashes, cf_rows, found
+
+
+def _score_movies(task):
+    """Scores one chunk of movies against every movie; returns `(movie_id, movie_ids, input_hash)` rows."""
+    start, stop, stored = task
+    content, cf, ids, top_n = _worker['content'], _worker['cf'], _worker['ids'], _worker['top_n']
+    hashes, cf_rows, found = _movie_hashes(start, stop)
+    changed = np.array([stored.get(int(ids[row])) != hashes[row - start] for row in range(start, stop)], dtype=bool)
+    rows = np.arange(start, stop)[changed]
+    if not len(rows):
+        return []
+
+    scores = np.zeros((len(rows), len(ids)), dtype=np.float32)
+    # Each model's scores are scaled to [0, 1] per movie before blending, as in
+    # recommendation.get_blended_recommendations
+    cf_weight = _worker['cf_weight'] if content is not None else 1.0
+    if content is not None and _worker['ann'] is not None:
+        sims = np.zeros((len(rows), len(ids)), dtype=np.float32)
+        for offset, row in enumerate(rows):
+            for movie_id, score in content._ann_scores(_worker['ann'], content.matrix[row], top_n * 2, exclude=int(ids[row])):
+                # Movies inserted after the content index was built have no column here
+                if movie_id in content.rows:
+                    sims[offset, content.rows[movie_id]] = score
+    elif content is not None:
+        sims = (content.matrix[rows] @ content.matrix.T).toarray()
+        sims[np.arange(len(rows)), rows] = 0.0
+    if content is not None:
+        top = sims.max(axis=1, keepdims=True)
+        scores += (1 - cf_weight) * sims / np.where(top > 0, top, 1.0)
+    if cf is not None:
+        for offset, row in enumerate(rows - start):
+            if not found[row]:
+                continue
+            begin, end = cf.indptr[cf_rows[row]], cf.indptr[cf_rows[row] + 1]
+            columns = _worker['cf_columns'][cf.neighbours[begin:end]]
+            values = np.asarray(cf.scores[begin:end])
+            if len(values) and values[0] > 0:
+                keep = columns >= 0
+                scores[offset, columns[keep]] += cf_weight * values[keep] / values[0]
+
+    k = min(top_n, len(ids))
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+    return [
+        (int(ids[row]), ids[top[offset][top_scores[offset] > 0]].tolist(), hashes[row - start])
+        for offset, row in enumerate(rows)
+    ]
+
+
+def _score_users(task):
+    """Scores one chunk of users' profiles; returns `(user_id, movie_ids, input_hash)` rows for changed users."""
+    cf, top_n = _worker['cf'], _worker['top_n']
+    if 'cf_version' not in _worker:
+        # Every neighbour list can reach a profile, so a user's list follows
+        # the whole index's content rather than when it was built
+        _worker['cf_version'] = _digest(cf.ids, cf.indptr, cf.neighbours, cf.scores)
+    settings = str((top_n, _worker['cf_version'])).encode()
+    results = []
+    for user_id, movies, weights, stored_hash in task:
+        input_hash = _digest(settings, movies, weights)
+        if input_hash == stored_hash:
+            continue
+        profile = {}
+        for movie_id, weight in zip(movies.tolist(), weights.tolist()):
+            profile[movie_id] = profile.get(movie_id, 0.0) + weight
+        results.append((user_id, [movie_id for movie_id, _ in cf.for_user(profile, top_n)], input_hash))
+    return results
+
+
+def user_profiles():
+    """Yields `(user_id, movie_ids, weights)` for every user with saved movies or positive reviews.
+
+    Interactions are gathered into flat arrays and grouped with one sort,
+    rather than as a dict per user.
+    """
+    chunks = list(collaborative.iter_interactions())
+    if not chunks:
+        return
+    users, movies, weights = (np.concatenate(parts) for parts in zip(*chunks))
+    order = np.lexsort((movies, users))
+    users, movies, weights = users[order], movies[order], weights[order]
+    bounds = np.flatnonzero(np.diff(users)) + 1
+    for start, stop in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [len(users)]))):
+        yield int(users[start]), movies[start:stop], weights[start:stop]
+
+
+def _pool(workers):
+    return multiprocessing.Pool(workers, initializer=_init_worker, initargs=(TOP_N, recommendation.CF_WEIGHT))
+
+
+def precompute_movies(full=False, workers=None):
+    """Writes similar-movie lists for every indexed movie whose inputs changed; returns how many."""
+    ids = movie_universe()
+    stored = PrecomputedRecommendations.input_hashes('movie')
+    previous = {} if full else stored
+    chunk = max(1, min(256, CHUNK_CELLS // max(len(ids), 1)))
+    tasks = [
+        (start, min(start + chunk, len(ids)), {int(movie_id): previous.get(int(movie_id)) for movie_id in ids[start:start + chunk]})
+        for start in range(0, len(ids), chunk)
+    ]
+    written = 0
+    with _pool(workers) as pool:
+        for rows in pool.imap_unordered(_score_movies, tasks):
+            PrecomputedRecommendations.store('movie', rows)
+            written += len(rows)
+    PrecomputedRecommendations.remove('movie', set(stored) - set(ids.tolist()))
+    return written
+
+
+def precompute_users(full=False, workers=None):
+    """Writes "for you" lists for every user whose interactions or the collaborative index changed; returns how many."""
+    if collaborative.get_index() is None:
+        return 0
+    stored = PrecomputedRecommendations.input_hashes('user')
+    previous = {} if full else stored
+    active, tasks, task = set(), [], []
+    for user_id, movies, weights in user_profiles():
+        active.add(user_id)
+        task.append((user_id, movies, weights, previous.get(user_id)))
+        if len(task) == USER_CHUNK:
+            tasks.append(task)
+            task = []
+    if task:
+        tasks.append(task)
+    written = 0
+    with _pool(workers) as pool:
+        for rows in pool.imap_unordered(_score_users, tasks):
+            PrecomputedRecommendations.store('user', rows)
+            written += len(rows)
+    PrecomputedRecommendations.remove('user', set(stored) - active)
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Precompute recommendation lists for movies and users.")
+    parser.add_argument('--movies', action='store_true', help="Only precompute similar-movie lists.")
+    parser.add_argument('--users', action='store_true', help="Only precompute per-user picks.")
+    parser.add_argument('--full', action='store_true', help="Recompute every list, not just those whose inputs changed.")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Worker processes.")
+    args = parser.parse_args()
+    both = not args.movies and not args.users
+
+    from app import app
+    with app.app_context():
+        if args.movies or both:
+            started = time.perf_counter()
+            count = precompute_movies(args.full, args.workers)
+            print(f"Precomputed {count} movie lists in {time.perf_counter() - started:.1f}s.")
+        if args.users or both:
+            started = time.perf_counter()
+            count = precompute_users(args.full, args.workers)
+            print(f"Precomputed {count} user lists in {time.perf_counter() - started:.1f}s.")
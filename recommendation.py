@@ -1,33 +1,52 @@
-import requests
-import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import linear_kernel
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+import numpy as np
 
-API_KEY = '9ba93d1cf5e3054788a377f636ea1033'  # Replace with your TMDB API key
+# pandas, scipy and scikit-learn take over a second to import, so they are
+# imported where they are used; see warm_up()
+import ann
+import catalog
+import collaborative
+import images
+import instrumentation
+from models import PrecomputedRecommendations
+from tmdb_client import client as tmdb
+
+# Directory holding the precomputed content-similarity index
+INDEX_DIR = os.environ.get('CONTENT_INDEX_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'content_index'))
+
+# Share of a blended score given to the collaborative model over content similarity
+CF_WEIGHT = float(os.environ.get('CF_WEIGHT', 0.5))
 
 def fetch_movie_data(movie_title):
     """Fetches movie data from TMDB API based on movie title."""
-    url = f'https://api.themoviedb.org/3/search/movie?api_key={API_KEY}&query={movie_title}'
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json().get('results', [])
+    data = tmdb.get_json('/search/movie', query=movie_title)
+    if data is not None:
+        return data.get('results', [])
     else:
         return []
 
 def fetch_movie_details(movie_id):
     """Fetches detailed data of a movie by its ID from TMDB API."""
-    url = f'https://api.themoviedb.org/3/movie/{movie_id}?api_key={API_KEY}&language=en-US'
-    response = requests.get(url)
-    if response.status_code == 200:
-        movie = response.json()
+    movie = tmdb.get_json(f'/movie/{movie_id}', language='en-US')
+    if movie is not None:
         movie['rating'] = movie.get('vote_average', 'N/A')
         poster_path = movie.get('poster_path')
-        movie['poster'] = f"https://image.tmdb.org/t/p/w300{poster_path}" if poster_path else "https://via.placeholder.com/300x450?text=No+Image"
+        movie['poster'] = poster_url(poster_path)
         return movie
     return None
 
+@instrumentation.timed('recommend.create_movie_dataset')
 def create_movie_dataset(movie_list):
     """Creates a DataFrame from a list of movie details, used for similarity calculations."""
+    import pandas as pd
     movies = []
     for movie in movie_list:
         details = fetch_movie_details(movie['id'])
@@ -42,6 +61,7 @@ def create_movie_dataset(movie_list):
             })
     return pd.DataFrame(movies)
 
+@instrumentation.timed('recommend.preprocess_movie_data')
 def preprocess_movie_data(movies_df):
     """Prepares and combines text features for content filtering."""
     # Fill NaNs in overview
@@ -50,15 +70,20 @@ def preprocess_movie_data(movies_df):
     movies_df['content'] = movies_df['genres'] + " " + movies_df['overview']
     return movies_df
 
+@instrumentation.timed('recommend.calculate_similarity')
 def calculate_similarity(movies_df):
     """Calculates cosine similarity between movies based on TF-IDF vectors of the content features."""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.metrics.pairwise import linear_kernel
     tfidf = TfidfVectorizer(stop_words='english')
     tfidf_matrix = tfidf.fit_transform(movies_df['content'])
     cosine_sim = linear_kernel(tfidf_matrix, tfidf_matrix)
     return cosine_sim
 
+@instrumentation.timed('recommend.get_content_recommendations')
 def get_content_recommendations(movie_id, movies_df, cosine_sim, num_recommendations=10):
     """Fetches content-based recommendations for a given movie."""
+    import pandas as pd
     indices = pd.Series(movies_df.index, index=movies_df['id']).drop_duplicates()
     idx = indices[movie_id]
 
@@ -73,8 +98,12 @@ def get_content_recommendations(movie_id, movies_df, cosine_sim, num_recommendat
     movie_indices = [i[0] for i in sim_scores]
     return movies_df.iloc[movie_indices][['id', 'title', 'rating', 'poster']].to_dict(orient='records')
 
-def get_movie_recommendations(movie_title, num_recommendations=10):
-    """Main function to fetch content-based movie recommendations."""
+@instrumentation.timed('recommend.get_title_recommendations')
+def get_title_recommendations(movie_title, num_recommendations=10):
+    """Fetches content-based recommendations by searching TMDB and ranking the results on the fly.
+
+    Used when no precomputed content index has been built.
+    """
     # Fetch initial movies matching the title
     movie_list = fetch_movie_data(movie_title)
     if not movie_list:
@@ -91,9 +120,363 @@ def get_movie_recommendations(movie_title, num_recommendations=10):
     first_movie_id = movie_list[0]['id']
     return get_content_recommendations(first_movie_id, movies_df, cosine_sim, num_recommendations)
 
-# Example usage
+def movie_content(movie):
+    """Combines genres and overview into the text feature used for content filtering."""
+    genres = movie.get('genres') or []
+    genre_names = " ".join(genre['name'] if isinstance(genre, dict) else genre for genre in genres)
+    return f"{genre_names} {movie.get('overview') or ''}"
+
+def poster_url(poster_path):
+    return images.url_for_use(poster_path, 'thumb')
+
+def content_version(ids, vocabulary, matrix):
+    """Digests a content index's movie IDs, vocabulary and TF-IDF weights.
+
+    Rebuilding from the same movie content yields the same version, so
+    indexes derived from it (the ANN index, precomputed lists) stay valid.
+    """
+    h = hashlib.blake2b(digest_size=12)
+    h.update(np.asarray(ids, dtype=np.int64).tobytes())
+    h.update('\n'.join(vocabulary).encode())
+    for array in (matrix.indptr, matrix.indices, matrix.data):
+        h.update(np.ascontiguousarray(array).tobytes())
+    return h.hexdigest()
+
+def build_content_index(movies, index_dir=INDEX_DIR):
+    """Fits TF-IDF over a movie catalog and writes the sparse index to `index_dir`.
+
+    The matrix is stored as CSR component arrays so it can be memory-mapped
+    at load time. Rows are L2-normalised, so a dot product is cosine similarity.
+    The index is written next to the old one and swapped in with renames, as
+    in collaborative.py, so processes serving the old one are unaffected.
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    movies = list({movie['id']: movie for movie in movies}.values())
+    tfidf = TfidfVectorizer(stop_words='english', dtype=np.float32)
+    matrix = tfidf.fit_transform([movie_content(movie) for movie in movies]).tocsr()
+    matrix.sort_indices()
+
+    building = index_dir + '.building'
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+    np.save(os.path.join(building, 'data.npy'), matrix.data)
+    np.save(os.path.join(building, 'indices.npy'), matrix.indices.astype(np.int32))
+    np.save(os.path.join(building, 'indptr.npy'), matrix.indptr.astype(np.int64))
+    ids = np.array([movie['id'] for movie in movies], dtype=np.int64)
+    np.save(os.path.join(building, 'ids.npy'), ids)
+    with open(os.path.join(building, 'vectorizer.pkl'), 'wb') as f:
+        pickle.dump(tfidf, f)
+    with open(os.path.join(building, 'meta.json'), 'w') as f:
+        json.dump({
+            'shape': list(matrix.shape),
+            'built_at': time.time(),
+            'version': content_version(ids, tfidf.get_feature_names_out(), matrix),
+            'movies': [
+                {
+                    'id': movie['id'],
+                    'title': movie.get('title', ''),
+                    'rating': movie.get('vote_average', 'N/A'),
+                    'poster': poster_url(movie.get('poster_path')),
+                    'poster_path': movie.get('poster_path')
+                }
+                for movie in movies
+            ]
+        }, f)
+
+    old = index_dir + '.old'
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(index_dir):
+        os.rename(index_dir, old)
+    os.rename(building, index_dir)
+    shutil.rmtree(old, ignore_errors=True)
+    return len(movies)
+
+class ContentIndex:
+    """Precomputed TF-IDF index answering similar-movie queries with one sparse product."""
+
+    def __init__(self, matrix, ids, movies, vectorizer_file, built_at=None, version=None):
+        self.matrix = matrix
+        self.ids = ids
+        self.movies = movies
+        self.built_at = built_at
+        self.version = version
+        self.rows = {int(movie_id): row for row, movie_id in enumerate(ids)}
+        self._vectorizer_file = vectorizer_file
+        self._vectorizer = None
+        self._vectorizer_lock = threading.Lock()
+
+    @classmethod
+    def load(cls, index_dir=INDEX_DIR):
+        """Loads an index built by `build_content_index`, memory-mapping the arrays."""
+        from scipy.sparse import csr_matrix
+        with open(os.path.join(index_dir, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = [np.load(os.path.join(index_dir, f'{name}.npy'), mmap_mode='r') for name in ('data', 'indices', 'indptr')]
+        matrix = csr_matrix(tuple(arrays), shape=tuple(meta['shape']), copy=False)
+        ids = np.load(os.path.join(index_dir, 'ids.npy'))
+        # Opened now so the vectorizer unpickled later comes from this build,
+        # even if a rebuild has swapped the directory since
+        vectorizer_file = open(os.path.join(index_dir, 'vectorizer.pkl'), 'rb')
+        return cls(matrix, ids, meta['movies'], vectorizer_file, meta.get('built_at'), meta.get('version'))
+
+    def load_vectorizer(self):
+        """Unpickles the TF-IDF vectorizer, which only movies outside the index need, and returns it."""
+        with self._vectorizer_lock:
+            if self._vectorizer is None:
+                with self._vectorizer_file as f:
+                    self._vectorizer = pickle.load(f)
+        return self._vectorizer
+
+    @property
+    def vectorizer(self):
+        # Only needed for movies outside the index, so unpickled on first use
+        # unless warm_up() loaded it
+        if self._vectorizer is None:
+            return self.load_vectorizer()
+        return self._vectorizer
+
+    def __contains__(self, movie_id):
+        return movie_id in self.rows
+
+    @instrumentation.timed('recommend.index_similar')
+    def similar(self, movie_id, num_recommendations=10):
+        """Returns the most similar indexed movies to an indexed movie."""
+        row = self.rows[movie_id]
+        return self._top_k(self.matrix[row], num_recommendations, exclude=movie_id)
+
+    @instrumentation.timed('recommend.index_similar_to_content')
+    def similar_to_content(self, content, num_recommendations=10, exclude=None):
+        """Returns the indexed movies most similar to a free-text content feature."""
+        return self._top_k(self.vectorizer.transform([content]), num_recommendations, exclude=exclude)
+
+    def ann_index(self):
+        """Returns the ANN index for large catalogs if it was built from this content index, else None.
+
+        An ANN index left over from an earlier content build projects another
+        vocabulary, so queries fall back to exact scoring until it is rebuilt.
+        """
+        if len(self.ids) < ann.MIN_MOVIES:
+            return None
+        ann_index = ann.get_index()
+        if ann_index is None or self.version is None or ann_index.meta.get('content_version') != self.version:
+            return None
+        return ann_index
+
+    def _top_k(self, query, k, exclude=None):
+        # Large catalogs are searched approximately in sub-linear time, see ann.py
+        ann_index = self.ann_index()
+        if ann_index is not None:
+            return self._ann_top_k(ann_index, query, k, exclude)
+        scores = (self.matrix @ query.T).toarray().ravel()
+        if exclude in self.rows:
+            scores[self.rows[exclude]] = -1.0
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [dict(self.movies[i], score=float(scores[i])) for i in top if scores[i] > 0]
+
+    def _ann_scores(self, ann_index, query, k, exclude=None, probes=ann.PROBES):
+        """Returns up to `k` (movie ID, score) pairs for a TF-IDF query from the ANN index, best first.
+
+        The reduced vectors shortlist `ann.RERANK` candidates per result, which
+        are re-ranked by their exact TF-IDF cosine; movies inserted since the
+        content index was built keep their approximate score.
+        """
+        scored = dict(ann_index.search(ann_index.embed(query)[0], k * ann.RERANK, exclude=exclude, probes=probes))
+        indexed = [movie_id for movie_id in scored if movie_id in self.rows]
+        if indexed:
+            exact = (self.matrix[[self.rows[movie_id] for movie_id in indexed]] @ query.T).toarray().ravel()
+            scored.update(zip(indexed, exact.tolist()))
+        return sorted((item for item in scored.items() if item[1] > 0), key=lambda item: -item[1])[:k]
+
+    def _ann_top_k(self, ann_index, query, k, exclude=None, probes=ann.PROBES):
+        ranked = self._ann_scores(ann_index, query, k, exclude, probes)
+        # Inserted movies are described from the catalog
+        inserted = [movie_id for movie_id, _ in ranked if movie_id not in self.rows]
+        described = {movie['id']: movie for movie in describe_movies(inserted)} if inserted else {}
+        return [
+            dict(self.movies[self.rows[movie_id]] if movie_id in self.rows else described[movie_id], score=score)
+            for movie_id, score in ranked
+            if movie_id in self.rows or movie_id in described
+        ]
+
+_content_index = None
+_content_index_mtime = None
+_content_index_lock = threading.Lock()
+
+def get_content_index():
+    """Returns the process-wide content index, or None if not built.
+
+    The index is reloaded when a rebuild replaces it, as with the
+    collaborative index.
+    """
+    global _content_index, _content_index_mtime
+    try:
+        mtime = os.stat(os.path.join(INDEX_DIR, 'meta.json')).st_mtime
+    except OSError:
+        return _content_index
+    if mtime != _content_index_mtime:
+        with _content_index_lock:
+            if mtime != _content_index_mtime:
+                _content_index = ContentIndex.load(INDEX_DIR)
+                _content_index_mtime = mtime
+    return _content_index
+
+@instrumentation.timed('recommend.get_movie_recommendations')
+def get_movie_recommendations(movie_id, movie=None, num_recommendations=10):
+    """Main function to fetch content-based movie recommendations.
+
+    Served from the precomputed content index without any TMDB calls. A movie
+    outside the index is matched on its own genres and overview; without an
+    index this falls back to ranking a live title search.
+    """
+    index = get_content_index()
+    if index is None:
+        return get_title_recommendations(movie['title'], num_recommendations) if movie else []
+    if movie_id in index:
+        return index.similar(movie_id, num_recommendations)
+    if movie:
+        return index.similar_to_content(movie_content(movie), num_recommendations, exclude=movie_id)
+    return []
+
+def warm_up():
+    """Imports the ML stack and loads the recommendation indexes ahead of the first request.
+
+    Lets a worker that serves movie pages pay for these at start-up rather
+    than on its first movie page; see RECOMMENDER_WARMUP in app.py.
+    """
+    import sklearn.feature_extraction.text  # noqa: F401
+    index = get_content_index()
+    if index is not None:
+        index.load_vectorizer()
+    collaborative.get_index()
+    ann.get_index()
+
+def insert_catalog_movies(batch_size=1000):
+    """Adds catalog movies that are in neither the content nor the ANN index to the ANN index.
+
+    Lets movies synced after the last full rebuild show up in similarity
+    results; returns how many were inserted.
+    """
+    index = get_content_index()
+    ann_index = index.ann_index() if index is not None else None
+    if ann_index is None:
+        return 0
+    inserted, batch = 0, []
+    # Streamed from the catalog; the trailing None flushes the last batch
+    for movie in itertools.chain(catalog.iter_movies(), [None]):
+        if movie is not None:
+            if movie['id'] in index or movie['id'] in ann_index:
+                continue
+            batch.append(movie)
+        if batch and (movie is None or len(batch) >= batch_size):
+            vectors = ann_index.embed(index.vectorizer.transform([movie_content(movie) for movie in batch]))
+            ann_index = ann_index.insert([movie['id'] for movie in batch], vectors)
+            inserted += len(batch)
+            batch = []
+    return inserted
+
+def describe_movies(movie_ids):
+    """Returns recommendation dicts for movie IDs in order, from the catalog, skipping unknown movies."""
+    stored = catalog.get_movies(movie_ids)
+    return [
+        {
+            'id': movie_id,
+            'title': stored[movie_id]['title'],
+            'rating': stored[movie_id]['vote_average'] if stored[movie_id]['vote_average'] is not None else 'N/A',
+            'poster': poster_url(stored[movie_id]['poster_path']),
+            'poster_path': stored[movie_id]['poster_path']
+        }
+        for movie_id in movie_ids if movie_id in stored
+    ]
+
+def get_precomputed_recommendations(movie_id, movie=None, num_recommendations=10):
+    """Reads a movie's recommendations as written by precompute.py.
+
+    Movies the batch job has not covered yet are scored on the spot with
+    `get_blended_recommendations`.
+    """
+    movie_ids = PrecomputedRecommendations.get('movie', movie_id)
+    if movie_ids is None:
+        return get_blended_recommendations(movie_id, movie, num_recommendations)
+    return describe_movies(movie_ids[:num_recommendations])
+
+def _normalized_scores(scored):
+    # Scales one model's (movie ID, score) pairs to [0, 1] so the models blend on equal terms
+    top = max((score for _, score in scored), default=0) or 1.0
+    return {movie_id: score / top for movie_id, score in scored}
+
+@instrumentation.timed('recommend.get_blended_recommendations')
+def get_blended_recommendations(movie_id, movie=None, num_recommendations=10, cf_weight=CF_WEIGHT):
+    """Blends content similarity with what users who saved or liked this movie also liked.
+
+    Each model's scores are scaled to [0, 1] and mixed with `cf_weight`
+    going to the collaborative model. Without a collaborative index, or for
+    movies nobody has interacted with yet, this is the content ranking.
+    """
+    content = get_movie_recommendations(movie_id, movie, num_recommendations * 2)
+    index = collaborative.get_index()
+    neighbours = index.similar(movie_id, num_recommendations * 2) if index is not None else []
+    if not neighbours:
+        return content[:num_recommendations]
+
+    # Title-search fallbacks carry no scores, so rank stands in for them
+    content_scores = _normalized_scores([
+        (rec['id'], rec.get('score', 1.0 - rank / len(content))) for rank, rec in enumerate(content)
+    ])
+    cf_scores = _normalized_scores(neighbours)
+    blended = {
+        candidate: (1 - cf_weight) * content_scores.get(candidate, 0.0) + cf_weight * cf_scores.get(candidate, 0.0)
+        for candidate in content_scores.keys() | cf_scores.keys()
+    }
+    recs = {rec['id']: rec for rec in content}
+    recs.update((rec['id'], rec) for rec in describe_movies([candidate for candidate in cf_scores if candidate not in recs]))
+    ranked = sorted((candidate for candidate in blended if candidate in recs), key=lambda candidate: -blended[candidate])
+    return [dict(recs[candidate], score=blended[candidate]) for candidate in ranked[:num_recommendations]]
+
+def fetch_catalog(pages=5):
+    """Collects a movie catalog from TMDB's popular and top-rated lists for building the index."""
+    genres = tmdb.get_json('/genre/movie/list', language='en-US')
+    genre_names = {genre['id']: genre['name'] for genre in genres.get('genres', [])} if genres is not None else {}
+    movies = {}
+    for list_name in ('popular', 'top_rated'):
+        for page in range(1, pages + 1):
+            data = tmdb.get_json(f'/movie/{list_name}', language='en-US', page=page)
+            if data is None:
+                break
+            for movie in data.get('results', []):
+                movie['genres'] = [genre_names[genre_id] for genre_id in movie.get('genre_ids', []) if genre_id in genre_names]
+                movies[movie['id']] = movie
+    return list(movies.values())
+
+# Build the content index offline, or run an example query
 if __name__ == '__main__':
-    movie_title = 'Inception'  # Example movie title
-    recommendations = get_movie_recommendations(movie_title)
-    for rec in recommendations:
-        print(f"Title: {rec['title']}, Rating: {rec['rating']}, Poster URL: {rec['poster']}")
+    parser = argparse.ArgumentParser(description="Content-based recommendation tools.")
+    parser.add_argument('--build-index', action='store_true', help="Build the precomputed content-similarity index.")
+    parser.add_argument('--catalog', help="JSON file with a list of movies to index instead of fetching from TMDB.")
+    parser.add_argument('--pages', type=int, default=5, help="TMDB list pages to fetch when the local catalog is empty.")
+    args = parser.parse_args()
+
+    if args.build_index:
+        if args.catalog:
+            with open(args.catalog) as f:
+                count = build_content_index(json.load(f))
+        else:
+            # Index the local movie catalog kept up to date by sync_catalog.py,
+            # streamed straight into the build
+            from app import app
+            with app.app_context():
+                movies = catalog.iter_movies()
+                first = next(movies, None)
+                if first is not None:
+                    count = build_content_index(itertools.chain([first], movies))
+            if first is None:
+                count = build_content_index(fetch_catalog(args.pages))
+        print(f"Indexed {count} movies into {INDEX_DIR}.")
+    else:
+        movie_title = 'Inception'  # Example movie title
+        recommendations = get_title_recommendations(movie_title)
+        for rec in recommendations:
+            print(f"Title: {rec['title']}, Rating: {rec['rating']}, Poster URL: {rec['poster']}")
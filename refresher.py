@@ -0,0 +1,114 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+
+class HotKeys:
+    """Thread-safe view counter whose counts halve on every decay, so it tracks what is hot now."""
+
+    def __init__(self, max_keys=1000):
+        self.max_keys = max_keys
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, key):
+        with self._lock:
+            self._counts[key] += 1
+
+    def top(self, n):
+        with self._lock:
+            return [key for key, _ in self._counts.most_common(n)]
+
+    def decay(self):
+        with self._lock:
+            self._counts = Counter({
+                key: count // 2 for key, count in self._counts.most_common(self.max_keys) if count > 1
+            })
+
+
+class RefreshScheduler:
+    """Refreshes cached fetcher results in the background before they expire.
+
+    Jobs are cached fetchers (see `ResponseCache.cached`) with their
+    arguments. Every `interval` seconds each job whose value expires within
+    `lead` seconds, or is not cached at all, is re-fetched and stored, so
+    requests keep hitting a warm cache and never wait on upstream.
+    """
+
+    def __init__(self, app, interval=60, lead=300):
+        self.app = app
+        self.interval = interval
+        self.lead = lead
+        self._jobs = []
+        self._sources = []
+        self._tasks = []
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def add(self, fetcher, *args):
+        """Keeps `fetcher(*args)` warm."""
+        self._jobs.append((fetcher, args))
+
+    def add_source(self, source):
+        """Adds a callable returning further `(fetcher, args)` jobs each run, e.g. the most viewed movies."""
+        self._sources.append(source)
+
+    def add_task(self, task):
+        """Calls `task()` every run, e.g. to rebuild an in-process store when it is due."""
+        self._tasks.append(task)
+
+    def run_once(self):
+        """Refreshes every job that is about to expire; returns how many were refreshed."""
+        refreshed = 0
+        with self.app.app_context():
+            jobs = list(self._jobs)
+            for source in self._sources:
+                jobs.extend(source())
+            deadline = time.time() + self.lead
+            for fetcher, args in jobs:
+                expires_at = fetcher.expires_at(*args)
+                if expires_at is None or expires_at < deadline:
+                    fetcher.refresh(*args, wait=True)
+                    refreshed += 1
+            for task in self._tasks:
+                try:
+                    task()
+                except Exception:
+                    logger.exception("Background task %s failed", getattr(task, '__qualname__', task))
+        return refreshed
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Background refresh failed")
+            self._stop.wait(self.interval)
+
+    def ensure_started(self):
+        """Starts the scheduler thread once per process, including in forked workers."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._thread = threading.Thread(target=self.run_forever, name='refresher', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def stop(self):
+        self._stop.set()
+
+
+if __name__ == '__main__':
+    # Companion worker: keeps a shared cache (CACHE_BACKEND=sqlite) warm for
+    # every web worker. Start the web app with BACKGROUND_REFRESH=off.
+    logging.basicConfig(level=logging.INFO)
+    from app import refresher
+    logger.info("Refreshing every %ss, %ss ahead of expiry", refresher.interval, refresher.lead)
+    refresher.run_forever()
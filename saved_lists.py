@@ -0,0 +1,222 @@
+import csv
+import io
+import json
+from functools import partial
+
+from models import db, UserMovies
+
+# Saved lists a user can have
+CATEGORIES = ('watchlist', 'favorites')
+
+# Movie IDs a single bulk request may name; larger lists go through import
+MAX_BULK_IDS = 10000
+
+# Rows buffered per category before an import writes them
+IMPORT_BATCH_SIZE = 1000
+
+# Bytes read per chunk while parsing a JSON import
+JSON_CHUNK_SIZE = 64 * 1024
+
+# CSV headers accepted for the movie and list columns, e.g. this app's own
+# export or a spreadsheet with TMDB IDs
+MOVIE_ID_COLUMNS = ('movie_id', 'tmdb_id', 'tmdbid', 'id')
+CATEGORY_COLUMNS = ('category', 'list')
+
+
+def movie_id(value):
+    """Parses a TMDB movie ID, returning None for anything that is not a positive integer."""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+def movie_ids(values):
+    """Validates a list of movie IDs from a bulk request, raising ValueError on the first bad one."""
+    if not isinstance(values, list):
+        raise ValueError("movie_ids must be a list.")
+    if len(values) > MAX_BULK_IDS:
+        raise ValueError(f"At most {MAX_BULK_IDS} movie IDs per request; use import for more.")
+    parsed = [movie_id(value) for value in values]
+    if None in parsed:
+        raise ValueError(f"Invalid movie ID: {values[parsed.index(None)]!r}")
+    return parsed
+
+
+def category(value, field='category'):
+    if value not in CATEGORIES:
+        raise ValueError(f"Invalid {field}: {value!r}")
+    return value
+
+
+def apply_operations(user_id, operations):
+    """Applies bulk list operations in one transaction and returns the count each one changed.
+
+    Each operation is a dict: `{"op": "add" | "remove", "category": ...,
+    "movie_ids": [...]}`, `{"op": "move", "from": ..., "to": ...,
+    "movie_ids": [...]}` or `{"op": "clear", "category": ...}`. Everything is
+    validated before anything is written, and a failure rolls back every
+    operation.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise ValueError("operations must be a non-empty list.")
+    if sum(len(op.get('movie_ids') or []) for op in operations if isinstance(op, dict)) > MAX_BULK_IDS:
+        raise ValueError(f"At most {MAX_BULK_IDS} movie IDs per request; use import for more.")
+
+    steps = []
+    for op in operations:
+        if not isinstance(op, dict):
+            raise ValueError("Each operation must be an object.")
+        kind = op.get('op')
+        if kind == 'add':
+            steps.append(partial(UserMovies.add_many, user_id, category(op.get('category')), movie_ids(op.get('movie_ids'))))
+        elif kind == 'remove':
+            steps.append(partial(UserMovies.remove_many, user_id, category(op.get('category')), movie_ids(op.get('movie_ids'))))
+        elif kind == 'clear':
+            steps.append(partial(UserMovies.remove_many, user_id, category(op.get('category'))))
+        elif kind == 'move':
+            source, target = category(op.get('from'), 'from'), category(op.get('to'), 'to')
+            if source == target:
+                raise ValueError("from and to must differ.")
+            steps.append(partial(UserMovies.move_many, user_id, source, target, movie_ids(op.get('movie_ids'))))
+        else:
+            raise ValueError(f"Invalid op: {kind!r}")
+
+    try:
+        counts = [step(commit=False) for step in steps]
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return counts
+
+
+def iter_csv_rows(stream):
+    """Yields (movie ID, category or None) pairs from a CSV text stream with a header row."""
+    reader = csv.DictReader(stream)
+    fields = {name.strip().lower(): name for name in reader.fieldnames or []}
+    id_column = next((fields[name] for name in MOVIE_ID_COLUMNS if name in fields), None)
+    if id_column is None:
+        raise ValueError(f"CSV needs a movie ID column: one of {', '.join(MOVIE_ID_COLUMNS)}.")
+    category_column = next((fields[name] for name in CATEGORY_COLUMNS if name in fields), None)
+    for row in reader:
+        yield movie_id(row.get(id_column)), (row.get(category_column) or '').strip().lower() if category_column else None
+
+
+def iter_json_values(stream, chunk_size=JSON_CHUNK_SIZE):
+    """Yields the elements of a top-level JSON array from a text stream, one at a time.
+
+    Only the current chunk and the element being decoded are held in
+    memory, so arbitrarily long arrays import in bounded space.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, started, eof = '', 0, False, False
+    while True:
+        # Skip whitespace and separators, reading more input when the buffer runs out
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position < len(buffer) or eof:
+                break
+            chunk = stream.read(chunk_size)
+            buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+        if not started:
+            if buffer[position:position + 1] != '[':
+                raise ValueError("JSON import must be an array.")
+            started, position = True, position + 1
+            continue
+        if position >= len(buffer):
+            raise ValueError("Unexpected end of JSON array.")
+        if buffer[position] == ']':
+            return
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise ValueError("Invalid JSON in import.")
+            # The element continues in the next chunk
+            chunk = stream.read(chunk_size)
+            buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+            continue
+        if end == len(buffer) and not eof and not isinstance(value, (dict, list, str)):
+            # A number may continue in the next chunk
+            chunk = stream.read(chunk_size)
+            buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+            continue
+        position = end
+        yield value
+
+
+def iter_json_rows(stream):
+    """Yields (movie ID, category or None) pairs from a JSON array of IDs or `{"movie_id", "category"}` objects."""
+    for value in iter_json_values(stream):
+        if isinstance(value, dict):
+            name = value.get('category')
+            yield movie_id(value.get('movie_id', value.get('id'))), name.strip().lower() if isinstance(name, str) else None
+        else:
+            yield movie_id(value), None
+
+
+def import_rows(user_id, rows, default_category=None, batch_size=IMPORT_BATCH_SIZE):
+    """Adds (movie ID, category) rows to a user's lists in one transaction, `batch_size` rows per write.
+
+    Rows without a category go to `default_category`. Returns counts of
+    rows read, movies added, rows already on their list and rows skipped
+    for an invalid movie ID or list.
+    """
+    counts = {'rows': 0, 'added': 0, 'existing': 0, 'skipped': 0}
+    pending = {name: [] for name in CATEGORIES}
+
+    def flush(name):
+        ids = pending[name]
+        added = UserMovies.add_many(user_id, name, ids, commit=False)
+        counts['added'] += added
+        counts['existing'] += len(ids) - added
+        pending[name] = []
+
+    try:
+        for movie, name in rows:
+            counts['rows'] += 1
+            name = name or default_category
+            if movie is None or name not in pending:
+                counts['skipped'] += 1
+                continue
+            pending[name].append(movie)
+            if len(pending[name]) >= batch_size:
+                flush(name)
+        for name in CATEGORIES:
+            if pending[name]:
+                flush(name)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return counts
+
+
+def export_csv(user_id, category=None):
+    """Yields a user's lists as CSV text chunks, with a `category,movie_id` header."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(('category', 'movie_id'))
+    for count, row in enumerate(UserMovies.iter_entries(user_id, category), 1):
+        writer.writerow(row)
+        if count % IMPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_json(user_id, category=None):
+    """Yields a user's lists as a JSON array of `{"category", "movie_id"}` objects, in chunks."""
+    parts, separator = ['['], ''
+    for name, movie in UserMovies.iter_entries(user_id, category):
+        parts.append(f'{separator}{{"category":"{name}","movie_id":{movie}}}')
+        separator = ','
+        if len(parts) >= IMPORT_BATCH_SIZE:
+            yield ''.join(parts)
+            parts = []
+    parts.append(']')
+    yield ''.join(parts)
@@ -0,0 +1,101 @@
+# sync_catalog.py
+"""Populates and refreshes the local movie catalog from TMDB.
+
+Run it periodically, e.g. from cron:
+
+    python sync_catalog.py            # refresh lists, then changed movies
+    python sync_catalog.py --lists    # only genres and the ordered lists
+    python sync_catalog.py --changes  # only movies TMDB reports as changed
+"""
+import argparse
+import sys
+from datetime import date, timedelta
+from app import app
+from fanout import map_concurrently
+import catalog
+from tmdb_client import client as tmdb
+
+# Lists mirrored into the catalog, with the TMDB path each is read from
+LISTS = {
+    'trending': '/trending/movie/week',
+    'top_rated': '/movie/top_rated',
+    'now_playing': '/movie/now_playing',
+    'popular': '/movie/popular',
+}
+
+def tmdb_get(path, **params):
+    """Calls a TMDB endpoint and returns the decoded JSON, or None on failure."""
+    return tmdb.get_json(path, language='en-US', **params)
+
+def sync_lists(pages=1):
+    """Refreshes genres and every mirrored list, storing the first `pages` pages of each."""
+    genres = tmdb_get('/genre/movie/list')
+    if genres:
+        catalog.upsert_genres(genres.get('genres', []))
+
+    for name, path in LISTS.items():
+        movies = []
+        for page in range(1, pages + 1):
+            data = tmdb_get(path, page=page)
+            if not data:
+                break
+            movies.extend(data.get('results', []))
+            if page >= data.get('total_pages', 1):
+                break
+        if movies:
+            catalog.replace_list(name, movies)
+            print(f"Synced {len(movies)} movies for '{name}'.")
+
+# Longest range /movie/changes accepts
+MAX_CHANGES_DAYS = 14
+
+def fetch_details(movie_id):
+    return tmdb_get(f'/movie/{movie_id}')
+
+def sync_changes(start_date=None):
+    """Refreshes catalog movies that TMDB reports as changed since the last run; returns False on failure.
+
+    A gap longer than TMDB's MAX_CHANGES_DAYS window, e.g. after an outage, is
+    clamped to the window, so the sync catches up instead of failing on
+    every run; older changes wait until lists or misses fetch those movies.
+    """
+    today = date.today()
+    start_date = start_date or catalog.get_state('changes_synced_on') or (today - timedelta(days=1)).isoformat()
+    earliest = (today - timedelta(days=MAX_CHANGES_DAYS)).isoformat()
+    if start_date < earliest:
+        print(f"Changes since {start_date} exceed TMDB's {MAX_CHANGES_DAYS}-day window; syncing from {earliest}.")
+        start_date = earliest
+
+    changed = set()
+    page, total_pages = 1, 1
+    while page <= total_pages:
+        data = tmdb_get('/movie/changes', start_date=start_date, end_date=today.isoformat(), page=page)
+        if not data:
+            print(f"Fetching changes since {start_date} failed on page {page}.", file=sys.stderr)
+            return False
+        changed.update(result['id'] for result in data.get('results', []))
+        total_pages = data.get('total_pages', 1)
+        page += 1
+
+    # Only movies we already hold are refreshed; new ones arrive through lists and misses
+    stale_ids = sorted(changed & catalog.movie_ids())
+    for start in range(0, len(stale_ids), catalog.BATCH_SIZE):
+        batch = stale_ids[start:start + catalog.BATCH_SIZE]
+        catalog.upsert_movies([movie for movie in map_concurrently(fetch_details, batch) if movie])
+    catalog.set_state('changes_synced_on', today.isoformat())
+    print(f"Refreshed {len(stale_ids)} changed movies since {start_date}.")
+    return True
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Sync the local movie catalog from TMDB.")
+    parser.add_argument('--lists', action='store_true', help="Only refresh genres and lists.")
+    parser.add_argument('--changes', action='store_true', help="Only refresh changed movies.")
+    parser.add_argument('--pages', type=int, default=1, help="Pages to store per list.")
+    parser.add_argument('--since', help="Start date (YYYY-MM-DD) for the changes sync.")
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.lists or not args.changes:
+            sync_lists(args.pages)
+        if (args.changes or not args.lists) and not sync_changes(args.since):
+            sys.exit(1)
@@ -0,0 +1,176 @@
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+
+# Upper bound used to find the end of a prefix range in the sorted key array
+_MAX_CHAR = '\U0010ffff'
+
+
+def normalize(text):
+    """Accent-folds, case-folds and collapses punctuation so 'Amélie!' matches 'amelie'."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return _NON_ALNUM.sub(' ', stripped.casefold()).strip()
+
+
+class TitleIndex:
+    """In-memory prefix index over movie titles for autocomplete.
+
+    Each title is stored once per word start, so 'dark kn' finds 'The Dark
+    Knight'. Keys live in a sorted array searched with bisect; the top-k most
+    popular matches for every prefix up to `precomputed_depth` characters are
+    kept ready, since short prefixes match the largest ranges.
+    """
+
+    def __init__(self, top_k=10, precomputed_depth=4):
+        self.top_k = top_k
+        self.precomputed_depth = precomputed_depth
+        self._keys = []       # sorted (key, movie_id) pairs
+        self._movies = {}     # movie_id -> (title, popularity)
+        self._top = {}        # short prefix -> movie IDs ordered by popularity
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._movies)
+
+    def add(self, movies):
+        """Adds or updates movies given as TMDB-shaped dicts."""
+        movies = [movie for movie in movies if movie.get('id') and movie.get('title')]
+        with self._lock:
+            changed = [movie for movie in movies if self._movies.get(movie['id']) != self._entry(movie)]
+            if not changed:
+                return
+            stale = {movie['id'] for movie in changed if movie['id'] in self._movies}
+            # Short prefixes that lost a movie are refilled from the keys below,
+            # since movies pushed out of them earlier may now belong back in
+            shortened = []
+            if stale:
+                self._keys = [pair for pair in self._keys if pair[1] not in stale]
+                for prefix, ids in self._top.items():
+                    kept = [movie_id for movie_id in ids if movie_id not in stale]
+                    if len(kept) < len(ids):
+                        shortened.append(prefix)
+                    ids[:] = kept
+
+            new_keys = []
+            for movie in changed:
+                self._movies[movie['id']] = self._entry(movie)
+                new_keys.extend((key, movie['id']) for key in self._title_keys(movie['title']))
+
+            # Bulk loads re-sort once; small refreshes insert in place
+            if len(new_keys) > 64:
+                self._keys.extend(new_keys)
+                self._keys.sort()
+            else:
+                for pair in new_keys:
+                    insort(self._keys, pair)
+
+            for prefix in shortened:
+                self._top[prefix] = self._ranked(prefix, self.top_k)
+            for key, movie_id in new_keys:
+                for length in range(1, min(len(key), self.precomputed_depth) + 1):
+                    self._offer(key[:length], movie_id)
+
+    def search(self, query, limit=None):
+        """Returns up to `limit` `(movie_id, title)` pairs matching a prefix, most popular first."""
+        limit = limit or self.top_k
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        with self._lock:
+            if len(prefix) <= self.precomputed_depth:
+                ids = self._top.get(prefix, [])[:limit]
+            else:
+                ids = self._ranked(prefix, limit)
+            return [(movie_id, self._movies[movie_id][0]) for movie_id in ids]
+
+    def _ranked(self, prefix, limit):
+        # Scans the prefix's bisect range of the sorted keys
+        start = bisect_left(self._keys, (prefix,))
+        end = bisect_left(self._keys, (prefix + _MAX_CHAR,))
+        candidates = {movie_id for _, movie_id in self._keys[start:end]}
+        return heapq.nlargest(limit, candidates, key=self._popularity)
+
+    def _offer(self, prefix, movie_id):
+        ids = self._top.setdefault(prefix, [])
+        if movie_id in ids:
+            return
+        if len(ids) >= self.top_k and self._popularity(movie_id) <= self._popularity(ids[-1]):
+            return
+        ids.append(movie_id)
+        ids.sort(key=self._popularity, reverse=True)
+        del ids[self.top_k:]
+
+    def _popularity(self, movie_id):
+        return self._movies[movie_id][1]
+
+    @staticmethod
+    def _entry(movie):
+        return movie['title'], float(movie.get('popularity') or movie.get('vote_count') or 0)
+
+    @staticmethod
+    def _title_keys(title):
+        words = normalize(title).split()
+        return {' '.join(words[i:]) for i in range(len(words))}
+
+
+class Autocompleter:
+    """Answers autocomplete queries from a `TitleIndex`, falling back upstream for uncovered prefixes.
+
+    `load_changes(since)` returns catalog movies updated since a timestamp
+    (all movies when `since` is None) and is polled every `refresh_interval`
+    seconds. `search_upstream(query)` returns `(movies, complete)` where
+    `complete` means the upstream returned every match for the query.
+    """
+
+    def __init__(self, load_changes, search_upstream, top_k=10, refresh_interval=300, coverage_ttl=3600):
+        self.index = TitleIndex(top_k=top_k)
+        self.load_changes = load_changes
+        self.search_upstream = search_upstream
+        self.refresh_interval = refresh_interval
+        self.coverage_ttl = coverage_ttl
+        self._refreshed_at = None
+        self._covered = {}   # prefix -> (expires_at, complete)
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Adds catalog movies changed since the last refresh to the index."""
+        with self._lock:
+            since, now = self._refreshed_at, time.time()
+            self.index.add(self.load_changes(since))
+            self._refreshed_at = now
+
+    def suggest(self, query, limit=None):
+        limit = limit or self.index.top_k
+        if self._refreshed_at is None or time.time() - self._refreshed_at > self.refresh_interval:
+            self.refresh()
+
+        results = self.index.search(query, limit)
+        prefix = normalize(query)
+        if len(results) < limit and prefix and not self._is_covered(prefix):
+            movies, complete = self.search_upstream(query)
+            self.index.add(movies)
+            self._mark_covered(prefix, complete)
+            results = self.index.search(query, limit)
+        return results
+
+    def _mark_covered(self, prefix, complete):
+        now = time.time()
+        if len(self._covered) > 10000:
+            self._covered = {key: entry for key, entry in self._covered.items() if entry[0] > now}
+        self._covered[prefix] = (now + self.coverage_ttl, complete)
+
+    def _is_covered(self, prefix):
+        # A prefix is covered if it was asked upstream recently, or if a shorter
+        # prefix was and the upstream returned every match for it
+        now = time.time()
+        for length in range(len(prefix), 0, -1):
+            entry = self._covered.get(prefix[:length])
+            if entry and entry[0] > now and (length == len(prefix) or entry[1]):
+                return True
+        return False
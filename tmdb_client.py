@@ -0,0 +1,173 @@
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+import instrumentation
+
+# TMDB API Key (Use environment variable for security)
+API_KEY = os.environ.get('TMDB_API_KEY', '9ba93d1cf5e3054788a377f636ea1033')
+TMDB_BASE_URL = os.environ.get('TMDB_BASE_URL', 'https://api.themoviedb.org/3')
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Client-side rate limiter allowing `rate` calls per second with bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class TMDBClient:
+    """Shared TMDB client with a pooled keep-alive session, timeouts, retries and rate limiting.
+
+    Every call waits on a token bucket so the process stays under its share
+    of TMDB's rate limit, and 429/5xx responses or connection errors are
+    retried with jittered exponential backoff, honouring `Retry-After`. A
+    `Retry-After` longer than `max_delay` (by default the largest backoff)
+    ends the retries instead, so no request thread sleeps for minutes.
+    """
+
+    def __init__(self, base_url=TMDB_BASE_URL, api_key=API_KEY, timeout=(3.05, 10), max_retries=3,
+                 backoff=0.5, rate_limit=40, pool_size=32, max_delay=None):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_delay = max_delay if max_delay is not None else backoff * 2 ** max(max_retries - 1, 0)
+        self.pool_size = pool_size
+        self.bucket = TokenBucket(rate_limit)
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+        self._metrics = defaultdict(lambda: {'calls': 0, 'errors': 0, 'retries': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+        self._metrics_lock = threading.Lock()
+
+    @property
+    def session(self):
+        # Pre-fork servers copy the parent's session; give each worker its own pool
+        if self._session is None or self._session_pid != os.getpid():
+            with self._session_lock:
+                if self._session is None or self._session_pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session, self._session_pid = session, os.getpid()
+        return self._session
+
+    def get(self, path, **params):
+        """Performs a GET against a TMDB path and returns the response, or None if every attempt failed."""
+        params = {'api_key': self.api_key, **params}
+        endpoint = endpoint_name(path)
+        response = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                delay = self._retry_delay(attempt, response)
+                if delay is None:
+                    logger.warning("TMDB %s asked to retry after more than %ss; giving up", endpoint, self.max_delay)
+                    break
+                self._record(endpoint, 'retries')
+                time.sleep(delay)
+            self.bucket.acquire()
+            start = time.perf_counter()
+            try:
+                with instrumentation.span(f'tmdb.{endpoint}'):
+                    response = self.session.get(f'{self.base_url}{path}', params=params, timeout=self.timeout)
+            except requests.RequestException as e:
+                self._record(endpoint, 'calls', time.perf_counter() - start)
+                self._record(endpoint, 'errors')
+                logger.warning("TMDB %s failed: %s", endpoint, e)
+                response = None
+                continue
+            self._record(endpoint, 'calls', time.perf_counter() - start)
+            if response.status_code not in RETRY_STATUSES:
+                return response
+            self._record(endpoint, 'errors')
+        return response
+
+    def get_json(self, path, **params):
+        """Performs a GET and returns the decoded JSON body, or None on any failure."""
+        response = self.get(path, **params)
+        if response is not None and response.status_code == 200:
+            return response.json()
+        return None
+
+    def _retry_delay(self, attempt, response):
+        # Seconds to wait before the next attempt, or None if the server asks for longer than max_delay
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            delay = self._parse_retry_after(retry_after)
+            if delay is not None:
+                return max(delay, 0.0) if delay <= self.max_delay else None
+        # Full jitter: uniform between zero and the exponential backoff ceiling
+        return random.uniform(0, min(self.backoff * 2 ** (attempt - 1), self.max_delay))
+
+    @staticmethod
+    def _parse_retry_after(value):
+        # Retry-After is either delta-seconds or an HTTP-date
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        try:
+            return parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+
+    def _record(self, endpoint, name, seconds=None):
+        with self._metrics_lock:
+            metrics = self._metrics[endpoint]
+            metrics[name] += 1
+            if seconds is not None:
+                metrics['total_seconds'] += seconds
+                metrics['max_seconds'] = max(metrics['max_seconds'], seconds)
+
+    def metrics(self):
+        """Returns per-endpoint attempt, error and retry counts with mean and max latency."""
+        with self._metrics_lock:
+            result = {}
+            for endpoint, metrics in self._metrics.items():
+                calls = metrics['calls']
+                result[endpoint] = dict(metrics, mean_seconds=round(metrics['total_seconds'] / calls, 4) if calls else 0.0)
+            return result
+
+
+def endpoint_name(path):
+    """Collapses IDs in a TMDB path so metrics group by endpoint, e.g. '/movie/{id}'."""
+    return re.sub(r'/\d+', '/{id}', path)
+
+
+# Shared client; each worker process gets its own connection pool. The rate
+# limit is TMDB's per-IP budget divided across the worker processes.
+client = TMDBClient(
+    rate_limit=float(os.environ.get('TMDB_RATE_LIMIT', 40)) / int(os.environ.get('TMDB_WORKER_PROCESSES', 1)),
+    pool_size=int(os.environ.get('TMDB_POOL_SIZE', 32))
+)
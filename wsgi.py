@@ -0,0 +1,27 @@
+# wsgi.py
+"""WSGI entry point for production servers.
+
+Create or upgrade the database tables first, once per deployment:
+
+    python initialize_db.py
+
+then run under gunicorn with the settings in gunicorn.conf.py:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+or as a single gevent process without gunicorn:
+
+    python wsgi.py
+"""
+if __name__ == '__main__':
+    # Patch blocking I/O before anything else imports socket, ssl or threading
+    from gevent import monkey
+    monkey.patch_all()
+
+import os
+from app import app
+
+if __name__ == '__main__':
+    from gevent.pywsgi import WSGIServer
+    host, port = os.environ.get('BIND', '0.0.0.0:5004').rsplit(':', 1)
+    WSGIServer((host, int(port)), app).serve_forever()